@@ -0,0 +1,201 @@
+"""
+Check of the multi-category listing crawl (scrape.merge_categories over acrawl_new_job_urls, listing.parse_category).
+
+A stand-in for the listing fetcher serves sort=new listings of generated postings (50 per page, --latency seconds per
+page, at most --window pages in flight as the real listing fetcher). Each category lists --old postings already stored
+and its share of the --new new ones, newest first; a part of them (--overlap) is also listed in the next category.
+- every new posting is yielded once, also those listed in two categories, and nothing stored or older than the
+  category's own watermark
+- the listing pages fetched follow the number of new postings: the same new postings spread over 2 or 8 categories
+  cost about one more page per category, not categories x max_page
+- the categories are paged concurrently: with many short listings the pages of several categories are in flight at
+  once, up to the window, and the crawl takes less time than paging them one after another (a long listing already
+  keeps the window busy by reading ahead). The gain is bounded by the parsing of the listing pages, which runs on the
+  event loop: the same crawl without latency is reported as that floor. With the defaults the concurrent crawl of
+  8 categories keeps the window full and takes about that floor, 0.5-0.75x the time of paging them one by one
+- the default listing url is the one the IT crawl always used
+
+usage: python topcv/benchmarks/category_crawl.py [--new N] [--old N] [--overlap 0.2] [--latency 0.02] [--window 4] [--parser lxml]
+exits with status 1 if a check fails
+"""
+import argparse
+import asyncio
+import math
+import random
+import re
+import time
+from datetime import datetime, timedelta
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+TOPCV_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if TOPCV_DIR not in sys.path:
+    sys.path.insert(0, TOPCV_DIR)
+
+import scrape
+from classes.listing import category_key, listing_url
+from classes.utils import job_id
+
+IT_LISTING_URL = "https://www.topcv.vn/tim-viec-lam-cong-nghe-thong-tin-cr257?sort=new&type_keyword=1&page=1&category_family=r257"
+PAGE_SIZE = 50
+LISTING_URL = re.compile(r'-(cr\d+)\?.*page=(\d+)')
+BOX = ('<div class="job-item-search-result" data-box="BoxSearchResult"><h3 class="title"><a href="{url}">job</a></h3>'
+       '<label class="address mobile-hidden label-update">{label}<span> | Còn <strong>9</strong> ngày</span></label></div>')
+
+
+class ListingStandIn:
+    """
+    stands in for the listing fetcher: the generated sort=new listing of the url's category, counting the pages served
+    """
+
+    def __init__(self, listings, latency, window):
+        self.listings = listings
+        self.latency = latency
+        self.slots = asyncio.Semaphore(window)
+        self.pages = 0
+        # pages in flight per category, the most pages and categories seen in flight at once
+        self.in_flight = {}
+        self.peak_pages = self.peak_categories = 0
+
+    async def fetch(self, url, track=True, defer=False):
+        category, page = LISTING_URL.search(url).groups()
+        async with self.slots:
+            self.in_flight[category] = self.in_flight.get(category, 0) + 1
+            self.peak_pages = max(self.peak_pages, sum(self.in_flight.values()))
+            self.peak_categories = max(self.peak_categories, sum(1 for count in self.in_flight.values() if count))
+            try:
+                await asyncio.sleep(self.latency)
+            finally:
+                # pages read ahead of a stop are cancelled
+                self.in_flight[category] -= 1
+            self.pages += 1
+        postings = self.listings[category][(int(page) - 1) * PAGE_SIZE:int(page) * PAGE_SIZE]
+        return '<html><body>' + ''.join(BOX.format(url=posting_url(number), label=f'{hours} giờ trước')
+                                        for number, hours in postings) + '</body></html>'
+
+
+def posting_url(number):
+    return f'https://www.topcv.vn/viec-lam/job/{number}.html'
+
+def categories_of(count):
+    return [f'tim-viec-lam-category-{i}-cr{1000 + i}' for i in range(count)]
+
+def make_listings(categories, new, old, overlap, rng):
+    """
+    {category key: [(job number, hours since updated)] newest first}, the job numbers of the stored postings,
+    the new postings of each category: 1-23 hours old, the stored ones 30+ hours
+    """
+    listings, number = {}, 1000000
+    new_per_category = new // len(categories)
+    for category in categories:
+        postings = []
+        for _ in range(new_per_category):
+            postings.append((number, rng.randint(1, 23)))
+            number += 1
+        for _ in range(old):
+            postings.append((number, rng.randint(30, 2000)))
+            number += 1
+        listings[category_key(category)] = postings
+    known = {str(n) for postings in listings.values() for n, hours in postings if hours >= 30}
+    # part of each category's new postings is listed in the next category too
+    keys = list(listings)
+    for key, next_key in zip(keys, keys[1:] + keys[:1]):
+        shared = [posting for posting in listings[key] if posting[1] < 30][:int(new_per_category * overlap)]
+        listings[next_key] = sorted(listings[next_key] + shared, key=lambda posting: posting[1])
+    for key in keys:
+        listings[key].sort(key=lambda posting: posting[1])
+    return listings, known
+
+def expected_new(listings, known, watermarks, now):
+    expected = set()
+    for key, postings in listings.items():
+        watermark = watermarks.get(key)
+        for number, hours in postings:
+            if str(number) not in known and (watermark is None or now - timedelta(hours=hours) >= watermark):
+                expected.add(str(number))
+    return expected
+
+async def crawl(categories, listings, known, watermarks, args, now, concurrent=True):
+    fetcher = ListingStandIn(listings, args.latency, args.window)
+
+    def category_crawl(category, seen):
+        return scrape.acrawl_new_job_urls(known, watermarks.get(category_key(category)), args.max_page, fetcher,
+                                          args.parser, args.window, now, category, seen)
+
+    start = time.perf_counter()
+    if concurrent:
+        urls = await scrape.collect(scrape.merge_categories(categories, category_crawl))
+    else:
+        seen, urls = set(), []
+        for category in categories:
+            urls += await scrape.collect(category_crawl(category, seen))
+    return urls, fetcher, time.perf_counter() - start
+
+def run(categories, args, rng, watermarks=None, concurrent=True):
+    now = datetime.utcnow()
+    listings, known = make_listings(categories, args.new, args.old, args.overlap, rng)
+    watermarks = watermarks or {}
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        urls, fetcher, elapsed = asyncio.run(crawl(categories, listings, known, watermarks, args, now, concurrent))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    ids = [job_id(url) for url in urls]
+    # pages holding new postings, plus the page each category stops at
+    needed = sum(math.ceil(len(expected_new({key: postings}, known, watermarks, now)) / PAGE_SIZE) + 1
+                 for key, postings in listings.items())
+    return {
+        'ids': ids, 'expected': expected_new(listings, known, watermarks, now), 'pages': fetcher.pages, 'needed': needed,
+        'elapsed': elapsed, 'peak_pages': fetcher.peak_pages, 'peak_categories': fetcher.peak_categories,
+    }
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--new', type=int, default=800, help="new postings over all the categories")
+    arg_parser.add_argument('--old', type=int, default=2000, help="stored postings listed in each category")
+    arg_parser.add_argument('--overlap', type=float, default=0.2, help="share of a category's new postings also listed in the next one")
+    arg_parser.add_argument('--latency', type=float, default=0.02, help="seconds per listing page")
+    arg_parser.add_argument('--window', type=int, default=4)
+    arg_parser.add_argument('--max-page', type=int, default=50)
+    arg_parser.add_argument('--parser', default='lxml')
+    args = arg_parser.parse_args()
+
+    print(f"{args.new} new postings, {args.old} stored per category, {args.overlap:.0%} listed twice, window {args.window}")
+    print(f"{'categories':<12}{'mode':<12}{'urls':>8}{'pages':>8}{'needed':>8}{'max_page x n':>14}{'seconds':>10}")
+    results = {}
+    for count in (2, 8):
+        for concurrent in (True, False):
+            result = run(categories_of(count), args, random.Random(count), concurrent=concurrent)
+            results[count, concurrent] = result
+            print(f"{count:<12}{'concurrent' if concurrent else 'one by one':<12}{len(result['ids']):>8}{result['pages']:>8}"
+                  f"{result['needed']:>8}{args.max_page * count:>14}{result['elapsed']:>10.2f}")
+
+    # what is left without waiting for pages: parsing them
+    floor = run(categories_of(8), argparse.Namespace(**dict(vars(args), latency=0)), random.Random(8))['elapsed']
+    concurrent, one_by_one = results[8, True], results[8, False]
+    print(f"8 categories: concurrent {concurrent['elapsed'] / one_by_one['elapsed']:.2f}x the time of one by one, "
+          f"{concurrent['peak_pages']} pages of {concurrent['peak_categories']} categories in flight at most, "
+          f"parsing alone {floor:.2f}s")
+
+    # the first category was crawled 5 hours ago, the others never
+    categories = categories_of(4)
+    watermarks = {category_key(categories[0]): datetime.utcnow() - timedelta(hours=5)}
+    watermarked = run(categories, args, random.Random(4), watermarks)
+
+    window_waste = args.window - 1
+    checks = {
+        'default listing url unchanged': listing_url(1) == IT_LISTING_URL,
+        'every new posting once': all(len(r['ids']) == len(set(r['ids'])) and set(r['ids']) == r['expected'] for r in results.values()),
+        "nothing older than the category's watermark": set(watermarked['ids']) == watermarked['expected'],
+        'pages follow the new postings, not the categories': all(
+            r['pages'] <= r['needed'] + count * window_waste for (count, _), r in results.items()),
+        'categories paged concurrently': concurrent['peak_pages'] == args.window and concurrent['peak_categories'] > 1
+            and one_by_one['peak_categories'] == 1 and concurrent['elapsed'] < one_by_one['elapsed'],
+    }
+    for name, ok in checks.items():
+        print(f"{'ok' if ok else 'FAILED':>6}  {name}")
+    sys.exit(0 if all(checks.values()) else 1)
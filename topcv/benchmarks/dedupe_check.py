@@ -0,0 +1,133 @@
+"""
+Check of the near-duplicate detection (classes/dedupe.py) and the canonical job ids (classes/utils.py).
+
+Stored jobs are the postings of data/normaljobs.json and the saved pages in fixtures/, repeated to --jobs jobs, each copy
+under its own job number and company so only a job and its own reposts are alike. Then come:
+- reposts: a stored job under a new job number with a few words of its description changed (--edit of them)
+- lookalikes: a stored job moved to another city, or the same text under another company: different jobs
+Reports how many reposts are merged (recall) and lookalikes merged by mistake, and the checks/sec of the LSH index
+against comparing every new job with every stored one.
+
+usage: python topcv/benchmarks/dedupe_check.py [--jobs N] [--reposts N] [--edit 0.01]
+exits with status 1 if a check fails
+"""
+import argparse
+import json
+import random
+import time
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+TOPCV_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_DIR = os.path.join(TOPCV_DIR, 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parser_backends import PAGES, load_fixture
+from dedupe import MAX_DISTANCE, DuplicateIndex, dedupe_key, distance, fingerprint
+from records import flatten
+from utils import job_id
+
+SAME_POSTING = [
+    ('https://www.topcv.vn/viec-lam/nhan-vien-phat-trien-doi-tac/1928082.html?ta_source=JobSearchList_LinkDetail',
+     'https://www.topcv.vn/brand/congtycophanmisa/tuyen-dung/nhan-vien-phat-trien-doi-tac-j1928082.html?u_sr_id=abc'),
+]
+
+
+def sample_docs():
+    with open(os.path.join(TOPCV_DIR, 'data', 'normaljobs.json'), encoding='utf-8') as f:
+        docs = [dict(doc, _id=str(i), url=f'https://www.topcv.vn/viec-lam/job/{i}.html') for i, doc in enumerate(json.load(f))]
+    docs += [scraper_class(url, parser='lxml').scrape(load_fixture(name)) for name, (scraper_class, url) in PAGES.items()]
+    # fixtures/normal_job.html is one of the postings of normaljobs.json: keep one of them
+    unique = {}
+    for doc in map(flatten, docs):
+        unique.setdefault((dedupe_key(doc), fingerprint(doc)), doc)
+    return list(unique.values())
+
+def posting(doc, number, **changes):
+    """flat document of another posting: new job number, fields changed, fingerprint recomputed"""
+    doc = dict(doc, **changes)
+    doc['url'] = f'https://www.topcv.vn/viec-lam/job/{number}.html'
+    doc['_id'] = job_id(doc['url'])
+    doc.pop('simhash', None)
+    doc['simhash'] = fingerprint(doc)
+    return doc
+
+def edited(text, share, rng):
+    words = (text or '').split()
+    for _ in range(max(1, int(len(words) * share))):
+        if words:
+            words[rng.randrange(len(words))] = rng.choice(['nhanh', 'tốt', 'mới', 'gấp'])
+    return ' '.join(words)
+
+def brute_force(stored, new_docs):
+    # every new job against every stored one: what the index saves
+    found = 0
+    for doc in new_docs:
+        value, key = int(doc['simhash'], 16), dedupe_key(doc)
+        for other in stored:
+            if dedupe_key(other) == key and distance(value, int(other['simhash'], 16)) <= MAX_DISTANCE:
+                found += 1
+                break
+    return found
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--jobs', type=int, default=20000)
+    arg_parser.add_argument('--reposts', type=int, default=500)
+    arg_parser.add_argument('--edit', type=float, default=0.01, help="share of the description words changed in a repost")
+    args = arg_parser.parse_args()
+    rng = random.Random(0)
+
+    samples = sample_docs()
+    start = time.perf_counter()
+    stored = []
+    for i in range(args.jobs):
+        doc = samples[i % len(samples)]
+        company = dict(doc.get('company') or {}, name=f"{(doc.get('company') or {}).get('name')} {i // len(samples)}")
+        stored.append(posting(doc, 3000000 + i, company=company))
+    fingerprint_rate = args.jobs / (time.perf_counter() - start)
+
+    reposts, lookalikes = [], []
+    for i, doc in enumerate(rng.sample(stored, args.reposts)):
+        reposts.append((doc['_id'], posting(doc, 4000000 + i, description=edited(doc.get('description'), args.edit, rng))))
+        other = dict(doc.get('company') or {}, name=f'Another company {i}')
+        lookalikes.append(posting(doc, 5000000 + i, location='Cần Thơ' if doc.get('location') != 'Cần Thơ' else 'Huế'))
+        lookalikes.append(posting(doc, 6000000 + i, company=other))
+
+    index = DuplicateIndex()
+    start = time.perf_counter()
+    merged_into_stored = sum(index.check(doc) is not None for doc in stored)
+    build_s = time.perf_counter() - start
+
+    new_docs = [doc for _, doc in reposts] + lookalikes
+    start = time.perf_counter()
+    # find() only: the new jobs are compared with the stored ones, not with each other
+    found = {doc['_id']: index.find(int(doc['simhash'], 16), dedupe_key(doc)) for doc in new_docs}
+    check_s = time.perf_counter() - start
+    start = time.perf_counter()
+    brute_found = brute_force(stored, new_docs)
+    brute_s = time.perf_counter() - start
+
+    recall = sum(found[doc['_id']] == original for original, doc in reposts)
+    false_merges = sum(found[doc['_id']] is not None for doc in lookalikes)
+    print(f"{args.jobs} stored jobs, {len(reposts)} reposts ({args.edit:.0%} of the words changed), {len(lookalikes)} lookalikes")
+    print(f"fingerprints: {fingerprint_rate:.0f} jobs/sec, index {index.stats()}")
+    print(f"reposts merged into their original: {recall}/{len(reposts)}, lookalikes merged: {false_merges}/{len(lookalikes)}")
+    print(f"{'checks/sec':<34}{'rate':>12}")
+    print(f"{'LSH index (build)':<34}{args.jobs / build_s:>12.0f}")
+    print(f"{'LSH index (find)':<34}{len(new_docs) / check_s:>12.0f}")
+    print(f"{'every stored job':<34}{len(new_docs) / brute_s:>12.0f}")
+
+    checks = {
+        'one id for the /viec-lam/ and /brand/ urls of a posting': all(job_id(a) == job_id(b) for a, b in SAME_POSTING),
+        'distinct stored jobs are not merged': merged_into_stored == 0,
+        'the index finds what a full comparison finds': brute_found == sum(value is not None for value in found.values()),
+        'no lookalike merged': false_merges == 0,
+        'most reposts merged': recall >= 0.9 * len(reposts),
+    }
+    for name, ok in checks.items():
+        print(f"{'ok' if ok else 'FAILED':>6}  {name}")
+    sys.exit(0 if all(checks.values()) else 1)
@@ -0,0 +1,93 @@
+"""
+Check of the compiled extraction specs (the scrapers' SPEC, see classes/extractor.py) over the saved pages in fixtures/.
+
+fixtures/expected_extract.json holds what each extract_* method returned for each page with the find() chains the
+specs replace. Every parser backend, with subtree parsing on and off, must give the same values in the same key
+order. A layout change (a class renamed on the page) must fail the page with LookupError as the find() chains did,
+not give a partial record. Reports the time of the walk collecting the nodes and of building the parts, per page.
+
+usage: python topcv/benchmarks/extraction_specs.py [--repeat N]
+exits with status 1 if a check fails
+"""
+import argparse
+import json
+import time
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parser_backends import FIXTURES_DIR, PAGES, available_parsers, load_fixture
+from suite import extract_methods
+
+# a class each page cannot do without, renamed to simulate a layout change
+LAYOUT_CHANGES = {
+    'normal_job.html': 'company-value',
+    'premium_job.html': 'basic-information-item__data--value',
+    'brand_job.html': 'footer-info-company-name',
+}
+
+
+def extracted(scraper_class, url, html, parser, subtree_only=True):
+    scraper = scraper_class(url, parser=parser, subtree_only=subtree_only)
+    scraper.load(html)
+    # json text: tuples as lists, key order kept
+    return json.dumps({method: getattr(scraper, method)() for method in extract_methods(scraper_class)}, ensure_ascii=False)
+
+def fails_on_layout_change(scraper_class, url, html, parser, class_):
+    try:
+        extracted(scraper_class, url, html.replace(class_, class_ + '-renamed'), parser)
+    except LookupError:
+        return True
+    return False
+
+def time_page(scraper_class, url, html, parser, repeat):
+    scraper = scraper_class(url, parser=parser)
+    scraper.load(html)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        collected = scraper.EXTRACTOR.collect(scraper.soup)
+    collect_s = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for part in scraper.EXTRACTOR.parts:
+            scraper.EXTRACTOR.build(part, collected)
+    return collect_s, (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--repeat', type=int, default=200)
+    args = arg_parser.parse_args()
+
+    with open(os.path.join(FIXTURES_DIR, 'expected_extract.json'), encoding='utf-8') as f:
+        expected = {name: json.dumps(values, ensure_ascii=False) for name, values in json.load(f).items()}
+
+    parsers = available_parsers()
+    mismatches, silent = [], []
+    print(f"{'page':<20}{'parser':<14}{'collect ms':>12}{'build ms':>10}")
+    for name, (scraper_class, url) in PAGES.items():
+        html = load_fixture(name)
+        for parser in parsers:
+            for subtree_only in (True, False):
+                if extracted(scraper_class, url, html, parser, subtree_only) != expected[name]:
+                    mismatches.append(f"{name} [{parser}, subtree_only={subtree_only}]")
+            if not fails_on_layout_change(scraper_class, url, html, parser, LAYOUT_CHANGES[name]):
+                silent.append(f"{name} [{parser}]")
+            collect_s, build_s = time_page(scraper_class, url, html, parser, args.repeat)
+            print(f"{name:<20}{parser:<14}{collect_s * 1000:>12.3f}{build_s * 1000:>10.3f}")
+
+    for mismatch in mismatches:
+        print(f"MISMATCH {mismatch}")
+    for page in silent:
+        print(f"NO ERROR on a layout change: {page}")
+    checks = {
+        'same values as the find() chains with every parser': not mismatches,
+        'layout changes fail the page': not silent,
+    }
+    for name, ok in checks.items():
+        print(f"{'ok' if ok else 'FAILED':>6}  {name}")
+    sys.exit(0 if all(checks.values()) else 1)
@@ -0,0 +1,232 @@
+"""
+Check of the leased url frontier (classes/frontier.py) on its SQLite backend, in a temporary directory.
+
+- urls are queued once per job id, in priority then listing order, and adding them again changes nothing
+- --procs worker processes lease batches from one file while one more worker is killed right after its first lease:
+  every url must end done, no url may be held by two workers at once, and the killed worker's batch is taken
+  over once its lease runs out
+- a page whose lease runs out MAX_ATTEMPTS times (it kills every worker) ends failed instead of going round forever
+- scrape.main() through a FrontierFeed, killed after --crash-after records: the rerun on the same queue scrapes only
+  what was not acknowledged, and every job ends up in the sink
+Reports the leases/sec of one worker for a few batch sizes.
+
+usage: python topcv/benchmarks/frontier_check.py [--urls N] [--procs 4] [--crash-after 25]
+exits with status 1 if a check fails
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import shutil
+import tempfile
+import time
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+TOPCV_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if TOPCV_DIR not in sys.path:
+    sys.path.insert(0, TOPCV_DIR)
+
+import scrape
+from parser_backends import PAGES, load_fixture
+from classes.frontier import DONE, FAILED, LEASED, FrontierFeed, SqliteFrontier
+from classes.sinks import JsonlSink
+from classes.utils import job_id, job_number
+
+SAME_POSTING = [
+    'https://www.topcv.vn/viec-lam/nhan-vien-phat-trien-doi-tac/1928082.html?ta_source=JobSearchList_LinkDetail',
+    'https://www.topcv.vn/brand/congtycophanmisa/tuyen-dung/nhan-vien-phat-trien-doi-tac-j1928082.html?u_sr_id=abc',
+]
+
+
+def job_urls(count, first=3000000):
+    """count urls of distinct postings, cycling over the page types of the saved pages"""
+    base = [url for _, url in PAGES.values()]
+    return [base[i % len(base)].replace(job_number(base[i % len(base)]), str(first + i)) for i in range(count)]
+
+
+class NumberedFixtureFetcher:
+    """
+    stands in for AsyncFetcher: the saved page of the url's type, whatever its job number
+    """
+
+    retries = None
+
+    def __init__(self, max_in_flight=8):
+        self.max_in_flight = max_in_flight
+        self.pages = [(url.split(job_number(url))[0], load_fixture(name)) for name, (_, url) in PAGES.items()]
+
+    async def fetch(self, url, track=True, defer=False):
+        for prefix, html in self.pages:
+            if url.startswith(prefix):
+                return html
+        return None
+
+    def confirm(self, url):
+        pass
+
+
+class CrashingSink(JsonlSink):
+    """
+    JsonlSink killing the process after `crash_after` records, as a worker dying mid-crawl
+    """
+
+    def __init__(self, path, crash_after=None):
+        super().__init__(path)
+        self.crash_after = crash_after
+
+    def write(self, record):
+        super().write(record)
+        if self.crash_after is not None and self.written >= self.crash_after:
+            self.file.flush()
+            os._exit(1)
+
+
+def lease_worker(path, worker, log_path, batch_size, lease_s, die=False):
+    """
+    lease until no url is pending or leased (polling as FrontierFeed does with poll_s), log (url, leased at, done at)
+    per url; die: exit after the first lease
+    """
+    frontier = SqliteFrontier(path, queue='check')
+    with open(log_path, 'a', encoding='utf-8') as log:
+        while True:
+            batch = frontier.lease(worker, batch_size, lease_s)
+            if not batch:
+                if not frontier.counts()[LEASED]:
+                    return
+                time.sleep(lease_s / 4)
+                continue
+            leased_at = time.time()
+            if die:
+                os._exit(1)
+            time.sleep(0.002 * len(batch))
+            log.write(''.join(json.dumps([url, worker, leased_at, time.time()]) + '\n' for url in batch))
+            log.flush()
+            frontier.done(batch)
+
+def scrape_worker(path, sink_path, crash_after, batch_size):
+    frontier = SqliteFrontier(path, queue='scrape')
+    frontier.release()
+    sink = CrashingSink(sink_path, crash_after)
+    feed = FrontierFeed(frontier, batch_size=batch_size, flush=lambda: scrape.flush_sinks([sink]))
+    sys.stdout = open(os.devnull, 'w')
+    asyncio.run(scrape.main(feed.urls(), NumberedFixtureFetcher(), 'lxml', sinks=[sink], frontier=feed))
+    sink.close()
+    frontier.close()
+
+def run(target, *args):
+    process = multiprocessing.Process(target=target, args=args)
+    process.start()
+    return process
+
+
+def check_queueing(path):
+    frontier = SqliteFrontier(path, queue='queueing')
+    added = frontier.add(SAME_POSTING + job_urls(5))
+    added_again = frontier.add(job_urls(5))
+    frontier.add(job_urls(2, first=4000000), priority=1)
+    order = [job_id(url) for url in frontier.lease('w', 10)]
+    expected = [job_id(url) for url in job_urls(2, first=4000000) + SAME_POSTING[:1] + job_urls(5)]
+    return added == 6 and added_again == 0 and order == expected
+
+def check_workers(path, tmp, urls, procs, batch_size, lease_s):
+    frontier = SqliteFrontier(path, queue='check')
+    frontier.add(urls)
+    log_path = os.path.join(tmp, 'leases.jsonl')
+    start = time.perf_counter()
+    dead = run(lease_worker, path, 'dead', log_path, batch_size, lease_s, True)
+    dead.join()
+    workers = [run(lease_worker, path, f'worker-{i}', log_path, batch_size, lease_s) for i in range(procs)]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    with open(log_path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    by_url = {}
+    for url, worker, leased_at, done_at in entries:
+        by_url.setdefault(url, []).append((leased_at, done_at, worker))
+    overlapping = [url for url, spans in by_url.items() if len(spans) > 1]
+    counts = frontier.counts()
+    print(f"{len(urls)} urls, {procs} workers + 1 killed: {len(entries)} leases logged in {elapsed:.2f}s, frontier {counts}")
+    return {
+        'every url done by the workers': counts[DONE] == len(urls) and set(by_url) == set(urls),
+        'no url held by two workers': not overlapping,
+        "the killed worker's batch taken over after its lease": elapsed >= lease_s,
+    }
+
+def check_poison(path, lease_s):
+    frontier = SqliteFrontier(path, queue='poison', max_attempts=3)
+    frontier.add(job_urls(1))
+    for attempt in range(4):
+        frontier.lease(f'victim-{attempt}', 1, lease_s)
+        time.sleep(lease_s * 1.1)
+    frontier.lease('survivor', 1, lease_s)
+    failed = frontier.failed()
+    return frontier.counts()[FAILED] == 1 and failed[0]['attempts'] == 3 and failed[0]['error'] == 'lease expired'
+
+def check_resume(path, tmp, count, crash_after, batch_size):
+    frontier = SqliteFrontier(path, queue='scrape')
+    urls = job_urls(count, first=5000000)
+    frontier.add(urls)
+    sink_path = os.path.join(tmp, 'records.jsonl')
+    crashed = run(scrape_worker, path, sink_path, crash_after, batch_size)
+    crashed.join()
+    done_before = frontier.counts()[DONE]
+    resumed = run(scrape_worker, path, sink_path, None, batch_size)
+    resumed.join()
+
+    with open(sink_path, encoding='utf-8') as f:
+        ids = [json.loads(line)['_id'] for line in f]
+    again = len(ids) - len(set(ids))
+    counts = frontier.counts()
+    print(f"scrape.main killed after {crash_after} records ({done_before} acknowledged), resumed: {len(ids)} records written, "
+          f"{again} scraped twice, frontier {counts}")
+    return {
+        'the crashed run exited with an error': crashed.exitcode == 1,
+        'every job in the sink after the rerun': set(ids) == {job_id(url) for url in urls} and counts[DONE] == len(urls),
+        # only the records written but not acknowledged yet: at most the batches in flight
+        'acknowledged pages not scraped again': again <= crash_after - done_before,
+    }
+
+def lease_rate(path, batch_size, count=2000):
+    frontier = SqliteFrontier(path, queue=f'rate-{batch_size}')
+    frontier.add(job_urls(count))
+    start = time.perf_counter()
+    leased = 0
+    while True:
+        batch = frontier.lease('w', batch_size)
+        if not batch:
+            break
+        frontier.done(batch)
+        leased += len(batch)
+    return leased / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--urls', type=int, default=600)
+    arg_parser.add_argument('--procs', type=int, default=4)
+    arg_parser.add_argument('--batch-size', type=int, default=20)
+    arg_parser.add_argument('--lease-s', type=float, default=1.0, help="lease of the worker checks, short so a killed worker's urls come back quickly")
+    arg_parser.add_argument('--crash-after', type=int, default=25)
+    args = arg_parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'frontier.db')
+        checks = {'queued once per job id, in priority then listing order': check_queueing(path)}
+        checks.update(check_workers(path, tmp, job_urls(args.urls), args.procs, args.batch_size, args.lease_s))
+        checks['a page outliving its attempts ends failed'] = check_poison(path, 0.2)
+        checks.update(check_resume(path, tmp, 60, args.crash_after, 10))
+
+        print(f"{'batch size':<12}{'leases/sec':>12}")
+        for batch_size in (1, 20, 100):
+            print(f"{batch_size:<12}{lease_rate(path, batch_size):>12.0f}")
+    finally:
+        shutil.rmtree(tmp)
+
+    for name, ok in checks.items():
+        print(f"{'ok' if ok else 'FAILED':>6}  {name}")
+    sys.exit(0 if all(checks.values()) else 1)
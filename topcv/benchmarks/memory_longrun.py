@@ -0,0 +1,96 @@
+"""
+Long-run memory check of the streaming crawl: scrape the saved pages in fixtures/ thousands of times
+through scrape.main() into a sink that drops the records, and sample the traced memory along the way.
+Memory must stay flat: the highest of the last 3 samples may not exceed the highest of the first 3 by more than --tolerance.
+
+usage: python topcv/benchmarks/memory_longrun.py [--pages N] [--samples K] [--parser lxml] [--workers 0]
+exits with status 1 if memory grows with the number of pages
+"""
+import argparse
+import asyncio
+import gc
+import resource
+import time
+import tracemalloc
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+TOPCV_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if TOPCV_DIR not in sys.path:
+    sys.path.insert(0, TOPCV_DIR)
+
+import scrape
+from pipeline_scaling import FixtureFetcher
+
+
+class SamplingSink:
+    """
+    drops the records, takes a memory sample every `every` records
+    """
+
+    def __init__(self, every):
+        self.every = every
+        self.written = 0
+        self.samples = []
+
+    def write(self, record):
+        self.written += 1
+        if self.written % self.every == 0:
+            gc.collect()
+            current, _ = tracemalloc.get_traced_memory()
+            rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.samples.append((self.written, current / 1024, rss_kb))
+
+    def close(self):
+        return {'written': self.written}
+
+
+class StreamingFixtureFetcher(FixtureFetcher):
+    retries = None
+
+    def confirm(self, url):
+        pass
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--pages', type=int, default=2000)
+    arg_parser.add_argument('--samples', type=int, default=10)
+    arg_parser.add_argument('--parser', default='lxml')
+    arg_parser.add_argument('--workers', type=int, default=0)
+    arg_parser.add_argument('--tolerance', type=float, default=0.2, help="allowed growth of traced memory from the first samples")
+    args = arg_parser.parse_args()
+
+    fetcher = StreamingFixtureFetcher()
+    sink = SamplingSink(max(1, args.pages // args.samples))
+
+    async def urls():
+        # generated on the fly, like a listing crawl, so the url list itself is not held in memory
+        for url in fetcher.urls(args.pages):
+            yield url
+
+    # the per-page progress lines of scrape.main() would drown the report
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        scraped = asyncio.run(scrape.main(urls(), fetcher, args.parser, args.workers, sinks=[sink]))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    print(f"{'records':>10}{'traced KB':>12}{'max RSS KB':>12}")
+    for written, traced_kb, rss_kb in sink.samples:
+        print(f"{written:>10}{traced_kb:>12.1f}{rss_kb:>12}")
+
+    first = max(traced_kb for _, traced_kb, _ in sink.samples[:3])
+    last = max(traced_kb for _, traced_kb, _ in sink.samples[-3:])
+    growth = (last - first) / first if first else 0
+    ok = growth <= args.tolerance
+    print(f"{scraped} records in {elapsed:.1f}s, traced memory {first:.1f} KB -> {last:.1f} KB ({growth:+.1%}): "
+          + ("flat" if ok else "GROWING"))
+    sys.exit(0 if ok else 1)
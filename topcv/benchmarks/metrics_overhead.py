@@ -0,0 +1,119 @@
+"""
+Cost of the stage timers (classes/metrics.py) on the extraction of the saved pages in fixtures/.
+
+Pages go through the dispatcher as in a crawl (parse, extract_*, normalize, fingerprint are timed), with metrics off
+(NULL_METRICS, the default) and on (Metrics). Also checks that the records do not change, that p50 / p95 merged from
+shard samples (as the DAG does) stay close to the exact ones for several sets of durations, also when the shards keep
+only a sample of theirs, that they come out the same when merged again, and that the Prometheus text is well formed.
+
+usage: python topcv/benchmarks/metrics_overhead.py [--repeat N] [--parser lxml]
+exits with status 1 if a check fails
+"""
+import argparse
+import random
+import re
+import time
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parser_backends import PAGES, load_fixture
+from dispatcher import dispatch
+from metrics import MAX_SAMPLES, NULL_METRICS, Metrics, quantile
+
+# name{label="value",...} number
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="(\\.|[^"\\])*",?)*\})? -?[0-9.e+-]+$')
+
+
+def strip_volatile(record):
+    # extract_all stamps the date of the day before
+    return {key: value for key, value in record.items() if key != 'date'}
+
+def time_pages(pages, parser, repeat, metrics):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url, html in pages:
+            dispatch(url, html, parser=parser, metrics=metrics)
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+def timer_cost(metrics, n=200000):
+    """seconds per `with metrics.timer(...)` block, the empty loop taken out"""
+    start = time.perf_counter()
+    for _ in range(n):
+        pass
+    empty = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(n):
+        with metrics.timer('stage'):
+            pass
+    return max(time.perf_counter() - start - empty, 0) / n
+
+def merged_quantiles(durations, shards, max_samples=MAX_SAMPLES):
+    # every shard sends samples() through XCom, reduce_counts merges them
+    merged = Metrics()
+    size = len(durations) // shards
+    for i in range(shards):
+        shard = Metrics(max_samples=max_samples)
+        for seconds in durations[i * size:(i + 1) * size]:
+            shard.observe('detail_fetch', seconds)
+        merged.merge(shard.samples())
+    return merged.summary()['stages']['detail_fetch']
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--repeat', type=int, default=50)
+    arg_parser.add_argument('--parser', default='lxml')
+    args = arg_parser.parse_args()
+
+    pages = [(url, load_fixture(name)) for name, (_, url) in PAGES.items()]
+    metrics = Metrics()
+    same = all(strip_volatile(dispatch(url, html, parser=args.parser)) == strip_volatile(dispatch(url, html, parser=args.parser, metrics=metrics))
+               for url, html in pages)
+
+    # warm up, then alternate so both runs see the same machine load
+    time_pages(pages, args.parser, 2, NULL_METRICS)
+    off, on = [], []
+    for _ in range(5):
+        off.append(time_pages(pages, args.parser, args.repeat // 5 or 1, NULL_METRICS))
+        on.append(time_pages(pages, args.parser, args.repeat // 5 or 1, Metrics()))
+    off_s, on_s = min(off), min(on)
+    timers_per_page = sum(stage['count'] for stage in metrics.summary()['stages'].values()) / len(pages)
+    null_cost, timer_cost_on = timer_cost(NULL_METRICS), timer_cost(Metrics())
+
+    print(f"{len(pages)} pages x {args.repeat}, parser {args.parser}, {timers_per_page:.0f} timers per page")
+    print(f"{'':<24}{'ms/page':>10}{'timer µs':>10}{'overhead':>10}")
+    print(f"{'metrics off':<24}{off_s * 1000:>10.3f}{null_cost * 1e6:>10.3f}{null_cost * timers_per_page / off_s:>10.3%}")
+    print(f"{'metrics on':<24}{on_s * 1000:>10.3f}{timer_cost_on * 1e6:>10.3f}{timer_cost_on * timers_per_page / off_s:>10.3%}")
+
+    errors = {0.5: 0, 0.95: 0}
+    for seed in range(5):
+        rng = random.Random(seed)
+        durations = [rng.lognormvariate(-3, 1) for _ in range(40000)]
+        exact = sorted(durations)
+        # 5000 durations per shard: all of them kept, then only a sample of 2000
+        for max_samples in (MAX_SAMPLES, 2000):
+            merged = merged_quantiles(durations, 8, max_samples)
+            for q in errors:
+                errors[q] = max(errors[q], abs(merged[f'p{int(q * 100)}_ms'] / 1000 / quantile(exact, q) - 1))
+    print(f"quantiles merged from 8 shards vs exact, worst of 5 sets of durations: p50 {errors[0.5]:.2%} off, p95 {errors[0.95]:.2%} off")
+    reproduced = merged_quantiles(durations, 8, 2000) == merged
+
+    text = metrics.render()
+    bad_lines = [line for line in text.splitlines() if not line.startswith('#') and not SAMPLE_LINE.match(line)]
+
+    checks = {
+        'same records with metrics on': same,
+        # the timers of one page cost less than 0.1% of its extraction when metrics are off
+        'negligible overhead when off': null_cost * timers_per_page < 0.001 * off_s,
+        'merged p50 / p95 within 5% of the exact ones': max(errors.values()) < 0.05,
+        'merged p50 / p95 the same when merged again': reproduced,
+        'well formed Prometheus text': not bad_lines and '# TYPE topcv_crawl_stage_seconds summary' in text,
+    }
+    for name, ok in checks.items():
+        print(f"{'ok' if ok else 'FAILED':>6}  {name}")
+    sys.exit(0 if all(checks.values()) else 1)
@@ -0,0 +1,155 @@
+"""
+Salary / experience normalization benchmark (classes/normalize.py) over data/normaljobs.json and the saved pages in
+fixtures/, repeated to --records jobs.
+
+Checks the parse of the examples below, then reports:
+- records/sec of the normalization: every string parsed (no cache), per record with the cache, and in batches
+  (normalize_batch, each distinct string once per batch)
+- ms per range filter ('at least 20 triệu', '1,000 - 2,000 USD', 'at most 2 years'): parsing the raw strings of every job,
+  as a filter written against the stored strings has to, against a range on the numeric fields sorted once,
+  which is what the Mongo indexes of schema.py give (bisect on the column instead of a B-tree)
+
+usage: python topcv/benchmarks/normalize_fields.py [--records N] [--batch-size N] [--repeat N]
+exits with status 1 if an example is parsed wrong
+"""
+import argparse
+import json
+import time
+from bisect import bisect_left, bisect_right
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+TOPCV_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_DIR = os.path.join(TOPCV_DIR, 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parser_backends import PAGES, load_fixture
+from normalize import normalize_batch, normalize_record, parse_experience, parse_salary, raw_values
+
+SALARY_EXAMPLES = {
+    '10 - 20 triệu': (10000000, 20000000, 'VND'),
+    'Tới 2,000 USD': (None, 2000, 'USD'),
+    'Thoả thuận': (None, None, None),
+    'Từ 11 triệu': (11000000, None, 'VND'),
+    '1,000 - 2,500 USD': (1000, 2500, 'USD'),
+    '15.000.000 VND': (15000000, 15000000, 'VND'),
+    'Cạnh tranh': (None, None, None),
+    'Lên đến 30 triệu': (None, 30000000, 'VND'),
+    'Tối đa 1,500 USD': (None, 1500, 'USD'),
+}
+EXPERIENCE_EXAMPLES = {
+    '2 năm': 2, 'Dưới 1 năm': 0, 'Trên 5 năm': 5, 'Không yêu cầu': 0, '1 - 3 năm': 1, '6 tháng': 0.5, None: None,
+    '1 năm 6 tháng': 1.5, '6 - 12 tháng': 0.5, '2 năm - 3 năm': 2,
+}
+
+
+def sample_docs():
+    with open(os.path.join(TOPCV_DIR, 'data', 'normaljobs.json'), encoding='utf-8') as f:
+        docs = json.load(f)
+    docs += [scraper_class(url, parser='lxml').scrape(load_fixture(name)) for name, (scraper_class, url) in PAGES.items()]
+    return docs
+
+def uncached(doc):
+    # what the normalization costs without the cache: every string parsed again
+    salary, experience = raw_values(doc)
+    salary_min, salary_max, currency = parse_salary.__wrapped__(salary)
+    return {'salary_min': salary_min, 'salary_max': salary_max, 'currency': currency,
+            'exp_min_years': parse_experience.__wrapped__(experience)}
+
+def rate(func, count, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best
+
+def batched(docs, batch_size):
+    for i in range(0, len(docs), batch_size):
+        normalize_batch(docs[i:i + batch_size])
+
+def column(docs, fields, name, currency=None):
+    """(sorted values, doc numbers) of one numeric field, the jobs without it left out"""
+    pairs = sorted((f[name], i) for i, f in enumerate(fields)
+                   if f[name] is not None and (currency is None or f['currency'] == currency))
+    return [value for value, _ in pairs], [i for _, i in pairs]
+
+def in_range(values, numbers, low=None, high=None):
+    start = 0 if low is None else bisect_left(values, low)
+    end = len(values) if high is None else bisect_right(values, high)
+    return set(numbers[start:end])
+
+def timed(func, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--records', type=int, default=50000)
+    arg_parser.add_argument('--batch-size', type=int, default=1000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    wrong = [(text, parse_salary(text), expected) for text, expected in SALARY_EXAMPLES.items() if parse_salary(text) != expected]
+    wrong += [(text, parse_experience(text), expected) for text, expected in EXPERIENCE_EXAMPLES.items()
+              if parse_experience(text) != expected]
+    for text, got, expected in wrong:
+        print(f"FAILED  {text!r}: {got}, expected {expected}")
+
+    samples = sample_docs()
+    docs = [samples[i % len(samples)] for i in range(args.records)]
+    salaries = {raw_values(doc)[0] for doc in samples}
+    unparsed = sorted(text for text in salaries if text and parse_salary(text) == (None, None, None))
+    print(f"{len(samples)} sample jobs, {len(salaries)} distinct salaries, without a number: {unparsed}")
+
+    print(f"\n{args.records} records")
+    print(f"{'records/sec':<34}{'rate':>12}")
+    cases = [
+        ('no cache', lambda: [uncached(doc) for doc in docs]),
+        ('cached, per record', lambda: [normalize_record(doc) for doc in docs]),
+        (f'batches of {args.batch_size}', lambda: batched(docs, args.batch_size)),
+    ]
+    for name, func in cases:
+        print(f"{name:<34}{rate(func, len(docs), args.repeat):>12.0f}")
+
+    fields = normalize_batch(docs)
+    # the Mongo filters of schema.JOB_QUERIES: {currency, salary_max: {$gte}}, {currency, salary_min: {$gte, $lte}},
+    # {exp_min_years: {$lte}}
+    vnd_max = column(docs, fields, 'salary_max', 'VND')
+    usd_min = column(docs, fields, 'salary_min', 'USD')
+    experience = column(docs, fields, 'exp_min_years')
+
+    def scan(test):
+        # a filter on the raw strings: parse every job again (no cache, a query does not keep one)
+        return {i for i, doc in enumerate(docs) if test(uncached(doc))}
+
+    filters = [
+        ('salary at least 20 triệu',
+         lambda f: f['currency'] == 'VND' and f['salary_max'] is not None and f['salary_max'] >= 20000000,
+         lambda: in_range(*vnd_max, low=20000000)),
+        ('salary 1,000 - 2,000 USD',
+         lambda f: f['currency'] == 'USD' and f['salary_min'] is not None and 1000 <= f['salary_min'] <= 2000,
+         lambda: in_range(*usd_min, low=1000, high=2000)),
+        ('experience at most 2 years',
+         lambda f: f['exp_min_years'] is not None and f['exp_min_years'] <= 2,
+         lambda: in_range(*experience, high=2)),
+    ]
+    print(f"\n{'ms per filter':<34}{'scan':>12}{'range':>12}{'jobs':>8}")
+    for name, test, ranged in filters:
+        scan_ms, scanned = timed(lambda: scan(test), 1)
+        range_ms, found = timed(ranged, args.repeat)
+        if scanned != found:
+            wrong.append((name, len(found), len(scanned)))
+            print(f"FAILED  {name}: {len(found)} jobs in range, {len(scanned)} scanned")
+        print(f"{name:<34}{scan_ms:>12.1f}{range_ms:>12.3f}{len(found):>8}")
+
+    sys.exit(1 if wrong else 0)
@@ -0,0 +1,164 @@
+"""
+Check of the Telegram notifier (classes/notifier.py) against a local stand-in for the Bot API.
+The stand-in answers sendMessage like Telegram does: 400 for a message over 4096 characters, 429 with retry_after
+to a chat that gets messages faster than --chat-rate, and a 429 to every --flood-every-th request on top of that.
+Digests of --jobs jobs built from the saved pages in fixtures/ are sent to --chats chats, then sent again with the same
+delivery log, as a DAG rerun would.
+
+Checks: every job is delivered exactly once to every chat, no message is too long, no message is sent faster than
+the chat's rate, every 429 is retried, and the rerun sends nothing.
+
+usage: python topcv/benchmarks/notifier_standin.py [--jobs N] [--chats K] [--chat-rate R] [--flood-every N]
+exits with status 1 if a check fails
+"""
+import argparse
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import sys
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parser_backends import PAGES, load_fixture
+from notifier import MAX_MESSAGE_LENGTH, TelegramNotifier, text_length
+from storage import FileDeliveryLog
+
+TOKEN = '123456:standin'
+JOB_URL = re.compile(r'https://\S+')
+
+
+class StandInBotApi(ThreadingHTTPServer):
+    """sendMessage of the Bot API, keeps every accepted message"""
+
+    def __init__(self, chat_rate, flood_every):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.min_interval = 1 / chat_rate
+        self.flood_every = flood_every
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.messages = []
+        self.last_sent = {}
+        self.too_fast = 0
+        self.flooded = 0
+        self.too_long = 0
+
+    @property
+    def api_base(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        api = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.path != f'/bot{TOKEN}/sendMessage':
+            return self.reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+
+        chat_id = str(payload['chat_id'])
+        with api.lock:
+            api.requests += 1
+            now = time.monotonic()
+            if text_length(payload['text']) > MAX_MESSAGE_LENGTH:
+                api.too_long += 1
+                return self.reply(400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: message is too long'})
+            # 10% slack for timer jitter
+            if chat_id in api.last_sent and now - api.last_sent[chat_id] < api.min_interval * 0.9:
+                api.too_fast += 1
+                return self.reply(429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                        'parameters': {'retry_after': 1}})
+            if api.flood_every and api.requests % api.flood_every == 0:
+                api.flooded += 1
+                return self.reply(429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                        'parameters': {'retry_after': 1}})
+            api.last_sent[chat_id] = now
+            api.messages.append((chat_id, payload['text']))
+            message_id = len(api.messages)
+        self.reply(200, {'ok': True, 'result': {'message_id': message_id, 'chat': {'id': chat_id}, 'text': payload['text']}})
+
+
+def fake_jobs(count):
+    """count records made from the fixture pages, each with its own _id and url"""
+    pages = [scraper_class(url, parser='lxml').scrape(load_fixture(name)) for name, (scraper_class, url) in PAGES.items()]
+    jobs = []
+    for i in range(count):
+        job = dict(pages[i % len(pages)])
+        job['_id'] = f'job{i:05d}'
+        job['url'] = f"{job['url'][:-5]}-{i}.html"
+        jobs.append(job)
+    return jobs
+
+def delivered(messages, jobs):
+    """{chat id: {job id: times delivered}} from the urls in the accepted messages"""
+    ids = {job['url']: job['_id'] for job in jobs}
+    counts = {}
+    for chat_id, text in messages:
+        for url in JOB_URL.findall(text):
+            if url in ids:
+                chat = counts.setdefault(chat_id, {})
+                chat[ids[url]] = chat.get(ids[url], 0) + 1
+    return counts
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--jobs', type=int, default=300)
+    arg_parser.add_argument('--chats', type=int, default=2)
+    arg_parser.add_argument('--chat-rate', type=float, default=5.0, help="messages/sec one chat accepts (Telegram: 20/60 for channels)")
+    arg_parser.add_argument('--flood-every', type=int, default=4, help="extra 429 to every n-th request, 0 for none")
+    args = arg_parser.parse_args()
+
+    api = StandInBotApi(args.chat_rate, args.flood_every)
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    jobs = fake_jobs(args.jobs)
+    chats = [f'-100{chat}' for chat in range(args.chats)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = FileDeliveryLog(os.path.join(tmp, 'notified.json'))
+        runs = []
+        for _ in range(2):
+            notifier = TelegramNotifier(TOKEN, api_base=api.api_base, log=log, chat_rate=args.chat_rate, retry_delay=0.1)
+            start = time.perf_counter()
+            try:
+                runs.append((notifier.notify(chats, jobs), time.perf_counter() - start))
+            finally:
+                notifier.close()
+    api.shutdown()
+
+    (first, first_s), (rerun, rerun_s) = runs
+    counts = delivered(api.messages, jobs)
+    longest = max(text_length(text) for _, text in api.messages)
+    print(f"first run: {first} in {first_s:.1f}s")
+    print(f"rerun:     {rerun} in {rerun_s:.1f}s")
+    print(f"stand-in: {api.requests} requests, {len(api.messages)} messages accepted, longest {longest} characters, "
+          f"{api.flooded} forced 429, {api.too_fast} too fast, {api.too_long} too long")
+
+    checks = {
+        'every job delivered once to every chat': all(
+            len(counts.get(chat, {})) == args.jobs and set(counts[chat].values()) == {1} for chat in chats),
+        'no message too long': api.too_long == 0,
+        'chat rate respected': api.too_fast == 0,
+        'every 429 retried': first['throttled'] == api.flooded and first['failed'] == 0,
+        'rerun sends nothing': rerun['messages'] == 0 and rerun['skipped'] == args.jobs * args.chats,
+    }
+    for name, ok in checks.items():
+        print(f"{'ok' if ok else 'FAILED':>6}  {name}")
+    sys.exit(0 if all(checks.values()) else 1)
@@ -0,0 +1,93 @@
+"""
+Parity check and parse-time report of the parser backends over the saved pages in fixtures/.
+On these pages lxml parses about 1.1-1.7x and selectolax about 4-5x (3.6-5.8x over runs) faster than html.parser;
+the figures move from run to run, the last line gives the range of this one.
+
+usage: python topcv/benchmarks/parser_backends.py [--repeat N]
+exits with status 1 if a backend gives a different dict than html.parser for any page
+"""
+import argparse
+import time
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from NormalJobScraper import NormalJobScraper
+from PremiumJobScraper import PremiumJobScraper
+from BrandJobScraper import BrandJobScraper
+from parsers import PARSERS, decode_body, parse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# saved page => (scraper, url it was saved from)
+PAGES = {
+    'normal_job.html': (NormalJobScraper, 'https://www.topcv.vn/viec-lam/nhan-vien-kinh-doanh-phan-mem-sales-b2b/1909066.html'),
+    'premium_job.html': (PremiumJobScraper, 'https://www.topcv.vn/brand/topcv/tuyen-dung/product-owner-j1873033.html'),
+    'brand_job.html': (BrandJobScraper, 'https://www.topcv.vn/brand/congtycophanmisa/tuyen-dung/nhan-vien-phat-trien-doi-tac-ho-kinh-doanh-thu-nhap-25-30-trieu-thang-j1928082.html'),
+}
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return decode_body(f.read())
+
+def available_parsers():
+    parsers = []
+    for parser in PARSERS:
+        try:
+            parse('<html></html>', parser)
+            parsers.append(parser)
+        except ImportError as e:
+            print(f"skip {parser}: {e}")
+    return parsers
+
+def scrape_page(scraper_class, url, html, parser):
+    return scraper_class(url, parser=parser).scrape(html)
+
+def check_parity(parsers):
+    ok = True
+    for name, (scraper_class, url) in PAGES.items():
+        html = load_fixture(name)
+        expected = scrape_page(scraper_class, url, html, 'html.parser')
+        for parser in parsers:
+            result = scrape_page(scraper_class, url, html, parser)
+            if result != expected:
+                ok = False
+                print(f"MISMATCH {name} [{parser}]")
+                for key in expected:
+                    if result is None or result.get(key) != expected[key]:
+                        print(f"  {key}: {expected[key]!r}\n  != {None if result is None else result.get(key)!r}")
+    return ok
+
+def time_parsers(parsers, repeat):
+    print(f"\n{'page':<20}{'parser':<14}{'ms/page':>10}{'vs html.parser':>16}")
+    speedups = {parser: [] for parser in parsers}
+    for name, (scraper_class, url) in PAGES.items():
+        html = load_fixture(name)
+        baseline = None
+        for parser in parsers:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                scrape_page(scraper_class, url, html, parser)
+            ms = (time.perf_counter() - start) * 1000 / repeat
+            baseline = baseline or ms
+            speedups[parser].append(baseline / ms)
+            print(f"{name:<20}{parser:<14}{ms:>10.3f}{baseline / ms:>15.1f}x")
+    print("vs html.parser: " + ", ".join(f"{parser} {min(values):.1f}-{max(values):.1f}x"
+                                         for parser, values in speedups.items() if parser != parsers[0]))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--repeat', type=int, default=50)
+    args = arg_parser.parse_args()
+
+    parsers = available_parsers()
+    ok = check_parity(parsers)
+    print("parity: " + ("OK" if ok else "FAILED") + f" ({', '.join(parsers)})")
+    time_parsers(parsers, args.repeat)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,63 @@
+"""
+Throughput of the fetch/parse pipeline for a growing number of parser processes,
+served offline from the saved pages in fixtures/ (the fetch stage costs nothing, so parsing is the bottleneck).
+
+usage: python topcv/benchmarks/pipeline_scaling.py [--pages N] [--workers 1 2 4] [--parser lxml]
+"""
+import argparse
+import asyncio
+import time
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parser_backends import PAGES, load_fixture
+from pipeline import run_pipeline
+
+
+class FixtureFetcher:
+    """
+    stands in for AsyncFetcher: returns the saved page of the url's type instead of downloading it
+    """
+
+    def __init__(self, max_in_flight=8):
+        self.max_in_flight = max_in_flight
+        self.pages = {url: load_fixture(name) for name, (_, url) in PAGES.items()}
+
+    def urls(self, count):
+        # count urls cycling over the saved pages, with a query string so each one is distinct
+        base = list(self.pages)
+        return [f"{base[i % len(base)]}?page={i}" for i in range(count)]
+
+    async def fetch(self, url, track=True, defer=False):
+        return self.pages[url.split('?')[0]]
+
+
+async def run(urls, fetcher, workers, parser):
+    scraped = 0
+    async for _, job_data in run_pipeline(urls, fetcher, workers=workers, parser=parser):
+        scraped += job_data is not None
+    return scraped
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--pages', type=int, default=300)
+    arg_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    arg_parser.add_argument('--parser', default='lxml')
+    args = arg_parser.parse_args()
+
+    fetcher = FixtureFetcher()
+    urls = fetcher.urls(args.pages)
+    print(f"{'workers':<10}{'pages/sec':>12}{'speedup':>10}")
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        scraped = asyncio.run(run(urls, fetcher, workers, args.parser))
+        rate = scraped / (time.perf_counter() - start)
+        baseline = baseline or rate
+        print(f"{workers:<10}{rate:>12.1f}{rate / baseline:>9.2f}x")
@@ -0,0 +1,113 @@
+"""
+Record model benchmark over the saved pages in fixtures/: the nested dicts of the scrapers against JobRecords
+(classes/records.py) built from the same pages.
+Reports the memory per record of the containers (the strings are the same on both sides and counted once, apart)
+and the records/sec of dict => JobRecord normalization, JSON encoding (what the jsonl / stdout sinks do)
+and BSON encoding (what the Mongo driver does before sending a document).
+The JSON gain is orjson's (encode_json), a JobRecord is flattened by to_document() first; in BSON that flattening is
+not paid back and JobRecords encode about 0.75x as fast as the dicts, so typed output stays opt-in (--typed).
+
+usage: python topcv/benchmarks/record_model.py [--records N] [--repeat N] [--parser lxml]
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import bson
+
+from parser_backends import PAGES, load_fixture
+from records import encode_json, from_scraped, orjson, to_document
+
+
+def scraped_dicts(parser):
+    return [scraper_class(url, parser=parser).scrape(load_fixture(name)) for name, (scraper_class, url) in PAGES.items()]
+
+def rebuild(value):
+    # new containers around the same strings, so N copies cost what N scraped dicts would cost in containers
+    if isinstance(value, dict):
+        return {k: rebuild(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rebuild(v) for v in value]
+    return value
+
+def traced(build):
+    """traced memory (bytes) still held by what build() returns"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+def strings_size(value):
+    if isinstance(value, dict):
+        return sum(sys.getsizeof(k) + strings_size(v) for k, v in value.items())
+    if isinstance(value, list):
+        return sum(strings_size(v) for v in value)
+    return sys.getsizeof(value) if isinstance(value, str) else 0
+
+def throughput(func, items, repeat):
+    """records/sec of func over items, best of repeat passes"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(items) / best
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--records', type=int, default=3000)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--parser', default='lxml')
+    args = arg_parser.parse_args()
+
+    pages = scraped_dicts(args.parser)
+    dicts = [rebuild(pages[i % len(pages)]) for i in range(args.records)]
+    records = [from_scraped(d) for d in dicts]
+
+    # same content either way: the flat document is the nested dict with its labels mapped to fields
+    for page in pages:
+        record = from_scraped(page)
+        assert json.loads(encode_json(record)) == to_document(record)
+
+    dict_bytes = traced(lambda: [rebuild(d) for d in dicts])
+    record_bytes = traced(lambda: [from_scraped(d) for d in dicts])
+    string_bytes = sum(strings_size(page) for page in pages) / len(pages)
+
+    print(f"{args.records} records ({len(pages)} page types), strings {string_bytes / 1024:.1f} KB per record on both sides")
+    print(f"{'containers per record':<34}{'dict':>12}{'JobRecord':>12}")
+    print(f"{'bytes':<34}{dict_bytes / args.records:>12.0f}{record_bytes / args.records:>12.0f}")
+
+    dumps = lambda d: json.dumps(d, ensure_ascii=False, default=str)
+    cases = [
+        ('normalize dict => JobRecord', None, lambda: throughput(from_scraped, dicts, args.repeat)),
+        ('json', lambda: throughput(dumps, dicts, args.repeat), lambda: throughput(encode_json, records, args.repeat)),
+        # what MongoSink costs: a JobRecord is flattened by to_document() before the driver encodes it
+        ('bson', lambda: throughput(bson.encode, dicts, args.repeat),
+         lambda: throughput(lambda record: bson.encode(to_document(record)), records, args.repeat)),
+    ]
+    print(f"\n{'records/sec':<34}{'dict':>12}{'JobRecord':>12}{'ratio':>8}")
+    for name, dict_case, record_case in cases:
+        record_rate = record_case()
+        if dict_case is None:
+            print(f"{name:<34}{'-':>12}{record_rate:>12.0f}{'-':>8}")
+            continue
+        dict_rate = dict_case()
+        print(f"{name:<34}{dict_rate:>12.0f}{record_rate:>12.0f}{record_rate / dict_rate:>7.2f}x")
+    print(f"json encoder: {'orjson' if orjson is not None else 'json (orjson not installed)'}")
@@ -0,0 +1,181 @@
+"""
+Search index benchmark (classes/search.py): the sample jobs in data/normaljobs.json and the saved pages in fixtures/
+are repeated up to --docs jobs (each with its own id, url and a few words of its own so the vocabulary grows).
+Reports the build rate, the memory held by the index (SearchIndex.stats), the latency percentiles of the queries in QUERIES (ms)
+and, for comparison, of a scan that folds and searches every job for every query, as a regex over the collection would.
+Checks SearchIndex.refresh against two writers committing out of order (the one that took its _updated_at first commits
+last) and a job whose content changed: both are picked up and every job is indexed once.
+
+usage: python topcv/benchmarks/search_index.py [--docs N] [--repeat N] [--scan-docs N]
+exits with status 1 if a check fails
+"""
+import argparse
+import gc
+import json
+import random
+import time
+from datetime import datetime, timedelta
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+TOPCV_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_DIR = os.path.join(TOPCV_DIR, 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parser_backends import PAGES, load_fixture
+from records import flatten
+from search import SearchIndex, fold, job_fields, parse_query
+from suite import percentile
+
+QUERIES = ['python hanoi 20tr', 'kinh doanh hcm', 'ke toan', 'java spring', 'nhân viên kinh doanh 15 triệu',
+           'tester', 'react nodejs', 'product owner', 'marketing online ha noi', 'devops aws 1500 usd']
+
+
+def sample_docs():
+    with open(os.path.join(TOPCV_DIR, 'data', 'normaljobs.json'), encoding='utf-8') as f:
+        docs = json.load(f)
+    docs += [scraper_class(url, parser='lxml').scrape(load_fixture(name)) for name, (scraper_class, url) in PAGES.items()]
+    return docs
+
+def make_docs(count, seed=0):
+    rng = random.Random(seed)
+    samples = sample_docs()
+    words = [f'w{i}' for i in range(count // 10 + 100)]
+    started = datetime(2026, 1, 1)
+    docs = []
+    for i in range(count):
+        doc = dict(samples[i % len(samples)])
+        doc['_id'] = f'job{i:07d}'
+        doc['url'] = f'https://www.topcv.vn/viec-lam/job/{i}.html'
+        doc['_scraped_at'] = started + timedelta(seconds=i)
+        # a few words of its own in the description, under an extra label (kept as job description text)
+        doc['job_description'] = dict(doc.get('job_description') or {})
+        doc['job_description']['Ghi chú'] = ' '.join(rng.sample(words, 5))
+        docs.append(doc)
+    return docs
+
+def scan(docs, query):
+    """what a regex scan would do: fold and search the text of every job"""
+    words, _ = parse_query(query)
+    found = []
+    for doc in docs:
+        text = fold(' '.join(' '.join(texts) for texts in job_fields(flatten(doc)).values()))
+        if all(word in text for word in words):
+            found.append(doc['_id'])
+    return found
+
+class JobsStandIn:
+    """
+    stands in for the jobs collection in refresh(): find() on one `{field: {'$gte': value}}` (or no) filter, then
+    sort() and limit(); committed documents only
+    """
+
+    def __init__(self):
+        self.docs = {}
+
+    def commit(self, docs):
+        for doc in docs:
+            self.docs[doc['_id']] = dict(doc)
+
+    def find(self, query, projection=None, batch_size=None):
+        docs = list(self.docs.values())
+        for field, condition in query.items():
+            docs = [doc for doc in docs if doc.get(field) is not None and doc[field] >= condition['$gte']]
+        return Cursor(docs)
+
+
+class Cursor(list):
+    def sort(self, field, direction):
+        return Cursor(sorted(self, key=lambda doc: doc[field], reverse=direction < 0))
+
+    def limit(self, count):
+        return Cursor(self[:count])
+
+
+def check_out_of_order(docs):
+    """
+    writer A takes its _updated_at, writer B takes a later one and commits, the index refreshes, then A commits; later
+    one job already indexed changes (its _updated_at moves, its _scraped_at not)
+    """
+    coll = JobsStandIn()
+    started = datetime(2026, 1, 1)
+    stamp = lambda batch, at: [dict(doc, _scraped_at=at, _updated_at=at) for doc in batch]
+    coll.commit(stamp(docs[:100], started))
+    index = SearchIndex()
+    index.refresh(coll)
+
+    a_at, b_at = started + timedelta(minutes=1), started + timedelta(minutes=1, seconds=2)
+    coll.commit(stamp(docs[150:200], b_at))
+    seen_b = index.refresh(coll)
+    coll.commit(stamp(docs[100:150], a_at))
+    seen_a = index.refresh(coll)
+
+    changed = dict(docs[0], _scraped_at=started, _updated_at=b_at + timedelta(minutes=1))
+    changed['job_info'] = dict(changed['job_info'], job_title='Kỹ sư lượng tử Zyxwv')
+    coll.commit([changed])
+    seen_changed = index.refresh(coll)
+    seen_again = index.refresh(coll)
+    live = [job[0] for job in index.jobs if job is not None]
+    return {
+        "a writer committing after a later one is indexed": seen_b == 50 and seen_a == 50 and len(index) == 200,
+        'a changed job is replaced, not added twice': seen_changed == 1 and len(live) == len(set(live)) == 200
+            and [job['_id'] for job in index.search('zyxwv')] == [changed['_id']],
+        'jobs read again within the slack are skipped': seen_again == 0,
+    }
+
+def latencies(func, repeat):
+    times = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            func(query)
+            times.append(time.perf_counter() - start)
+    times.sort()
+    return {p: round(percentile(times, p) * 1000, 3) for p in (50, 95, 99)}
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--docs', type=int, default=20000)
+    arg_parser.add_argument('--repeat', type=int, default=20)
+    arg_parser.add_argument('--scan-docs', type=int, default=2000, help="jobs scanned by the baseline (it is slow)")
+    args = arg_parser.parse_args()
+
+    docs = make_docs(args.docs)
+    index = SearchIndex(max_docs=args.docs)
+    gc.collect()
+    start = time.perf_counter()
+    for doc in docs[:-args.docs // 100]:
+        index.add(doc)
+    build_s = time.perf_counter() - start
+
+    # incremental refresh: the last 1% arrive after the build
+    start = time.perf_counter()
+    for doc in docs[-args.docs // 100:]:
+        index.add(doc)
+    refresh_s = time.perf_counter() - start
+
+    stats = index.stats()
+    print(f"{len(index)} jobs: build {build_s:.2f}s ({(len(docs) - args.docs // 100) / build_s:.0f} jobs/sec), "
+          f"refresh of {args.docs // 100} jobs {refresh_s * 1000:.0f} ms")
+    print(f"{stats['terms']} terms, {stats['postings']} postings, index holds {stats['memory_kb'] / 1024:.1f} MB, "
+          f"{stats['memory_kb'] * 1024 / len(index):.0f} bytes per job")
+
+    print(f"\n{'latency ms':<28}{'p50':>10}{'p95':>10}{'p99':>10}")
+    indexed = latencies(index.search, args.repeat)
+    print(f"{f'index ({len(index)} jobs)':<28}{indexed[50]:>10.3f}{indexed[95]:>10.3f}{indexed[99]:>10.3f}")
+    scan_docs = docs[:args.scan_docs]
+    scanned = latencies(lambda query: scan(scan_docs, query), 1)
+    print(f"{f'scan ({len(scan_docs)} jobs)':<28}{scanned[50]:>10.3f}{scanned[95]:>10.3f}{scanned[99]:>10.3f}")
+
+    print()
+    for query in QUERIES[:3]:
+        print(query, '=>', [(job['title'][:40], job['salary'], job['location']) for job in index.search(query, 3)])
+
+    checks = check_out_of_order(make_docs(200))
+    print()
+    for name, ok in checks.items():
+        print(f"{'ok' if ok else 'FAILED':>6}  {name}")
+    sys.exit(0 if all(checks.values()) else 1)
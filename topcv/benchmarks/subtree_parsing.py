@@ -0,0 +1,60 @@
+"""
+Before/after of parse-time subtree filtering over the saved pages in fixtures/:
+CPU time and peak traced memory per page when the whole page is built vs only the scraper's SUBTREES.
+
+usage: python topcv/benchmarks/subtree_parsing.py [--repeat N]
+exits with status 1 if a scraper gives a different dict with subtree_only on and off
+"""
+import argparse
+import time
+import tracemalloc
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parser_backends import PAGES, load_fixture
+
+# selectolax has no parse-time filter, see parsers.parse()
+BS4_PARSERS = ('html.parser', 'lxml')
+
+
+def scrape_page(scraper_class, url, html, parser, subtree_only):
+    return scraper_class(url, parser=parser, subtree_only=subtree_only).scrape(html)
+
+def measure(scraper_class, url, html, parser, subtree_only, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        scrape_page(scraper_class, url, html, parser, subtree_only)
+    cpu_ms = (time.process_time() - start) * 1000 / repeat
+
+    tracemalloc.start()
+    scrape_page(scraper_class, url, html, parser, subtree_only)
+    peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return cpu_ms, peak_kb
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--repeat', type=int, default=50)
+    args = arg_parser.parse_args()
+
+    ok = True
+    print(f"{'page':<20}{'parser':<14}{'cpu ms full':>12}{'subtree':>10}{'peak KB full':>14}{'subtree':>10}")
+    for name, (scraper_class, url) in PAGES.items():
+        html = load_fixture(name)
+        for parser in BS4_PARSERS:
+            if scrape_page(scraper_class, url, html, parser, True) != scrape_page(scraper_class, url, html, parser, False):
+                ok = False
+                print(f"MISMATCH {name} [{parser}]")
+
+            full_ms, full_kb = measure(scraper_class, url, html, parser, False, args.repeat)
+            sub_ms, sub_kb = measure(scraper_class, url, html, parser, True, args.repeat)
+            print(f"{name:<20}{parser:<14}{full_ms:>12.3f}{sub_ms:>10.3f}{full_kb:>14.1f}{sub_kb:>10.1f}")
+
+    print("parity: " + ("OK" if ok else "FAILED"))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,147 @@
+"""
+Offline benchmark suite over the saved pages in fixtures/: listing parsing, each scraper's scrape(),
+the walk collecting the nodes of its SPEC and each of its extract_* methods, timed separately.
+Reports pages/sec, per-page latency percentiles (ms) and peak traced memory (KB) of every case,
+and saves them as JSON so two commits can be compared.
+
+usage: python topcv/benchmarks/suite.py [--parser lxml] [--repeat N] [--output results.json] [--compare baseline.json]
+with --compare, cases more than --threshold slower than the baseline are listed and the exit status is 1
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classes')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parser_backends import PAGES, load_fixture
+from listing import parse_listing
+
+LISTING_PAGE = 'listing_page.html'
+
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def run_case(func, repeat):
+    """call func repeat times, return its timings and the peak traced memory of one more call"""
+    func()  # warm up (imports, caches)
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'pages_per_sec': round(repeat / total, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 4),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 4),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+def extract_methods(scraper_class):
+    # in definition order, extract_all / extract_record are covered by scrape() (and clear the tree they read)
+    return [name for name in vars(scraper_class) if name.startswith('extract_') and name not in ('extract_all', 'extract_record')]
+
+def cases(parser):
+    """case name => function doing the work for one page"""
+    listing_html = load_fixture(LISTING_PAGE)
+    yield 'listing/parse_listing', lambda: parse_listing(listing_html, parser)
+
+    for name, (scraper_class, url) in PAGES.items():
+        html = load_fixture(name)
+        kind = name.split('_')[0]
+        yield f'{kind}/scrape', lambda: scraper_class(url, parser=parser).scrape(html)
+
+        # extract_* only read the tree, so one loaded page serves every call
+        scraper = scraper_class(url, parser=parser)
+        scraper.load(html)
+        # the one walk collecting every node of the scraper's SPEC, extract_* build their part from what it found
+        yield f'{kind}/collect', lambda: scraper.EXTRACTOR.collect(scraper.soup)
+        for method in extract_methods(scraper_class):
+            yield f'{kind}/{method}', getattr(scraper, method)
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(parser, repeat):
+    results = {}
+    for name, func in cases(parser):
+        results[name] = run_case(func, repeat)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'parser': parser,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+def compare(report, baseline, threshold):
+    """print the p50 ratio of every case against the baseline report, return the cases slower than threshold"""
+    regressions = []
+    print(f"\n{'case':<36}{'p50 ms':>10}{'baseline':>10}{'ratio':>8}")
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<36}{result['p50_ms']:>10.3f}{'-':>10}{'-':>8}")
+            continue
+        ratio = result['p50_ms'] / base['p50_ms'] if base['p50_ms'] else 1.0
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = '  SLOWER'
+        print(f"{name:<36}{result['p50_ms']:>10.3f}{base['p50_ms']:>10.3f}{ratio:>7.2f}x{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--parser', default='lxml')
+    arg_parser.add_argument('--repeat', type=int, default=100)
+    arg_parser.add_argument('--output', default=None, help="save the results as JSON")
+    arg_parser.add_argument('--compare', default=None, help="JSON results of an earlier run")
+    arg_parser.add_argument('--threshold', type=float, default=0.2, help="p50 slowdown counted as a regression (0.2 = 20%%)")
+    args = arg_parser.parse_args()
+
+    report = run_suite(args.parser, args.repeat)
+    print(f"{'case':<36}{'pages/sec':>11}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'peak KB':>10}")
+    for name, result in report['results'].items():
+        print(f"{name:<36}{result['pages_per_sec']:>11.1f}{result['p50_ms']:>10.3f}{result['p90_ms']:>10.3f}"
+              f"{result['p99_ms']:>10.3f}{result['peak_kb']:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
@@ -1,8 +1,4 @@
-from bs4 import BeautifulSoup
-import requests
-import time
 from datetime import datetime, timedelta
-import random
 import sys
 import os
 
@@ -11,7 +7,14 @@ BASE_DIR = os.path.dirname(__file__)
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
     
-from utils import url_to_id_short
+from utils import job_id
+from fetcher import NOT_MODIFIED, get_default_fetcher
+from parsers import parse
+from records import from_brand
+from normalize import normalize_record
+from dedupe import fingerprint
+from metrics import NULL_METRICS
+from extractor import EACH, ByTag, Each, Entry, Extractor, Join, Merge, Step, Text, Texts, Within
 
 
 class BrandJobScraper:
@@ -21,131 +24,154 @@ class BrandJobScraper:
     flow: fetch url => load job in html fetched => parsing to extract data
     """
 
-    def __init__(self, url):
+    # only these parts of the page are built when parsing: job detail and company info in the footer
+    SUBTREES = [('div', 'block-left'), ('div', 'footer-info')]
+
+    # what each extract_* method returns, read inside the job detail (block-left) unless Within another part:
+    # a layout change is fixed here (see extractor.py)
+    # theo nhu exploration thi cac class 'box-info' trong phan job details gom: general info, job tags va job description
+    SPEC = {
+        'general_info': Merge(
+            {
+                'Job Title': Text(('h2', 'title')),
+                'Location': Texts([('div', 'box-job-info'), ('div', 'box-address'), (None, None, EACH)], join='\n'),
+            },
+            # general info: the box-info sections with a box-main
+            Each([('div', 'box-job-info'), ('div', 'box-info', EACH), Step('div', 'box-main', optional=True), ('div', 'box-item', EACH)],
+                 Entry(Text('strong'), Text('span'))),
+        ),
+        # jd: the other sections
+        'jd': Each(
+            [('div', 'box-job-info'), Step('div', 'box-info', EACH, unless=('div', 'box-main'))],
+            Merge(
+                # the items of a list as '- item' lines, paragraphs one per line
+                Entry(Text('h2'), Join([('div', 'content-tab'), (None, None, EACH)], ByTag({
+                    'ul': Texts(('li', None, EACH), format='- {}\n', join=''),
+                    'div': Text(format='{}\n'),
+                    'p': Text(format='{}\n'),
+                })), when=('div', 'content-tab')),
+                # custom form job (job co job khong)
+                Each(('div', 'custom-form-job__item', EACH),
+                     Entry(Text('h3'), Text(('div', 'custom-form-job__item--content')))),
+            ),
+        ),
+        # job tags (phan nay co trong "mo ta cong viec")
+        'job_tags': Texts([('div', 'box-job-info'), Step('div', 'box-info', EACH, unless=('div', 'box-main')),
+                           Step('div', 'job-tags', optional=True), ('a', None, EACH)]),
+        # company (phan nay trong footer): each title with the footer-info-content div after it
+        'company_info': Within(('div', 'footer-info'), Merge(
+            {'name': Text(('div', 'footer-info-content footer-info-company-name'))},
+            Each(('div', 'footer-info-title', EACH),
+                 Entry(Text(), Text(Step('div', after=True, first_class='footer-info-content')),
+                       when=Step('div', after=True, first_class='footer-info-content'))),
+        )),
+    }
+    EXTRACTOR = Extractor(SPEC, root=SUBTREES[0])
+
+    def __init__(self, url, fetcher=None, session=None, parser='html.parser', subtree_only=True, typed=False, metrics=None):
         self.url = url.split('?')[0]
+        self.parser = parser
+        self.subtree_only = subtree_only
+        # scrape() returns a JobRecord instead of the dict of extract_all()
+        self.typed = typed
+        # stage timers: parse, collect, each extract_*, normalize, fingerprint (see metrics.py)
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.fetcher = fetcher
+        self.session = session
         self.soup = None
         self.job = None
+        self.matches = None
+
+    def get_fetcher(self):
+        # created on first fetch so scrapers that only parse (dispatcher, parser processes) never open a session,
+        # and shared by the scrapers of one session instead of one fetcher (and its worker threads) per scraper
+        if self.fetcher is None:
+            self.fetcher = get_default_fetcher(self.session)
+        return self.fetcher
 
     def fetch(self):
-        headers = {
-            'User-Agent': ['Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
-                        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:54.0) Gecko/20100101 Firefox/54.0',
-                        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_6) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/11.1 Safari/605.1.15',
-                        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/61.0.3163.100 Safari/537.36']
-            }
-        response = requests.get(self.url, headers={'User-Agent': random.choice(headers['User-Agent'])})
-
-        # handle request failure
-        if response.status_code != 200:
-            for i in range(5):
-                print('Failed to retrieve: ' + self.url)
-                print('Will retry after 60s...')
-                time.sleep(60)
-                response = requests.get(self.url)
-                if response.status_code == 200:
-                    break
-
-            if response.status_code != 200:
-                print('Failed to retrieve after 5 retries: ' + self.url)
-                return None
-            
-        return response.content
+        return self.get_fetcher().fetch_sync(self.url)
+
+    async def afetch(self):
+        return await self.get_fetcher().fetch(self.url)
     
-    def load(self):
-        response_content = self.fetch()
+    def load(self, response_content=None):
+        if response_content is None:
+            response_content = self.fetch()
+        if response_content == NOT_MODIFIED:
+            print('Page not modified since last run: ' + self.url)
+            return None
         if response_content is None:
             print('Failed to load page content: ' + self.url)
             return None
         
-        self.soup = BeautifulSoup(response_content, "html.parser")
+        with self.metrics.timer('parse'):
+            soup = parse(response_content, self.parser, self.SUBTREES if self.subtree_only else None)
+        return self.load_soup(soup)
+
+    def load_soup(self, soup):
+        self.soup = soup
         self.job = self.soup.find('div', class_='block-left')
 
         if self.job is None:
             print('Job detail not found: ' + self.url)
+            self.metrics.error('parse', 'job_detail_not_found')
             return False
         
         return True
     
-    def extract_job_details(self):
-        jd = {}
-        general_info = {}
-        job_tags = []
-    
-        job_title = self.job.find('h2', class_='title').get_text(strip=True)
-        general_info['Job Title'] = job_title   
-
-        # address 
-        address_div = self.job.find('div', class_='box-job-info').find('div', class_='box-address')
-        address = "\n".join([a.get_text(strip=True) for a in address_div.find_all()])
-        general_info['Location'] = address
-
-        details = self.job.find('div', class_='box-job-info').find_all('div', class_='box-info')
-        # theo nhu exploration thi cac class 'box-info' trong phan job details gom: general info, job tags va job description
-        for section in details:
-            # general info
-            if section.find('div', class_='box-main'):
-                items = section.find('div', class_='box-main').find_all('div', class_='box-item')
-                for item in items:
-                    label = item.find('strong').get_text(strip=True)
-                    value = item.find('span').get_text(strip=True)
-                    # print(f"{label}: {value}")
-                    general_info[label] = value
-
-            # jd        
-            else:
-                title = section.find('h2').get_text(strip=True)
-                if section.find('div', class_='content-tab'):
-                    content_div = section.find('div', class_='content-tab').find_all()
-                    content = ""
-                    for part in content_div:
-                        if part.name == 'ul':
-                            lis = part.find_all('li')
-                            for li in lis:
-                                content += "- " + li.get_text(strip=True) + "\n"
-                        elif part.name == 'div' or part.name == 'p':
-                            content += part.get_text(strip=True) + "\n"
-                    jd[title] = content
-
-                # custom form job (job co job khong)
-                cfj = section.find_all('div', class_='custom-form-job__item')
-                if len(cfj) > 0:    
-                    for div in cfj:
-                        title = div.find('h3').get_text(strip=True) 
-                        content = div.find('div', class_='custom-form-job__item--content').get_text(strip=True)
-                        # print(f"{title}: {content}")
-                        jd[title] = content
-
-                # job tags (phan nay co trong "mo ta cong viec")
-                if section.find('div', class_='job-tags'):
-                    tags = section.find('div', class_='job-tags').find_all('a')
-                    for tag in tags:
-                        # print(tag.get_text(strip=True))
-                        job_tags.append(tag.get_text(strip=True))
+    def collect(self):
+        # every node SPEC reads, found in one walk over the page (see extractor.py), shared by the extract_* methods
+        if self.matches is None:
+            self.matches = self.EXTRACTOR.collect(self.soup)
+        return self.matches
 
+    def extract_job_details(self):
+        collected = self.collect()
+        jd = self.EXTRACTOR.build('jd', collected)
+        general_info = self.EXTRACTOR.build('general_info', collected)
+        job_tags = self.EXTRACTOR.build('job_tags', collected)
         return jd, general_info, job_tags
-    
-    def extract_company_info(self):
-        # company (phan nay trong footer)
-        company = {}
-        footer = self.soup.find('div', class_='footer-info')
-        company['name'] = footer.find('div', class_='footer-info-content footer-info-company-name').get_text(strip=True)
-        title_divs = footer.find_all('div', class_='footer-info-title')
-
-        for title in title_divs:
-            if title.find_next('div').get('class')[0] == 'footer-info-content':
-                company[title.get_text(strip=True)] = title.find_next('div').get_text(strip=True)
 
-        return company
-    
-    def scrape(self):   
-        if not self.load():
-            return None
-        
-        jd, general_info, job_tags = self.extract_job_details()
-        company = self.extract_company_info()
+    def extract_company_info(self):
+        return self.EXTRACTOR.build('company_info', self.collect())
 
-        return {
-            '_id': url_to_id_short(self.url),
+    def scrape(self, response_content=None):
+        # the tree is freed even when an extraction fails on an unexpected layout
+        try:
+            if not self.load(response_content):
+                return None
+            return self.extract_record() if self.typed else self.extract_all()
+        finally:
+            self.release()
+
+    def scrape_soup(self, soup):
+        """scrape from a document that was already fetched and parsed (e.g. by the dispatcher)"""
+        try:
+            if not self.load_soup(soup):
+                return None
+            return self.extract_record() if self.typed else self.extract_all()
+        finally:
+            self.release()
+
+    def release(self):
+        # free the parsed tree as soon as the record is built instead of waiting for the garbage collector
+        if self.soup is not None:
+            self.soup.decompose()
+        self.soup = None
+        self.job = None
+        self.matches = None
+
+    def extract_all(self):
+        with self.metrics.timer('collect'):
+            self.collect()
+        with self.metrics.timer('extract_job_details'):
+            jd, general_info, job_tags = self.extract_job_details()
+        with self.metrics.timer('extract_company_info'):
+            company = self.extract_company_info()
+
+        record = {
+            '_id': job_id(self.url),
             'date': (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'),
             'url': self.url,
             'company_info': company,
@@ -153,6 +179,24 @@ class BrandJobScraper:
             'job_description': jd,
             'tags': job_tags
         }
+        # salary_min / salary_max / currency / exp_min_years, parsed from the raw strings (see normalize.py)
+        with self.metrics.timer('normalize'):
+            record.update(normalize_record(record))
+        # fingerprint of the text for near-duplicate detection (see dedupe.py)
+        with self.metrics.timer('fingerprint'):
+            record['simhash'] = fingerprint(record)
+        return record
+
+    def extract_record(self):
+        """same data as extract_all(), as a JobRecord with the labels mapped to its fields (see records.py)"""
+        return from_brand(self.extract_all())
+
+    async def ascrape(self):
+        response_content = await self.afetch()
+        if response_content is None:
+            print('Failed to load page content: ' + self.url)
+            return None
+        return self.scrape(response_content)
 
 
 # if __name__ == "__main__":
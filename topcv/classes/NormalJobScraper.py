@@ -1,8 +1,4 @@
-from bs4 import BeautifulSoup
-import requests
-import time
 from datetime import datetime, timedelta
-import random
 import sys
 import os
 
@@ -11,7 +7,14 @@ BASE_DIR = os.path.dirname(__file__)
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
-from utils import url_to_id_short
+from utils import job_id
+from fetcher import NOT_MODIFIED, get_default_fetcher
+from parsers import parse
+from records import from_normal
+from normalize import normalize_record
+from dedupe import fingerprint
+from metrics import NULL_METRICS
+from extractor import EACH, Each, Entry, Extractor, Merge, Text, Texts
 
 
 class NormalJobScraper:
@@ -21,140 +24,159 @@ class NormalJobScraper:
     flow: fetch url => load job in html fetched => parsing to extract data
     """
 
-    def __init__(self, url):
+    # only these parts of the page are built when parsing, everything else is skipped
+    SUBTREES = [('div', 'job-detail__body')]
+
+    # what each extract_* method returns, read inside the job body: a layout change is fixed here (see extractor.py)
+    SPEC = {
+        'company_info': {
+            'company_name': Text([('div', 'company-name-label'), ('a', 'name')]),
+            'company_scale': Text([('div', 'job-detail__company--information-item company-scale'), ('div', 'company-value')]),
+            'company_address': Text([('div', 'job-detail__company--information-item company-address'), ('div', 'company-value')]),
+            'company_field': Text([('div', 'job-detail__company--information-item company-field'), ('div', 'company-value')]),
+        },
+        'job_info': {
+            'job_title': Text(('h1', 'job-detail__info--title'), separator=' '),
+            'salary': Text(('div', 'job-detail__info--section-content-value', 0)),
+            'location': Text(('div', 'job-detail__info--section-content-value', 1)),
+            'experience': Text(('div', 'job-detail__info--section-content-value', 2)),
+            # others general info
+            'general_info': Each(
+                [('div', 'job-detail__box--right job-detail__body-right--item job-detail__body-right--box-general'),
+                 ('div', 'box-general-group-info', EACH)],
+                Entry(Text(('div', 'box-general-group-info-title')), Text(('div', 'box-general-group-info-value'))),
+            ),
+        },
+        'jd': Merge(
+            # sections in jd part of html: the items of a list one per line, otherwise the text of the section
+            Each([('div', 'job-description'), ('div', 'job-description__item', EACH)],
+                 Entry(Text('h3'), Texts(('li', None, EACH), join='\n', fallback=Text('div', separator='\n')))),
+            # custom form job (job co job khong)
+            Each(('div', 'custom-form-job__item', EACH),
+                 Entry(Text('h3'), Text(('div', 'custom-form-job__item--content')))),
+        ),
+        'categories': Each(
+            [('div', 'job-detail__box--right job-detail__body-right--item job-detail__body-right--box-category'),
+             ('div', ['box-category', 'box-category-collapsed'], EACH)],
+            Entry(Text(('div', 'box-title')),
+                  Texts([('div', 'box-category-tags'), ('a', None, EACH)],
+                        fallback=Texts([('div', 'box-category-tags'), ('span', None, EACH)]))),
+        ),
+    }
+    EXTRACTOR = Extractor(SPEC, root=SUBTREES[0])
+
+    def __init__(self, url, fetcher=None, session=None, parser='html.parser', subtree_only=True, typed=False, metrics=None):
         self.url = url.split('?')[0]
+        self.parser = parser
+        self.subtree_only = subtree_only
+        # scrape() returns a JobRecord instead of the dict of extract_all()
+        self.typed = typed
+        # stage timers: parse, collect, each extract_*, normalize, fingerprint (see metrics.py)
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.fetcher = fetcher
+        self.session = session
         self.soup = None
         self.job = None
+        self.matches = None
+
+    def get_fetcher(self):
+        # created on first fetch so scrapers that only parse (dispatcher, parser processes) never open a session,
+        # and shared by the scrapers of one session instead of one fetcher (and its worker threads) per scraper
+        if self.fetcher is None:
+            self.fetcher = get_default_fetcher(self.session)
+        return self.fetcher
 
     def fetch(self):
-        headers = {
-            'User-Agent': ['Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
-                        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:54.0) Gecko/20100101 Firefox/54.0',
-                        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_6) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/11.1 Safari/605.1.15',
-                        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/61.0.3163.100 Safari/537.36']
-            }
-        response = requests.get(self.url, headers={'User-Agent': random.choice(headers['User-Agent'])})
-
-        # handle request failure
-        if response.status_code != 200:
-            for i in range(5):
-                print('Failed to retrieve: ' + self.url)
-                print('Will retry after 60s...')
-                time.sleep(60)
-                response = requests.get(self.url)
-                if response.status_code == 200:
-                    break
-
-            if response.status_code != 200:
-                print('Failed to retrieve after 5 retries: ' + self.url)
-                return None
-            
-        return response.content
+        return self.get_fetcher().fetch_sync(self.url)
+
+    async def afetch(self):
+        return await self.get_fetcher().fetch(self.url)
     
-    def load(self):
-        response_content = self.fetch()
+    def load(self, response_content=None):
+        if response_content is None:
+            response_content = self.fetch()
+        if response_content == NOT_MODIFIED:
+            print('Page not modified since last run: ' + self.url)
+            return None
         if response_content is None:
             print('Failed to load page content: ' + self.url)
             return None
         
-        self.soup = BeautifulSoup(response_content, "html.parser")
+        with self.metrics.timer('parse'):
+            soup = parse(response_content, self.parser, self.SUBTREES if self.subtree_only else None)
+        return self.load_soup(soup)
+
+    def load_soup(self, soup):
+        self.soup = soup
         self.job = self.soup.find('div', class_='job-detail__body')
 
         if self.job is None:
             print('Job detail not found: ' + self.url)
+            self.metrics.error('parse', 'job_detail_not_found')
             return False
         
         return True
     
+    def collect(self):
+        # every node SPEC reads, found in one walk over the job (see extractor.py), shared by the extract_* methods
+        if self.matches is None:
+            self.matches = self.EXTRACTOR.collect(self.soup)
+        return self.matches
+
     def extract_company_info(self):
-        company_name = self.job.find('div', class_='company-name-label').find('a', class_='name').get_text(strip=True)
-        company_scale = self.job.find('div', class_='job-detail__company--information-item company-scale').find('div', class_='company-value').get_text(strip=True)
-        company_address = self.job.find('div', class_='job-detail__company--information-item company-address').find('div', class_='company-value').get_text(strip=True)
-        company_field = self.job.find('div', class_='job-detail__company--information-item company-field').find('div', class_='company-value').get_text(strip=True)
-        return {
-            'company_name': company_name,
-            'company_scale': company_scale,
-            'company_address': company_address,
-            'company_field': company_field
-        }
-    
-    def extract_job_info(self):
-        job_title = self.job.find('h1', class_='job-detail__info--title').get_text(strip=True, separator=' ')
+        return self.EXTRACTOR.build('company_info', self.collect())
 
-        infs = self.job.find_all('div', class_='job-detail__info--section-content-value')
-        salary = infs[0].get_text(strip=True)
-        location = infs[1].get_text(strip=True)
-        exp = infs[2].get_text(strip=True)
+    def extract_job_info(self):
+        return self.EXTRACTOR.build('job_info', self.collect())
 
-        # others general info
-        general_inf = {}
-        all_general_inf = self.job.find('div', class_='job-detail__box--right job-detail__body-right--item job-detail__body-right--box-general').find_all('div', class_='box-general-group-info')
-        
-        for inf in all_general_inf:
-            title = inf.find('div', class_='box-general-group-info-title').get_text(strip=True)
-            value = inf.find('div', class_='box-general-group-info-value').get_text(strip=True)
-            general_inf[title] = value
-
-        return {
-            'job_title': job_title,
-            'salary': salary,
-            'location': location,
-            'experience': exp,
-            'general_info': general_inf
-        }
-    
     def extract_jd(self):
-        jd = {}
-        all_sections = self.job.find('div', class_='job-description').find_all('div', class_='job-description__item') # sections in jd part of html
-        for section in all_sections:
-            title = section.find('h3').get_text(strip=True)
-            if section.find_all('li'):
-                content = "\n".join([c.get_text(strip=True) for c in section.find_all('li')])
-            else:
-                content = section.find('div').get_text(strip=True, separator='\n')
-                
-            jd[title] = content
-            
-        # custom form job (job co job khong)
-        cfj = self.job.find_all('div', class_='custom-form-job__item')
-        if len(cfj) > 0:    
-            for form in cfj:
-                title = form.find('h3').get_text(strip=True)
-                content = form.find('div', class_='custom-form-job__item--content').get_text(strip=True)
-
-                jd[title] = content
-            
-        return jd
-    
+        return self.EXTRACTOR.build('jd', self.collect())
+
     def extract_categories(self):
-        categories = {}
-        
-        categories_box = self.job.find('div', class_="job-detail__box--right job-detail__body-right--item job-detail__body-right--box-category")\
-                            .find_all('div', class_=['box-category', 'box-category-collapsed'])
-        for category in categories_box:
-            title = category.find('div', class_='box-title').get_text(strip=True)
-            a = category.find('div', class_='box-category-tags').find_all('a')
-            if a:
-                tags = [tag.get_text(strip=True) for tag in a]
-            else:
-                tags = [tag.get_text(strip=True) for tag in category.find('div', class_='box-category-tags').find_all('span')]
-            categories[title] = tags
-
-        return categories
-    
-    def scrape(self):
-        if not self.load():
-            return None
-        
-        company_info = self.extract_company_info()
-        job_info = self.extract_job_info()
-        jd = self.extract_jd()
-        categories = self.extract_categories()
+        return self.EXTRACTOR.build('categories', self.collect())
+
+    def scrape(self, response_content=None):
+        # the tree is freed even when an extraction fails on an unexpected layout
+        try:
+            if not self.load(response_content):
+                return None
+            return self.extract_record() if self.typed else self.extract_all()
+        finally:
+            self.release()
+
+    def scrape_soup(self, soup):
+        """scrape from a document that was already fetched and parsed (e.g. by the dispatcher)"""
+        try:
+            if not self.load_soup(soup):
+                return None
+            return self.extract_record() if self.typed else self.extract_all()
+        finally:
+            self.release()
+
+    def release(self):
+        # free the parsed tree as soon as the record is built instead of waiting for the garbage collector
+        if self.soup is not None:
+            self.soup.decompose()
+        self.soup = None
+        self.job = None
+        self.matches = None
+
+    def extract_all(self):
+        with self.metrics.timer('collect'):
+            self.collect()
+        with self.metrics.timer('extract_company_info'):
+            company_info = self.extract_company_info()
+        with self.metrics.timer('extract_job_info'):
+            job_info = self.extract_job_info()
+        with self.metrics.timer('extract_jd'):
+            jd = self.extract_jd()
+        with self.metrics.timer('extract_categories'):
+            categories = self.extract_categories()
 
         self.job.clear()
         
-        return {
-            '_id': url_to_id_short(self.url),
+        record = {
+            '_id': job_id(self.url),
             'date': (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'),
             'url': self.url,
             'company_info': company_info,
@@ -162,6 +184,24 @@ class NormalJobScraper:
             'job_description': jd,
             'categories': categories
         }
+        # salary_min / salary_max / currency / exp_min_years, parsed from the raw strings (see normalize.py)
+        with self.metrics.timer('normalize'):
+            record.update(normalize_record(record))
+        # fingerprint of the text for near-duplicate detection (see dedupe.py)
+        with self.metrics.timer('fingerprint'):
+            record['simhash'] = fingerprint(record)
+        return record
+
+    def extract_record(self):
+        """same data as extract_all(), as a JobRecord with the labels mapped to its fields (see records.py)"""
+        return from_normal(self.extract_all())
+
+    async def ascrape(self):
+        response_content = await self.afetch()
+        if response_content is None:
+            print('Failed to load page content: ' + self.url)
+            return None
+        return self.scrape(response_content)
     
 
 # if __name__ == "__main__":
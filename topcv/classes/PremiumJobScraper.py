@@ -1,8 +1,4 @@
-from bs4 import BeautifulSoup
-import requests
-import time
 from datetime import datetime, timedelta
-import random
 import sys
 import os
 
@@ -11,7 +7,14 @@ BASE_DIR = os.path.dirname(__file__)
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
-from utils import url_to_id_short
+from utils import job_id
+from fetcher import NOT_MODIFIED, get_default_fetcher
+from parsers import parse
+from records import from_premium
+from normalize import normalize_record
+from dedupe import fingerprint
+from metrics import NULL_METRICS
+from extractor import EACH, Each, Entry, Extractor, Merge, Text, Texts
 
 
 class PremiumJobScraper:
@@ -21,119 +24,166 @@ class PremiumJobScraper:
     flow: fetch url => load job in html fetched => parsing to extract data
     """
 
-    def __init__(self, url):
+    # only these parts of the page are built when parsing, everything else is skipped
+    SUBTREES = [('div', 'premium-job')]
+
+    # what each extract_* method returns, read inside the premium job: a layout change is fixed here (see extractor.py)
+    SPEC = {
+        'jd': Each(('div', 'premium-job-description__box', EACH),
+                   Entry(Text('h2'), Texts(('li', None, EACH), join='\n', fallback=Text('div', separator='\n')))),
+        'general_info': Merge(
+            {
+                'job_title': Text(('h2', 'premium-job-basic-information__content--title')),
+                'salary': Text([('div', 'premium-job-basic-information__content--sections'), ('div', 'basic-information-item', 0),
+                                ('div', 'basic-information-item__data--value')]),
+                'location': Text([('div', 'premium-job-basic-information__content--sections'), ('div', 'basic-information-item', 1),
+                                  ('div', 'basic-information-item__data--value')]),
+                'experience': Text([('div', 'premium-job-basic-information__content--sections'), ('div', 'basic-information-item', 2),
+                                    ('div', 'basic-information-item__data--value')]),
+            },
+            # other general info in div class 'general-information-data'
+            Each(('div', 'general-information-data', EACH),
+                 Entry(Text(('div', 'general-information-data__label')), Text(('div', 'general-information-data__value')))),
+        ),
+        'tags': {
+            'job_tags': Texts([('div', 'job-tags'), ('a', None, EACH)]),
+            'related_tags': Each(
+                ('div', ['premium-job-related-tags__section', 'premium-job-related-tags__section box-category collapsed'], EACH),
+                Entry(Text(('h2', 'premium-job-box__title')), Texts((None, 'tag-item', EACH))),
+            ),
+        },
+    }
+    EXTRACTOR = Extractor(SPEC, root=SUBTREES[0])
+
+    def __init__(self, url, fetcher=None, session=None, parser='html.parser', subtree_only=True, typed=False, metrics=None):
         self.url = url.split('?')[0]
+        self.parser = parser
+        self.subtree_only = subtree_only
+        # scrape() returns a JobRecord instead of the dict of extract_all()
+        self.typed = typed
+        # stage timers: parse, collect, each extract_*, normalize, fingerprint (see metrics.py)
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.fetcher = fetcher
+        self.session = session
         self.soup = None
         self.job = None
+        self.matches = None
+
+    def get_fetcher(self):
+        # created on first fetch so scrapers that only parse (dispatcher, parser processes) never open a session,
+        # and shared by the scrapers of one session instead of one fetcher (and its worker threads) per scraper
+        if self.fetcher is None:
+            self.fetcher = get_default_fetcher(self.session)
+        return self.fetcher
 
     def fetch(self):
-        headers = {
-            'User-Agent': ['Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
-                        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:54.0) Gecko/20100101 Firefox/54.0',
-                        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_6) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/11.1 Safari/605.1.15',
-                        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/61.0.3163.100 Safari/537.36']
-            }
-        response = requests.get(self.url, headers={'User-Agent': random.choice(headers['User-Agent'])})
-
-        # handle request failure
-        if response.status_code != 200:
-            for i in range(5):
-                print('Failed to retrieve: ' + self.url)
-                print('Will retry after 60s...')
-                time.sleep(60)
-                response = requests.get(self.url)
-                if response.status_code == 200:
-                    break
-
-            if response.status_code != 200:
-                print('Failed to retrieve after 5 retries: ' + self.url)
-                return None
-            
-        return response.content
+        return self.get_fetcher().fetch_sync(self.url)
+
+    async def afetch(self):
+        return await self.get_fetcher().fetch(self.url)
     
-    def load(self):
-        response_content = self.fetch()
+    def load(self, response_content=None):
+        if response_content is None:
+            response_content = self.fetch()
+        if response_content == NOT_MODIFIED:
+            print('Page not modified since last run: ' + self.url)
+            return None
         if response_content is None:
             print('Failed to load page content: ' + self.url)
             return None
         
-        self.soup = BeautifulSoup(response_content, "html.parser")
+        with self.metrics.timer('parse'):
+            soup = parse(response_content, self.parser, self.SUBTREES if self.subtree_only else None)
+        return self.load_soup(soup)
+
+    def load_soup(self, soup):
+        self.soup = soup
         self.job = self.soup.find('div', class_='premium-job')
 
         if self.job is None:
             print('Job detail not found: ' + self.url)
+            self.metrics.error('parse', 'job_detail_not_found')
             return False
         
         return True
     
+    def collect(self):
+        # every node SPEC reads, found in one walk over the page (see extractor.py), shared by the extract_* methods
+        if self.matches is None:
+            self.matches = self.EXTRACTOR.collect(self.soup)
+        return self.matches
+
     def extract_jd(self):
-        jd = {}
-        boxes = self.job.find_all('div', class_='premium-job-description__box')
-        for box in boxes:
-            label = box.find('h2').get_text(strip=True)
-            if box.find_all('li'):
-                content = "\n".join([c.get_text(strip=True) for c in box.find_all('li')])
-            else:
-                content = box.find('div').get_text(strip=True, separator='\n')
-
-            jd[label] = content
-        return jd
-    
+        return self.EXTRACTOR.build('jd', self.collect())
+
     def extract_general_info(self):
-        general_info = {}
-
-        job_title = self.job.find('h2', class_='premium-job-basic-information__content--title').get_text(strip=True)
-        general_info['job_title'] = job_title
-
-        info_sections = self.job.find('div', class_='premium-job-basic-information__content--sections').find_all('div', class_="basic-information-item")
-        salary = info_sections[0].find('div', class_='basic-information-item__data--value').get_text(strip=True)
-        location = info_sections[1].find('div', class_='basic-information-item__data--value').get_text(strip=True)
-        exp = info_sections[2].find('div', class_='basic-information-item__data--value').get_text(strip=True)
-        general_info['salary'] = salary
-        general_info['location'] = location
-        general_info['experience'] = exp
-
-        # other general info in div class 'general-information-data'
-        general_info_data = self.job.find_all('div', class_='general-information-data')
-        for data in general_info_data:
-            label = data.find('div', class_='general-information-data__label').get_text(strip=True)
-            value = data.find('div', class_='general-information-data__value').get_text(strip=True)
-            general_info[label] = value
-        
-        return general_info
-    
-    def extract_tags(self):
-        tags = {}
+        return self.EXTRACTOR.build('general_info', self.collect())
 
-        job_tags = [tag.get_text(strip=True) for tag in self.job.find('div', class_='job-tags').find_all('a')]
-        tags['job_tags'] = job_tags
-        
-        related_tags = {}
-        divs = self.job.find_all('div', class_=["premium-job-related-tags__section", "premium-job-related-tags__section box-category collapsed"])
-        for section in divs:
-            title = section.find('h2', class_='premium-job-box__title').get_text(strip=True)
-            items = [tag.get_text(strip=True) for tag in section.find_all(class_='tag-item')]
-            related_tags[title] = items
-        tags['related_tags'] = related_tags
-
-        return tags
-    
-    def scrape(self):
-        if not self.load():
-            return None
-        
-        general_info = self.extract_general_info()
-        jd = self.extract_jd()
-        tags = self.extract_tags()
+    def extract_tags(self):
+        return self.EXTRACTOR.build('tags', self.collect())
 
-        return {
-            '_id': url_to_id_short(self.url),
+    def scrape(self, response_content=None):
+        # the tree is freed even when an extraction fails on an unexpected layout
+        try:
+            if not self.load(response_content):
+                return None
+            return self.extract_record() if self.typed else self.extract_all()
+        finally:
+            self.release()
+
+    def scrape_soup(self, soup):
+        """scrape from a document that was already fetched and parsed (e.g. by the dispatcher)"""
+        try:
+            if not self.load_soup(soup):
+                return None
+            return self.extract_record() if self.typed else self.extract_all()
+        finally:
+            self.release()
+
+    def release(self):
+        # free the parsed tree as soon as the record is built instead of waiting for the garbage collector
+        if self.soup is not None:
+            self.soup.decompose()
+        self.soup = None
+        self.job = None
+        self.matches = None
+
+    def extract_all(self):
+        with self.metrics.timer('collect'):
+            self.collect()
+        with self.metrics.timer('extract_general_info'):
+            general_info = self.extract_general_info()
+        with self.metrics.timer('extract_jd'):
+            jd = self.extract_jd()
+        with self.metrics.timer('extract_tags'):
+            tags = self.extract_tags()
+
+        record = {
+            '_id': job_id(self.url),
             'date': (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'),
             'url': self.url,
             'general_info': general_info,
             'job_description': jd,
             'tags': tags
         }
+        # salary_min / salary_max / currency / exp_min_years, parsed from the raw strings (see normalize.py)
+        with self.metrics.timer('normalize'):
+            record.update(normalize_record(record))
+        # fingerprint of the text for near-duplicate detection (see dedupe.py)
+        with self.metrics.timer('fingerprint'):
+            record['simhash'] = fingerprint(record)
+        return record
+
+    def extract_record(self):
+        """same data as extract_all(), as a JobRecord with the labels mapped to its fields (see records.py)"""
+        return from_premium(self.extract_all())
+
+    async def ascrape(self):
+        response_content = await self.afetch()
+        if response_content is None:
+            print('Failed to load page content: ' + self.url)
+            return None
+        return self.scrape(response_content)
 
 # # Example usage:
 # if __name__ == "__main__":
@@ -0,0 +1,173 @@
+import json
+import mmap
+import os
+import sys
+import threading
+import zlib
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # zlib is used instead, see HtmlArchive
+    zstandard = None
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parsers import decode_body
+
+
+class HtmlArchive:
+    """
+    append-only archive of the raw pages the fetcher downloaded, so selectors can be re-run without crawling again
+    directory layout:
+        segment-00000.bin ...  compressed pages written back to back, a new segment every segment_size bytes
+        index.jsonl            one line per page: url, segment, offset, length, codec, content_type, fetched_at
+    every page is compressed on its own (zstd if the zstandard package is installed, zlib otherwise),
+    so any page can be read through the index without touching the rest of its segment
+    the last entry of a url wins, pages are never rewritten
+    """
+
+    INDEX = 'index.jsonl'
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024, level=None):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.codec = 'zstd' if zstandard is not None else 'zlib'
+        self.level = level if level is not None else (10 if self.codec == 'zstd' else 6)
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.index = self.load_index()
+        self.segment = max((entry['segment'] for entry in self.index.values()), default=0)
+        self.maps = {}
+
+    def load_index(self):
+        index = {}
+        path = os.path.join(self.directory, self.INDEX)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        index[entry['url']] = entry
+        return index
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f'segment-{segment:05d}.bin')
+
+    def compress(self, content):
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level).compress(content)
+        return zlib.compress(content, self.level)
+
+    @staticmethod
+    def decompress(data, codec):
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ImportError("this archive holds zstd pages, install zstandard: pip install zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def write(self, url, content, content_type=None):
+        """append the raw body (bytes) of url"""
+        data = self.compress(content)
+        with self.lock:
+            path = self.segment_path(self.segment)
+            if os.path.exists(path) and os.path.getsize(path) + len(data) > self.segment_size:
+                self.segment += 1
+                path = self.segment_path(self.segment)
+
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+
+            entry = {
+                'url': url,
+                'segment': self.segment,
+                'offset': offset,
+                'length': len(data),
+                'codec': self.codec,
+                'content_type': content_type,
+                'fetched_at': datetime.utcnow().isoformat(),
+            }
+            # the index line goes after the data, so an entry never points at a page that is not on disk
+            with open(os.path.join(self.directory, self.INDEX), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.index[url] = entry
+
+    def view(self, segment, end):
+        # read-only memory map of a segment, mapped again when the segment grew past the mapped size
+        with self.lock:
+            mm = self.maps.get(segment)
+            if mm is None or len(mm) < end:
+                if mm is not None:
+                    mm.close()
+                with open(self.segment_path(segment), 'rb') as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps[segment] = mm
+            return mm
+
+    def read(self, url):
+        """raw body and content type of url, None if it is not in the archive"""
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        end = entry['offset'] + entry['length']
+        data = self.view(entry['segment'], end)[entry['offset']:end]
+        return self.decompress(data, entry['codec']), entry['content_type']
+
+    def urls(self):
+        return list(self.index)
+
+    def __contains__(self, url):
+        return url in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        with self.lock:
+            for mm in self.maps.values():
+                mm.close()
+            self.maps = {}
+
+
+def archive_dirs(path):
+    """path itself if it is an archive, else its archive subdirectories (e.g. shard-<n> of the sharded DAG)"""
+    if os.path.exists(os.path.join(path, HtmlArchive.INDEX)):
+        return [path]
+    return sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if os.path.exists(os.path.join(path, name, HtmlArchive.INDEX))
+    )
+
+
+class ArchiveFetcher:
+    """
+    stands in for AsyncFetcher in replay mode: pages are read from an HtmlArchive, nothing goes to the network
+    so scrape_jobs() / run_pipeline() re-extract archived pages at parse speed
+    """
+
+    def __init__(self, archive, max_in_flight=8):
+        self.archive = archive
+        self.max_in_flight = max_in_flight
+
+    def urls(self):
+        return self.archive.urls()
+
+    async def fetch(self, url, track=True, defer=False):
+        page = self.archive.read(url.split('?')[0])
+        if page is None:
+            print('Not in archive: ' + url)
+            return None
+        content, content_type = page
+        return decode_body(content, content_type)
+
+    def confirm(self, url):
+        pass
+
+    def close(self):
+        self.archive.close()
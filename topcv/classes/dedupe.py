@@ -0,0 +1,138 @@
+import hashlib
+import re
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from normalize import fold
+from records import flatten
+
+
+SIMHASH_BITS = 64
+# two postings whose fingerprints differ in at most this many bits are the same job: a repost with 1% of its words
+# changed is within 6 bits 99% of the time, two different jobs of one company are 11+ bits apart
+# (see benchmarks/dedupe_check.py)
+MAX_DISTANCE = 6
+# word n-grams of the text: a reworded sentence changes a few of them, another job most of them
+SHINGLE_SIZE = 3
+TEXT_FIELDS = ('description', 'requirements', 'benefits', 'income', 'working_time', 'how_to_apply')
+
+TOKEN = re.compile(r'[a-z0-9+#]+')
+# bytes.translate tables: byte => its bit k (0 or 1)
+BIT_OF_BYTE = [bytes((byte >> k) & 1 for byte in range(256)) for k in range(8)]
+
+
+def features(doc):
+    """flat document => set of features: the words of the title and the word 3-grams of its job description"""
+    title = TOKEN.findall(fold(doc.get('title') or ''))
+    words = TOKEN.findall(fold('\n'.join(doc.get(name) or '' for name in TEXT_FIELDS)))
+    shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    return shingles | {'title:' + word for word in title}
+
+def simhash(feature_set):
+    """
+    64-bit SimHash: bit i is set when most features have bit i set in their own hash, so similar feature sets get
+    fingerprints a few bits apart
+    """
+    if not feature_set:
+        return 0
+    digests = b''.join(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest() for feature in feature_set)
+    half = len(feature_set) / 2
+    value = 0
+    # byte j of every hash is digests[j::8]: one translate + count per bit counts it over all the features in C
+    for j in range(8):
+        column = digests[j::8]
+        for k in range(8):
+            if column.translate(BIT_OF_BYTE[k]).count(1) > half:
+                value |= 1 << (SIMHASH_BITS - 8 * j - 8 + k)
+    return value
+
+def fingerprint(record):
+    """record of any shape => SimHash of its title and job description as 16 hex digits (stored as `simhash`)"""
+    return format(simhash(features(flatten(record))), '016x')
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+def dedupe_key(doc):
+    # only postings of the same company at the same place are compared: a company's template
+    # for several cities is several jobs
+    return fold((doc.get('company') or {}).get('name') or ''), fold(doc.get('location') or '')
+
+
+class DuplicateIndex:
+    """
+    input: records (scraped, or stored documents loaded with load())
+    output: for a new record, the _id of an earlier job it is a near duplicate of (repost, cross-listing), or None
+    flow: SimHash of title + job description (`simhash`, set by the scrapers) => split into max_distance + 1 bands
+          => buckets keyed on (company, location, band number, band bits) => the jobs sharing a bucket are the candidates:
+          two fingerprints at most max_distance bits apart agree on at least one whole band => exact bit distance
+    a record whose _id is indexed already is an update of that job, never a duplicate
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width = SIMHASH_BITS // bands
+        # (shift, mask) of each band, the last one takes the bits left over
+        self.bands = [(i * width, (1 << (width if i < bands - 1 else SIMHASH_BITS - i * width)) - 1) for i in range(bands)]
+        self.buckets = {}
+        self.fingerprints = {}
+        self.counts = {'indexed': 0, 'checked': 0, 'duplicates': 0}
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def keys(self, key, value):
+        return [(key, i, (value >> shift) & mask) for i, (shift, mask) in enumerate(self.bands)]
+
+    def add(self, job_id, value, key=('', '')):
+        if job_id in self.fingerprints:
+            return
+        self.fingerprints[job_id] = value
+        for bucket in self.keys(key, value):
+            self.buckets.setdefault(bucket, []).append(job_id)
+        self.counts['indexed'] += 1
+
+    def find(self, value, key=('', '')):
+        """nearest indexed job within max_distance bits (the first indexed on a tie), None if there is none"""
+        best, best_distance = None, self.max_distance + 1
+        for bucket in self.keys(key, value):
+            for job_id in self.buckets.get(bucket, ()):
+                d = distance(value, self.fingerprints[job_id])
+                if d < best_distance:
+                    best, best_distance = job_id, d
+        return best
+
+    def check(self, record):
+        """_id of the job the record duplicates, or None after indexing the record as a job of its own"""
+        doc = flatten(record)
+        self.counts['checked'] += 1
+        if doc['_id'] in self.fingerprints or not doc.get('simhash'):
+            return None
+        value, key = int(doc['simhash'], 16), dedupe_key(doc)
+        original = self.find(value, key)
+        if original is not None:
+            self.counts['duplicates'] += 1
+            return original
+        self.add(doc['_id'], value, key)
+        return None
+
+    def load(self, coll, since=None, batch_size=1000):
+        """index the stored jobs (scraped since `since`, all of them if None), only the fields the key needs are read"""
+        query = {'simhash': {'$exists': True}}
+        if since is not None:
+            query['_scraped_at'] = {'$gte': since}
+        # tags tell a premium document from a brand one (see records.from_scraped)
+        projection = ['url', 'kind', 'simhash', 'title', 'location', 'company', 'company_info', 'job_info', 'general_info', 'tags']
+        for doc in coll.find(query, projection, batch_size=batch_size):
+            doc = flatten(doc)
+            self.add(doc['_id'], int(doc['simhash'], 16), dedupe_key(doc))
+        return len(self)
+
+    def stats(self):
+        return dict(self.counts, buckets=len(self.buckets))
@@ -0,0 +1,84 @@
+import re
+import sys
+import os
+from urllib.parse import urlparse
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from NormalJobScraper import NormalJobScraper
+from PremiumJobScraper import PremiumJobScraper
+from BrandJobScraper import BrandJobScraper
+from parsers import parse
+from fetcher import NOT_MODIFIED
+from metrics import NULL_METRICS
+
+
+# /viec-lam/<slug>/<job id>.html
+NORMAL_URL = re.compile(r'^/viec-lam/[^/]+/\d+\.html$')
+# /brand/<company>/tuyen-dung/<slug>-j<job id>.html
+BRAND_URL = re.compile(r'^/brand/[^/]+/tuyen-dung/[^/]+-j\d+\.html$')
+
+SCRAPERS = {
+    'normal': NormalJobScraper,
+    'premium': PremiumJobScraper,
+    'brand': BrandJobScraper,
+}
+
+# union of the parts every scraper reads, it also holds the DOM signatures used by classify()
+SUBTREES = [subtree for scraper in SCRAPERS.values() for subtree in scraper.SUBTREES]
+
+
+def classify_url(url):
+    path = urlparse(url).path
+    if NORMAL_URL.match(path):
+        return 'normal'
+    if BRAND_URL.match(path):
+        return 'brand'
+    return None
+
+def classify(url, soup):
+    """
+    return page type ('normal', 'premium', 'brand') or None
+    the url pattern gives the family, the DOM signature tells premium from normal brand pages
+    and is used alone for urls with an unknown pattern
+    """
+    kind = classify_url(url)
+    if kind == 'normal':
+        return kind
+
+    if soup.find('div', class_='premium-job'):
+        return 'premium'
+    if kind == 'brand' or soup.find('div', class_='block-left'):
+        return 'brand'
+    if soup.find('div', class_='job-detail__body'):
+        return 'normal'
+    return None
+
+def dispatch(url, response_content, fetcher=None, parser='html.parser', subtree_only=True, typed=False, metrics=None):
+    """
+    parse the page once and hand the document to the scraper for its type (typed: a JobRecord instead of a dict)
+    metrics: Metrics the parse and extract_* stages are timed into (see metrics.py)
+    """
+    metrics = metrics if metrics is not None else NULL_METRICS
+    with metrics.timer('parse'):
+        soup = parse(response_content, parser, SUBTREES if subtree_only else None)
+    kind = classify(url, soup)
+    if kind is None:
+        print(f"No scraper for URL {url}")
+        metrics.error('parse', 'no_scraper')
+        return None
+
+    scraper = SCRAPERS[kind](url, fetcher, parser=parser, subtree_only=subtree_only, typed=typed, metrics=metrics)
+    return scraper.scrape_soup(soup)
+
+async def adispatch(url, fetcher, parser='html.parser', typed=False, metrics=None):
+    response_content = await fetcher.fetch(url)
+    if response_content == NOT_MODIFIED:
+        return NOT_MODIFIED
+    if response_content is None:
+        print('Failed to load page content: ' + url)
+        return None
+    return dispatch(url, response_content, fetcher, parser, typed=typed, metrics=metrics)
@@ -0,0 +1,393 @@
+from bs4 import Tag
+
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parsers import LexborNode
+
+
+# Step index: every match inside the previous node (find_all) instead of one of them (find)
+EACH = slice(None)
+
+
+class Step:
+    """
+    one find() of a chain, relative to the node the previous step matched
+    name / class_: as in bs4 find(name, class_=...): a string, a list of alternatives or None for any,
+                   a class with spaces is the whole class attribute, otherwise one of its classes
+    index: the n-th match in document order (0 = find), EACH = all of them (find_all)
+    optional: a node without this match is skipped instead of failing the page
+    unless: path, a match with a node at this path inside it is dropped
+    after: the first tag after the previous node in document order instead of inside it (bs4 find_next)
+    first_class: the match is dropped unless this is the first class of its class attribute
+    in a spec, a step can also be written 'h3', ('div', 'job-tags') or ('div', 'box-info', EACH)
+    """
+
+    __slots__ = ('name', 'class_', 'index', 'optional', 'unless', 'after', 'first_class')
+
+    def __init__(self, name=None, class_=None, index=0, optional=False, unless=None, after=False, first_class=None):
+        self.name = name
+        self.class_ = class_
+        self.index = index
+        self.optional = optional
+        self.unless = unless
+        self.after = after
+        self.first_class = first_class
+
+    def key(self):
+        unless = tuple(step.key() for step in path(self.unless)) if self.unless is not None else None
+        index = 'each' if self.index == EACH else self.index
+        return (names(self.name), names(self.class_), index, self.optional, unless, self.after, self.first_class)
+
+    def __repr__(self):
+        tag = '|'.join(names(self.name) or ['*'])
+        classes = '|'.join(names(self.class_) or [])
+        return f"{tag}.{classes}" if classes else tag
+
+
+def names(value):
+    if value is None:
+        return None
+    return tuple(value) if isinstance(value, (list, tuple)) else (value,)
+
+def path(spec):
+    """Step, 'name', (name, class_[, index]) or a list of them => list of Steps ([] = the node itself)"""
+    if spec is None:
+        return []
+    if isinstance(spec, Step):
+        return [spec]
+    if isinstance(spec, str):
+        return [Step(spec)]
+    if isinstance(spec, tuple):
+        return [Step(*spec)]
+    return [step for item in spec for step in path(item)]
+
+
+# value specs: what a page part is made of, relative to the node of the enclosing spec
+
+class Text:
+    """get_text(strip=True, separator=separator) of the node at path, formatted with format"""
+
+    def __init__(self, path=None, separator='', format='{}'):
+        self.path, self.separator, self.format = path, separator, format
+
+class Texts:
+    """
+    list of the get_text(strip=True) of every node at path (its last step is EACH), joined with join if given
+    fallback: spec used when the path matches nothing
+    """
+
+    def __init__(self, path, join=None, format='{}', fallback=None):
+        self.path, self.join, self.format, self.fallback = path, join, format, fallback
+
+class Join:
+    """spec of every node at path, concatenated with separator"""
+
+    def __init__(self, path, spec, separator=''):
+        self.path, self.spec, self.separator = path, spec, separator
+
+class ByTag:
+    """spec picked by the tag name of the node, default for other tags"""
+
+    def __init__(self, specs, default=''):
+        self.specs, self.default = specs, default
+
+class Entry:
+    """{key: value} of the node, {} when the path `when` matches nothing inside it"""
+
+    def __init__(self, key, value, when=None):
+        self.key, self.value, self.when = key, value, when
+
+class Each:
+    """dict specs of every node at path merged in document order, like dict assignments in a loop"""
+
+    def __init__(self, path, spec):
+        self.path, self.spec = path, spec
+
+class Merge:
+    """dict specs merged in order"""
+
+    def __init__(self, *specs):
+        self.specs = specs
+
+class Within:
+    """spec relative to the node at path"""
+
+    def __init__(self, path, spec):
+        self.path, self.spec = path, spec
+
+
+class Target:
+    # a compiled step: tag name and class tests, the targets searched inside its matches
+    __slots__ = ('step', 'index', 'tokens', 'wholes', 'children', 'by_name', 'any_name', 'after', 'unless')
+
+    def __init__(self, step):
+        self.step = step
+        self.index = step.index if step is not None else 0
+        classes = names(step.class_) if step is not None else None
+        self.tokens = {c for c in classes if ' ' not in c.strip()} if classes else None
+        self.wholes = {c for c in classes if ' ' in c.strip()} if classes else None
+        self.children = {}
+        self.by_name = {}
+        self.any_name = []
+        self.after = []
+        self.unless = None
+
+    def child(self, step):
+        key = step.key()
+        target = self.children.get(key)
+        if target is None:
+            target = self.children[key] = Target(step)
+            if step.after:
+                self.after.append(target)
+            elif step.name is None:
+                self.any_name.append(target)
+            else:
+                for name in names(step.name):
+                    self.by_name.setdefault(name, []).append(target)
+            if step.unless is not None:
+                target.unless = chain(target, step.unless)
+        return target
+
+    def accepts(self, classes):
+        if self.tokens is None:
+            return True
+        if not classes:
+            return False
+        if self.wholes and ' '.join(classes) in self.wholes:
+            return True
+        return not self.tokens.isdisjoint(classes)
+
+    def keep(self, match):
+        step = self.step
+        if step.first_class is not None and ((match.node.get('class') or [None])[0]) != step.first_class:
+            return False
+        return self.unless is None or not resolve([match], self.unless, required=False)
+
+
+class Match:
+    # a node matched by a target, and what the targets inside it matched
+    __slots__ = ('node', 'target', 'found', 'counts')
+
+    def __init__(self, node, target):
+        self.node = node
+        self.target = target
+        self.found = {}
+        self.counts = None
+
+
+def chain(scope, spec):
+    targets = []
+    for step in path(spec):
+        scope = scope.child(step)
+        targets.append(scope)
+    return targets
+
+def resolve(matches, targets, required=True):
+    """matches of the last target of the chain inside the given matches, in document order"""
+    for target in targets:
+        found = []
+        for match in matches:
+            children = match.found.get(target)
+            if not children:
+                if required and target.index != EACH and not target.step.optional:
+                    raise LookupError(f"{target.step!r} not found")
+                continue
+            found.extend(child for child in children if target.keep(child))
+        matches = found
+    return matches
+
+
+def compile_spec(spec, scope):
+    """spec => function(match) => value, the steps it reads are added as targets under scope"""
+    if isinstance(spec, dict):
+        builders = [(key, compile_spec(value, scope)) for key, value in spec.items()]
+        return lambda match: {key: build(match) for key, build in builders}
+
+    if isinstance(spec, Text):
+        targets, separator, format = chain(scope, spec.path), spec.separator, spec.format
+        def text(match):
+            return format.format(resolve([match], targets)[0].node.get_text(strip=True, separator=separator))
+        return text
+
+    if isinstance(spec, Texts):
+        targets, format, join = chain(scope, spec.path), spec.format, spec.join
+        fallback = compile_spec(spec.fallback, scope) if spec.fallback is not None else None
+        def texts(match):
+            values = [format.format(m.node.get_text(strip=True)) for m in resolve([match], targets)]
+            if not values and fallback is not None:
+                return fallback(match)
+            return join.join(values) if join is not None else values
+        return texts
+
+    if isinstance(spec, Join):
+        targets = chain(scope, spec.path)
+        item, separator = compile_spec(spec.spec, targets[-1]), spec.separator
+        return lambda match: separator.join(item(m) for m in resolve([match], targets))
+
+    if isinstance(spec, ByTag):
+        specs, default = {name: compile_spec(value, scope) for name, value in spec.specs.items()}, spec.default
+        def by_tag(match):
+            build = specs.get(match.node.name)
+            return build(match) if build is not None else default
+        return by_tag
+
+    if isinstance(spec, Entry):
+        key, value = compile_spec(spec.key, scope), compile_spec(spec.value, scope)
+        when = chain(scope, spec.when) if spec.when is not None else None
+        def entry(match):
+            if when is not None and not resolve([match], when, required=False):
+                return {}
+            return {key(match): value(match)}
+        return entry
+
+    if isinstance(spec, Each):
+        targets = chain(scope, spec.path)
+        item = compile_spec(spec.spec, targets[-1])
+        def each(match):
+            merged = {}
+            for m in resolve([match], targets):
+                merged.update(item(m))
+            return merged
+        return each
+
+    if isinstance(spec, Merge):
+        builders = [compile_spec(value, scope) for value in spec.specs]
+        def merge(match):
+            merged = {}
+            for build in builders:
+                merged.update(build(match))
+            return merged
+        return merge
+
+    if isinstance(spec, Within):
+        targets = chain(scope, spec.path)
+        inner = compile_spec(spec.spec, targets[-1])
+        return lambda match: inner(resolve([match], targets)[0])
+
+    raise TypeError(f"not an extraction spec: {spec!r}")
+
+
+def bs4_children(node):
+    for child in node.contents:
+        if isinstance(child, Tag):
+            yield child, child.name, child.attrs.get('class')
+
+def lexbor_children(node):
+    for child in node.node.iter(include_text=False):
+        if not child.tag.startswith('-'):
+            yield LexborNode(child), child.tag, (child.attributes.get('class') or '').split()
+
+
+def offer(match, target, node, pending):
+    """node matched target inside match: a new Match unless it is not the wanted one (index)"""
+    index = target.index
+    if index == 0:
+        if target in match.found:
+            return None
+        new = Match(node, target)
+        match.found[target] = [new]
+    elif index == EACH:
+        new = Match(node, target)
+        match.found.setdefault(target, []).append(new)
+    else:
+        if match.counts is None:
+            match.counts = {}
+        seen = match.counts.get(target, 0)
+        match.counts[target] = seen + 1
+        if seen != index:
+            return None
+        new = Match(node, target)
+        match.found[target] = [new]
+    # steps after this node take the next matching tags of the walk, its own descendants first
+    for after in target.after:
+        pending.append((new, after))
+    return new
+
+def walk(node, active, children, pending):
+    """
+    visit every tag under node once, in document order: each one is tested against the targets of the matches
+    it is inside (active), and becomes active itself for its descendants when it matches
+    """
+    for child, name, classes in children(node):
+        opened = None
+        if pending:
+            for item in list(pending):
+                match, target = item
+                if (target.step.name is None or name in names(target.step.name)) and target.accepts(classes):
+                    pending.remove(item)
+                    new = offer(match, target, child, pending)
+                    if new is not None and (target.by_name or target.any_name):
+                        opened = (opened or []) + [new]
+        for match in active:
+            target = match.target
+            candidates = target.by_name.get(name)
+            if candidates is None and not target.any_name:
+                continue
+            for child_target in (candidates or ()) if not target.any_name else (candidates or []) + target.any_name:
+                if child_target.accepts(classes):
+                    new = offer(match, child_target, child, pending)
+                    # only matches with targets inside them are searched in
+                    if new is not None and (child_target.by_name or child_target.any_name):
+                        opened = (opened or []) + [new]
+        walk(child, active + opened if opened else active, children, pending)
+
+
+class Extractor:
+    """
+    input: spec of the parts of a page ({part name: spec}, see Text / Texts / Each / Entry...), root of the parts
+    output: collect(soup) finds every node the spec reads in one walk over the page, build(part, collected)
+            turns them into the part's value (the dict / list / string the scraper returns)
+    flow: spec compiled once into targets (tag name + class tests, nested like the find() chains they replace)
+          => collect(): the root node (root step, or the step of a part that is Within(step, ...)) is looked up
+          with find(), then every tag under it is visited once and matched against the targets of the nodes
+          it is inside => build(): the part's spec reads what was matched, no more searching in the tree
+    a missing node raises LookupError unless its step is optional or EACH, as the find() chain failed before
+    works on the trees of every backend of parsers.parse() (bs4 and the lexbor wrapper)
+    """
+
+    def __init__(self, spec, root=None):
+        # root key => (root step or None for the whole document, root target)
+        self.roots = {}
+        self.parts = {}
+        for part, value in spec.items():
+            step = path(root)[0] if root is not None else None
+            if isinstance(value, Within) and len(path(value.path)) == 1:
+                step, value = path(value.path)[0], value.spec
+            key = step.key() if step is not None else None
+            if key not in self.roots:
+                self.roots[key] = (step, Target(None))
+            self.parts[part] = (key, compile_spec(value, self.roots[key][1]))
+
+    def collect(self, soup):
+        children = lexbor_children if isinstance(soup, LexborNode) else bs4_children
+        collected = {}
+        for key, (step, target) in self.roots.items():
+            node = soup.find(step.name, class_=step.class_) if step is not None else soup
+            if node is None:
+                collected[key] = None
+                continue
+            match = collected[key] = Match(node, target)
+            pending = []
+            walk(node, [match], children, pending)
+            # a tag after the end of the root: looked up in the tree, its own descendants are not collected
+            for parent, after in pending:
+                found = parent.node.find_next(after.step.name, class_=after.step.class_)
+                if found is not None:
+                    offer(parent, after, found, [])
+        return collected
+
+    def build(self, part, collected):
+        key, builder = self.parts[part]
+        if collected[key] is None:
+            raise LookupError(f"root of {part} not found")
+        return builder(collected[key])
+
+    def extract(self, soup):
+        collected = self.collect(soup)
+        return {part: self.build(part, collected) for part in self.parts}
@@ -0,0 +1,322 @@
+import asyncio
+import hashlib
+import heapq
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+
+from session import get_default_session
+from parsers import decode_body
+from metrics import NULL_METRICS
+
+
+# returned by fetch() instead of the page text when the page is the same as at the last run:
+# 304 Not Modified on a conditional request, or a 200 whose body hash matches the stored one
+# (a string compared with ==, so it is the same whether this module is imported as fetcher or classes.fetcher)
+NOT_MODIFIED = '<not modified>'
+# returned by fetch(url, defer=True) when the url failed and waits on the fetcher's RetryQueue
+RETRY_LATER = '<retry later>'
+
+# other 4xx answers will not change by asking again
+RETRYABLE_STATUS = {408, 425, 429}
+
+
+class TokenBucket:
+    """
+    token bucket for one host
+    rate: tokens added per second, capacity: max burst of requests sent back to back
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # take one token (can go negative) and return how long the caller must wait before using it
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+
+def canonical_url(url):
+    return url.split('?')[0]
+
+def conditional_headers(entry):
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+class RetryQueue:
+    """
+    deferred retries: a failed url waits here until its retry time without holding a fetch slot,
+    while the rest of the crawl keeps going (see pipeline.stream)
+    budget: seconds after the first failure during which retries can be scheduled, caps the time a run spends retrying
+    """
+
+    def __init__(self, budget=600):
+        self.budget = budget
+        self.deadline = None
+        self.heap = []
+
+    def allow(self, delay):
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now + self.budget
+        return now + delay <= self.deadline
+
+    def push(self, url, delay):
+        heapq.heappush(self.heap, (time.monotonic() + delay, url))
+
+    async def next(self):
+        # wait for the earliest due url (polled, retry delays are seconds to minutes)
+        while True:
+            if self.heap and self.heap[0][0] <= time.monotonic():
+                return heapq.heappop(self.heap)[1]
+            wait = self.heap[0][0] - time.monotonic() if self.heap else 1.0
+            await asyncio.sleep(min(max(wait, 0), 1.0))
+
+    def __len__(self):
+        return len(self.heap)
+
+
+def retry_after(response):
+    """seconds asked by a Retry-After header (delay or HTTP date), None if there is none"""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncFetcher:
+    """
+    input: urls of topcv pages
+    output: page text of each url (decoded with its declared charset), None if the page could not be retrieved,
+            NOT_MODIFIED if a page cache is used and the page did not change since it was last scraped
+    flow: wait for a token of the url's host => GET on the pooled session in a worker thread (max_in_flight threads) => retry if failed
+    retries: exponential backoff from retry_delay up to max_retry_delay with jitter, or the server's Retry-After,
+             at most max_retries per url and only within retry_budget seconds of the first failure of the run
+             urls that still fail are listed in self.failed
+    metrics: Metrics timing listing_fetch / detail_fetch (the request only) and rate_limit_wait, counting bytes and
+             errors by type (http_<status> or the exception class), see metrics.py
+    """
+
+    def __init__(self, session=None, max_in_flight=4, rate_per_host=1.0, burst=2, timeout=30, max_retries=5, retry_delay=10,
+                 max_retry_delay=300, retry_budget=600, archive=None, metrics=None):
+        self.session = session if session is not None else get_default_session()
+        # HtmlArchive every downloaded page is appended to, for replay (see archive.py)
+        self.archive = archive
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.max_in_flight = max_in_flight
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.retries = RetryQueue(retry_budget)
+        self.attempts = {}
+        self.failed = []
+
+        # the thread pool size is the limit of in-flight requests, shared by sync and async callers
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='fetcher')
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+
+        # page cache (see use_cache), validators are only saved for pages confirmed as scraped
+        self.cache = None
+        self.validators = {}
+        self.pending = {}
+        self.confirmed = {}
+        self.counts = {'downloaded': 0, 'bytes_downloaded': 0, 'not_modified': 0, 'unchanged': 0,
+                       'bytes_not_downloaded': 0, 'bytes_not_parsed': 0}
+
+    def bucket(self, url):
+        host = urlparse(url).netloc
+        with self.buckets_lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+            return self.buckets[host]
+
+    def use_cache(self, cache, urls=()):
+        """
+        send conditional requests for urls scraped at an earlier run and skip the pages that did not change
+        cache: PageCache / FilePageCache (see storage.py), its validators for `urls` are loaded in one go
+        """
+        self.cache = cache
+        self.validators = {}
+        self.load_validators(urls)
+
+    def load_validators(self, urls):
+        # urls known batch by batch (leased from a frontier, see frontier.FrontierFeed): one query per batch
+        if self.cache is not None and urls:
+            self.validators.update(self.cache.load({canonical_url(url) for url in urls}))
+
+    def confirm(self, url):
+        # the page was scraped, its validators can be used at the next run
+        key = canonical_url(url)
+        if key in self.pending:
+            self.confirmed[key] = self.pending.pop(key)
+
+    def save_cache(self):
+        # call once the confirmed records are stored, so a failed write never hides a page at the next run
+        if self.cache is not None:
+            self.cache.save(self.confirmed)
+        self.confirmed = {}
+
+    def stats(self):
+        return dict(self.counts)
+
+    def get(self, url, headers=None):
+        return self.session.get(url, timeout=self.timeout, headers=headers)
+
+    async def request(self, url, headers=None, stage='detail_fetch'):
+        delay = self.bucket(url).reserve()
+        if delay > 0:
+            self.metrics.observe('rate_limit_wait', delay)
+            await asyncio.sleep(delay)
+
+        loop = asyncio.get_event_loop()
+        # the timer sees the network time only, the wait for a token is rate_limit_wait
+        with self.metrics.timer(stage):
+            return await loop.run_in_executor(self.executor, self.get, url, headers)
+
+    def backoff(self, attempt, response):
+        # Retry-After wins, otherwise exponential backoff with jitter so failed urls do not come back all at once
+        delay = retry_after(response)
+        if delay is None:
+            delay = min(self.max_retry_delay, self.retry_delay * 2 ** attempt)
+            delay = random.uniform(delay / 2, delay)
+        return delay
+
+    def give_up(self, key, status, attempts):
+        self.attempts.pop(key, None)
+        self.failed.append({'url': key, 'status': status, 'attempts': attempts})
+
+    async def fetch(self, url, track=True, defer=False):
+        """
+        track: use the page cache and the archive, off for listing pages which change at every run
+        defer: on a retryable failure put the url on self.retries and return RETRY_LATER instead of
+               waiting here, the caller submits it again when it is due
+        """
+        key = canonical_url(url)
+        entry = self.validators.get(key) if track else None
+        headers = conditional_headers(entry)
+        stage = 'detail_fetch' if track else 'listing_fetch'
+
+        while True:
+            attempt = self.attempts.get(key, 0)
+            try:
+                response = await self.request(url, headers, stage)
+                status = response.status_code
+            except requests.RequestException as e:
+                print(f'Request error for {url}: {e}')
+                response, status = None, None
+
+            if status not in (200, 304) and status is not None:
+                self.metrics.error(stage, f'http_{status}')
+            if status in (200, 304):
+                self.attempts.pop(key, None)
+                break
+            if status is not None and status < 500 and status not in RETRYABLE_STATUS:
+                print(f'Failed to retrieve (HTTP {status}): ' + url)
+                self.give_up(key, status, attempt)
+                return None
+
+            delay = self.backoff(attempt, response)
+            if attempt >= self.max_retries or not self.retries.allow(delay):
+                print(f'Failed to retrieve after {attempt} retries: ' + url)
+                self.give_up(key, status, attempt)
+                return None
+
+            self.attempts[key] = attempt + 1
+            print('Failed to retrieve: ' + url)
+            print(f'Will retry after {delay:.0f}s...')
+            if defer:
+                self.retries.push(url, delay)
+                return RETRY_LATER
+            await asyncio.sleep(delay)
+
+        if response.status_code == 304 and entry:
+            self.counts['not_modified'] += 1
+            self.metrics.count('not_modified', stage=stage)
+            self.counts['bytes_not_downloaded'] += entry.get('size', 0)
+            self.counts['bytes_not_parsed'] += entry.get('size', 0)
+            return NOT_MODIFIED
+
+        content = response.content
+        self.counts['downloaded'] += 1
+        self.counts['bytes_downloaded'] += len(content)
+        self.metrics.count('bytes', len(content), stage=stage)
+
+        if self.cache is not None and track:
+            body_hash = hashlib.sha256(content).hexdigest()
+            if entry and entry.get('hash') == body_hash:
+                # servers without validators still let us skip the parse and the write
+                self.counts['unchanged'] += 1
+                self.counts['bytes_not_parsed'] += len(content)
+                return NOT_MODIFIED
+            self.pending[key] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'hash': body_hash,
+                'size': len(content),
+            }
+
+        if self.archive is not None and track:
+            self.archive.write(key, content, response.headers.get('Content-Type'))
+
+        return decode_body(content, response.headers.get('Content-Type'))
+
+    async def fetch_all(self, urls):
+        return await asyncio.gather(*[self.fetch(url) for url in urls])
+
+    def fetch_sync(self, url):
+        """
+        fetch() for callers without an event loop. Inside a running loop (a notebook, an async handler) asyncio.run
+        cannot be called: the fetch runs on a loop of its own in another thread and this thread waits for it, which
+        blocks the running loop meanwhile, so await fetch() (the scrapers' afetch()) there instead
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.fetch(url))
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='fetch-sync') as runner:
+            return runner.submit(asyncio.run, self.fetch(url)).result()
+
+    def close(self):
+        # the session is owned by the caller, only the worker threads belong to the fetcher
+        self.executor.shutdown(wait=False)
+
+
+_default_fetchers = {}
+
+def get_default_fetcher(session=None):
+    """Shared fetcher used by scrapers created without one, one per session (None: the default session)"""
+    fetcher = _default_fetchers.get(session)
+    if fetcher is None:
+        fetcher = _default_fetchers[session] = AsyncFetcher(session=session)
+    return fetcher
@@ -0,0 +1,393 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import sys
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+
+from storage import get_mongo_client
+from utils import job_id
+
+
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+STATES = (PENDING, LEASED, DONE, FAILED)
+# urls leased at once by a worker
+BATCH_SIZE = 20
+# seconds a lease holds if not renewed: longer than the fetcher's retry budget (600s), so a page waiting on
+# its retries is not handed to another worker meanwhile
+LEASE_S = 900
+# leases of one url that may run out before it is failed: a page that kills every worker taking it
+# does not go round forever
+MAX_ATTEMPTS = 3
+# documents of the Mongo frontier are dropped this long after the url was queued
+TTL_DAYS = 14
+
+# highest priority first, then in the order the urls were queued (listing order: newest postings first)
+LEASE_ORDER = [('priority', DESCENDING), ('added_at', ASCENDING), ('seq', ASCENDING)]
+FRONTIER_INDEXES = [
+    IndexModel([('queue', ASCENDING), ('state', ASCENDING)] + LEASE_ORDER, name='lease'),
+    IndexModel([('queue', ASCENDING), ('state', ASCENDING), ('lease_until', ASCENDING)], name='lease_until'),
+    IndexModel([('added_at', ASCENDING)], name='ttl', expireAfterSeconds=TTL_DAYS * 24 * 3600),
+]
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_until REAL,
+    error TEXT,
+    added_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (queue, id)
+);
+CREATE INDEX IF NOT EXISTS frontier_lease ON frontier (queue, state, priority DESC, seq);
+CREATE INDEX IF NOT EXISTS frontier_lease_until ON frontier (queue, state, lease_until);
+"""
+
+
+def worker_name():
+    # unique per process, readable in the owner field: host:pid:random
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+
+
+class Frontier:
+    """
+    input: job urls to scrape (add()), workers leasing batches of them (lease())
+    output: the state of each url in a Mongo collection, one document per (queue, job id):
+            {'_id': '<queue>:<job id>', 'queue', 'url', 'state', 'priority', 'attempts', 'owner', 'lease_until', 'error',
+             'added_at', 'seq', 'updated_at'}
+    flow: pending => leased (by one worker, until lease_until) => done / failed
+          a lease that runs out (the worker died) makes the url leasable again, after max_attempts of them it is failed
+    every change is one atomic update, so any number of workers on any node can share a queue
+    """
+
+    def __init__(self, coll, queue='default', max_attempts=MAX_ATTEMPTS):
+        self.coll = coll
+        self.queue = queue
+        self.max_attempts = max_attempts
+
+    @classmethod
+    def from_uri(cls, uri, db='topcv_db', coll='frontier', **kwargs):
+        return cls(get_mongo_client(uri)[db][coll], **kwargs)
+
+    def ensure_indexes(self):
+        self.coll.create_indexes(FRONTIER_INDEXES)
+
+    def key(self, url):
+        return f'{self.queue}:{job_id(url)}'
+
+    def add(self, urls, priority=0):
+        """queue the urls not in the queue yet (by job id), returns how many were added"""
+        now = datetime.utcnow()
+        ops = {}
+        for seq, url in enumerate(urls):
+            key = self.key(url)
+            if key not in ops:
+                ops[key] = UpdateOne({'_id': key}, {'$setOnInsert': {
+                    'queue': self.queue, 'url': url, 'state': PENDING, 'priority': priority, 'attempts': 0,
+                    'added_at': now, 'seq': seq, 'updated_at': now,
+                }}, upsert=True)
+        if not ops:
+            return 0
+        return self.coll.bulk_write(list(ops.values()), ordered=False).upserted_count
+
+    def lease(self, worker, n=BATCH_SIZE, lease_s=LEASE_S):
+        """up to n pending urls (or urls whose lease ran out) leased to worker for lease_s seconds"""
+        now = datetime.utcnow()
+        self.expire(now)
+        update = {'$set': {'state': LEASED, 'owner': worker, 'lease_until': now + timedelta(seconds=lease_s), 'updated_at': now},
+                  '$inc': {'attempts': 1}}
+        leased = []
+        # one atomic find-and-modify per url: two workers never get the same one
+        for _ in range(n):
+            doc = self.coll.find_one_and_update(
+                {'queue': self.queue, '$or': [{'state': PENDING}, {'state': LEASED, 'lease_until': {'$lt': now}}]},
+                update, sort=LEASE_ORDER, projection={'url': 1},
+            )
+            if doc is None:
+                break
+            leased.append(doc['url'])
+        return leased
+
+    def expire(self, now):
+        # leases run out on the last attempt
+        self.coll.update_many(
+            {'queue': self.queue, 'state': LEASED, 'lease_until': {'$lt': now}, 'attempts': {'$gte': self.max_attempts}},
+            {'$set': {'state': FAILED, 'owner': None, 'lease_until': None, 'error': 'lease expired', 'updated_at': now}},
+        )
+
+    def renew(self, worker, urls, lease_s=LEASE_S):
+        if not urls:
+            return
+        now = datetime.utcnow()
+        self.coll.update_many(
+            {'_id': {'$in': [self.key(url) for url in urls]}, 'state': LEASED, 'owner': worker},
+            {'$set': {'lease_until': now + timedelta(seconds=lease_s), 'updated_at': now}},
+        )
+
+    def done(self, urls):
+        if not urls:
+            return
+        self.coll.update_many(
+            {'_id': {'$in': [self.key(url) for url in urls]}},
+            {'$set': {'state': DONE, 'owner': None, 'lease_until': None, 'error': None, 'updated_at': datetime.utcnow()}},
+        )
+
+    def fail(self, errors):
+        """errors: {url: reason}, urls the scraper gave up on (the fetcher has retried them already)"""
+        if not errors:
+            return
+        now = datetime.utcnow()
+        self.coll.bulk_write(
+            [UpdateOne({'_id': self.key(url), 'state': {'$ne': DONE}},
+                       {'$set': {'state': FAILED, 'owner': None, 'lease_until': None, 'error': reason, 'updated_at': now}})
+             for url, reason in errors.items()],
+            ordered=False,
+        )
+
+    def release(self, worker=None):
+        """leases of worker (of every worker if None) back to pending at once, returns how many"""
+        query = {'queue': self.queue, 'state': LEASED}
+        if worker is not None:
+            query['owner'] = worker
+        return self.coll.update_many(query, {'$set': {'state': PENDING, 'owner': None, 'lease_until': None,
+                                                      'updated_at': datetime.utcnow()}}).modified_count
+
+    def requeue(self, state=FAILED):
+        """urls in `state` back to pending with their attempts reset, e.g. to retry the failed ones"""
+        return self.coll.update_many(
+            {'queue': self.queue, 'state': state},
+            {'$set': {'state': PENDING, 'attempts': 0, 'owner': None, 'lease_until': None, 'error': None,
+                      'updated_at': datetime.utcnow()}},
+        ).modified_count
+
+    def counts(self):
+        """{state: number of urls}"""
+        counts = dict.fromkeys(STATES, 0)
+        for doc in self.coll.aggregate([{'$match': {'queue': self.queue}}, {'$group': {'_id': '$state', 'n': {'$sum': 1}}}]):
+            counts[doc['_id']] = doc['n']
+        return counts
+
+    def failed(self):
+        return [{'url': doc['url'], 'error': doc.get('error'), 'attempts': doc.get('attempts', 0)}
+                for doc in self.coll.find({'queue': self.queue, 'state': FAILED}, {'url': 1, 'error': 1, 'attempts': 1})]
+
+    def close(self):
+        pass
+
+
+class SqliteFrontier:
+    """
+    same as Frontier in a local SQLite file, for runs without Mongo
+    worker processes on the same machine can share it (WAL journal, leases taken in BEGIN IMMEDIATE transactions)
+    """
+
+    def __init__(self, path, queue='default', max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.queue = queue
+        self.max_attempts = max_attempts
+        # autocommit, transactions are opened explicitly
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SQLITE_SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        # takes the write lock at once: the select and the update of a lease see no other writer in between
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def update(self, sql, urls, *params):
+        keys = list({job_id(url) for url in urls})
+        changed = 0
+        with self.transaction() as db:
+            # within sqlite's limit on bound parameters
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                changed += db.execute(f"{sql} AND queue = ? AND id IN ({','.join('?' * len(chunk))})",
+                                      (*params, self.queue, *chunk)).rowcount
+        return changed
+
+    def add(self, urls, priority=0):
+        now = time.time()
+        with self.transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO frontier (queue, id, url, priority, added_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.queue, job_id(url), url, priority, now, now) for url in urls],
+            )
+            return db.total_changes - before
+
+    def lease(self, worker, n=BATCH_SIZE, lease_s=LEASE_S):
+        now = time.time()
+        with self.transaction() as db:
+            self.expire(db, now)
+            rows = db.execute(
+                "SELECT seq, url FROM frontier WHERE queue = ? AND (state = ? OR (state = ? AND lease_until < ?)) "
+                "ORDER BY priority DESC, seq LIMIT ?",
+                (self.queue, PENDING, LEASED, now, n),
+            ).fetchall()
+            db.executemany(
+                "UPDATE frontier SET state = ?, owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? WHERE seq = ?",
+                [(LEASED, worker, now + lease_s, now, seq) for seq, _ in rows],
+            )
+        return [url for _, url in rows]
+
+    def expire(self, db, now):
+        db.execute(
+            "UPDATE frontier SET state = ?, owner = NULL, lease_until = NULL, error = 'lease expired', updated_at = ? "
+            "WHERE queue = ? AND state = ? AND lease_until < ? AND attempts >= ?",
+            (FAILED, now, self.queue, LEASED, now, self.max_attempts),
+        )
+
+    def renew(self, worker, urls, lease_s=LEASE_S):
+        now = time.time()
+        self.update("UPDATE frontier SET lease_until = ?, updated_at = ? WHERE state = ? AND owner = ?",
+                    urls, now + lease_s, now, LEASED, worker)
+
+    def done(self, urls):
+        self.update("UPDATE frontier SET state = ?, owner = NULL, lease_until = NULL, error = NULL, updated_at = ? WHERE 1",
+                    urls, DONE, time.time())
+
+    def fail(self, errors):
+        now = time.time()
+        with self.transaction() as db:
+            db.executemany(
+                "UPDATE frontier SET state = ?, owner = NULL, lease_until = NULL, error = ?, updated_at = ? "
+                "WHERE queue = ? AND id = ? AND state != ?",
+                [(FAILED, reason, now, self.queue, job_id(url), DONE) for url, reason in errors.items()],
+            )
+
+    def release(self, worker=None):
+        sql = "UPDATE frontier SET state = ?, owner = NULL, lease_until = NULL, updated_at = ? WHERE queue = ? AND state = ?"
+        params = [PENDING, time.time(), self.queue, LEASED]
+        if worker is not None:
+            sql += " AND owner = ?"
+            params.append(worker)
+        with self.transaction() as db:
+            return db.execute(sql, params).rowcount
+
+    def requeue(self, state=FAILED):
+        with self.transaction() as db:
+            return db.execute(
+                "UPDATE frontier SET state = ?, attempts = 0, owner = NULL, lease_until = NULL, error = NULL, updated_at = ? "
+                "WHERE queue = ? AND state = ?",
+                (PENDING, time.time(), self.queue, state),
+            ).rowcount
+
+    def counts(self):
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(self.db.execute("SELECT state, COUNT(*) FROM frontier WHERE queue = ? GROUP BY state", (self.queue,)))
+        return counts
+
+    def failed(self):
+        rows = self.db.execute("SELECT url, error, attempts FROM frontier WHERE queue = ? AND state = ?", (self.queue, FAILED))
+        return [{'url': url, 'error': error, 'attempts': attempts} for url, error, attempts in rows]
+
+    def close(self):
+        self.db.close()
+
+
+def open_frontier(spec, queue='default'):
+    """frontier from a command line spec: 'sqlite:<path>' or 'mongo:<uri>' (collection topcv_db.frontier)"""
+    kind, _, target = spec.partition(':')
+    if kind == 'sqlite' and target:
+        return SqliteFrontier(target, queue=queue)
+    if kind == 'mongo' and target:
+        frontier = Frontier.from_uri(target, queue=queue)
+        frontier.ensure_indexes()
+        return frontier
+    raise ValueError(f"unknown frontier {spec!r}, expected sqlite:<path> or mongo:<uri>")
+
+
+class FrontierFeed:
+    """
+    input: a Frontier / SqliteFrontier
+    output: urls(), an async generator of the urls leased by one worker, batch by batch until nothing is left to lease
+    flow: lease batch_size urls => yield them => done() / fail() as each one is scraped =>
+          before the next lease: flush() (the sinks' buffered writes), then mark the acknowledged urls done / failed
+          in the frontier and renew the leases of the urls still in flight
+    a url is marked done only after its record was flushed: a crash loses no record, at most the last batches
+    are scraped again (idempotent upserts) when the leases run out or are released
+    on_batch: called with each leased batch, e.g. AsyncFetcher.load_validators
+    poll_s: when nothing is leasable but other workers still hold leases, look again every poll_s seconds until
+            they are done or their leases run out and are taken over here (None: stop at once)
+    """
+
+    def __init__(self, frontier, worker=None, batch_size=BATCH_SIZE, lease_s=LEASE_S, flush=None, on_batch=None, poll_s=None):
+        self.frontier = frontier
+        self.worker = worker or worker_name()
+        self.batch_size = batch_size
+        self.lease_s = lease_s
+        self.flush = flush
+        self.on_batch = on_batch
+        self.poll_s = poll_s
+        self.in_flight = set()
+        self.acked = []
+        self.errors = {}
+        self.counts = {'leased': 0, 'done': 0, 'failed': 0}
+
+    async def urls(self):
+        while True:
+            self.commit()
+            batch = self.frontier.lease(self.worker, self.batch_size, self.lease_s)
+            if not batch:
+                # our own urls still in flight are not waited for, they are acknowledged by close()
+                if self.poll_s is None or self.frontier.counts()[LEASED] <= len(self.in_flight):
+                    return
+                await asyncio.sleep(self.poll_s)
+                continue
+            self.counts['leased'] += len(batch)
+            self.in_flight.update(batch)
+            if self.on_batch is not None:
+                self.on_batch(batch)
+            for url in batch:
+                yield url
+
+    def done(self, url):
+        self.in_flight.discard(url)
+        self.acked.append(url)
+
+    def fail(self, url, reason='no data'):
+        self.in_flight.discard(url)
+        self.errors[url] = reason
+
+    def commit(self):
+        if self.acked or self.errors:
+            if self.flush is not None:
+                self.flush()
+            self.frontier.done(self.acked)
+            self.frontier.fail(self.errors)
+            self.counts['done'] += len(self.acked)
+            self.counts['failed'] += len(self.errors)
+            self.acked, self.errors = [], {}
+        if self.in_flight:
+            self.frontier.renew(self.worker, self.in_flight, self.lease_s)
+
+    def close(self):
+        """commit what is left, give back the leases of urls never scraped, returns leased / done / failed counts"""
+        self.commit()
+        if self.in_flight:
+            self.frontier.release(self.worker)
+        return dict(self.counts)
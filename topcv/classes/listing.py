@@ -0,0 +1,145 @@
+import hashlib
+import math
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from parsers import parse
+
+
+LISTING_URL = "https://www.topcv.vn/{slug}?sort=new&type_keyword=1&page={page}&category_family=r{number}"
+# the IT listing, crawled when no category is given; category keys are also the keys of the watermarks in the crawl state
+LISTING_CATEGORY = 'cr257'
+# listing slug of the categories that can be given by key alone, any other one is given by its slug
+CATEGORY_SLUGS = {
+    'cr257': 'tim-viec-lam-cong-nghe-thong-tin-cr257',
+}
+# 'tim-viec-lam-cong-nghe-thong-tin-cr257', 'cr257' or '257'
+CATEGORY = re.compile(r'^(?:(?P<slug>[a-z0-9-]+)-)?(?:cr)?(?P<number>\d+)$')
+
+# "1 ngày trước", "Cập nhật 3 giờ trước", ...
+RELATIVE_TIME = re.compile(r'(\d+)\s*(giây|phút|giờ|ngày|tuần|tháng|năm)\s*trước', re.I)
+TIME_UNITS = {
+    'giây': timedelta(seconds=1),
+    'phút': timedelta(minutes=1),
+    'giờ': timedelta(hours=1),
+    'ngày': timedelta(days=1),
+    'tuần': timedelta(weeks=1),
+    'tháng': timedelta(days=30),
+    'năm': timedelta(days=365),
+}
+
+
+def parse_category(category):
+    """category slug or key => (key, listing slug), e.g. '257' => ('cr257', 'tim-viec-lam-cong-nghe-thong-tin-cr257')"""
+    m = CATEGORY.match(category.strip().strip('/').lower())
+    if not m:
+        raise ValueError(f"not a TopCV category: {category!r}, expected its listing slug (tim-viec-lam-...-cr<n>) or cr<n>")
+    key = f"cr{m.group('number')}"
+    if m.group('slug'):
+        return key, f"{m.group('slug')}-{key}"
+    if key not in CATEGORY_SLUGS:
+        raise ValueError(f"unknown category {category!r}, give its listing slug (tim-viec-lam-...-{key})")
+    return key, CATEGORY_SLUGS[key]
+
+def category_key(category):
+    return parse_category(category)[0]
+
+def listing_url(page, category=LISTING_CATEGORY):
+    key, slug = parse_category(category)
+    return LISTING_URL.format(slug=slug, page=page, number=key[2:])
+
+def parse_listing(html, parser='html.parser'):
+    """listing page => [(job url, 'updated' label)] in page order"""
+    soup = parse(html, parser)
+    jobs = []
+
+    for job in soup.find_all('div', attrs={"data-box": "BoxSearchResult"}): # len(jobs)=50, the maximum number of jobs in one single page
+        url = job.find('h3', class_='title').find('a')['href']
+
+        # chỉ lấy text trong label, bỏ qua text trong span
+        updated = None
+        label = job.find("label", class_="address mobile-hidden label-update")
+        if label is not None:
+            span_strings = list(label.span.stripped_strings) if label.span else []
+            texts = [t for t in label.stripped_strings if t not in span_strings]
+            updated = texts[0] if texts else None
+
+        jobs.append((url, updated))
+
+    return jobs
+
+def parse_updated_label(label, now=None):
+    """
+    'updated' label => latest time the posting can have been updated, None if the label is not understood
+    e.g. '2 ngày trước' means between 2 and 3 days ago, so this returns now - 2 days
+    """
+    if not label:
+        return None
+    now = now or datetime.utcnow()
+    text = label.strip().lower()
+
+    m = RELATIVE_TIME.search(text)
+    if m:
+        return now - int(m.group(1)) * TIME_UNITS[m.group(2)]
+    if 'vừa' in text or 'hôm nay' in text:
+        return now
+    if 'hôm qua' in text:
+        return now - timedelta(days=1)
+    return None
+
+
+class BloomFilter:
+    """
+    fixed-size set of job ids for local runs without Mongo: no false negatives,
+    false positives (a new job taken as known) at about error_rate for `capacity` ids
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        # double hashing: h1 + i*h2 from one sha256
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for pos in self.positions(key):
+            self.bits[pos // 8] |= 1 << (pos % 8)
+
+    def __contains__(self, key):
+        return all(self.bits[pos // 8] & (1 << (pos % 8)) for pos in self.positions(key))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.size.to_bytes(8, 'big') + self.hashes.to_bytes(2, 'big') + bytes(self.bits))
+
+    @classmethod
+    def load(cls, path):
+        bloom = cls.__new__(cls)
+        with open(path, 'rb') as f:
+            data = f.read()
+        bloom.size = int.from_bytes(data[:8], 'big')
+        bloom.hashes = int.from_bytes(data[8:10], 'big')
+        bloom.bits = bytearray(data[10:])
+        return bloom
+
+
+def load_known_ids(coll):
+    # _id and _aliases projection only, the documents themselves are never transferred
+    # the ids merged into a document as near duplicates (see dedupe.py) are known too, their pages are not fetched again
+    known = set()
+    for doc in coll.find({}, {'_id': 1, '_aliases': 1}):
+        known.add(doc['_id'])
+        known.update(doc.get('_aliases', ()))
+    return known
@@ -0,0 +1,300 @@
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PREFIX = 'topcv_crawl'
+QUANTILES = (0.5, 0.95)
+# durations kept per stage for the quantiles (a uniform sample of all of them past that), count and sum stay exact
+MAX_SAMPLES = 10000
+# durations per stage in samples(): enough for p50 / p95 after merging the shards of a run, small enough for XCom
+SAMPLE_POINTS = 101
+
+
+def quantile(sorted_values, q):
+    # nearest rank
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))]
+
+def weighted_quantile(points, q):
+    """sorted (value, weight) => the first value whose cumulative weight reaches q of the total"""
+    if not points:
+        return 0.0
+    target = q * sum(weight for _, weight in points)
+    cumulative = 0.0
+    for value, weight in points:
+        cumulative += weight
+        # a little slack for the float sums, so q=1 never runs past the last value
+        if cumulative >= target * (1 - 1e-9):
+            return value
+    return points[-1][0]
+
+def resample(points, count):
+    """sorted (value, weight) => `count` points of equal weight at the middle of each slice of the cumulative weight"""
+    total = sum(weight for _, weight in points)
+    resampled, cumulative, i = [], 0.0, 0
+    for k in range(count):
+        target = (k + 0.5) / count * total
+        while i < len(points) - 1 and cumulative + points[i][1] < target:
+            cumulative += points[i][1]
+            i += 1
+        resampled.append((points[i][0], total / count))
+    return resampled
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def labels_text(labels):
+    return '{' + ','.join(f'{name}="{label_value(value)}"' for name, value in labels) + '}' if labels else ''
+
+
+class Timer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        if kind is not None:
+            self.metrics.error(self.stage, kind.__name__)
+        return False
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        return False
+
+NULL_TIMER = NullTimer()
+
+
+class NullMetrics:
+    """
+    metrics turned off: the same calls as Metrics, each one returns at once and nothing is kept
+    (a timer is one shared object, no clock read)
+    """
+
+    enabled = False
+
+    def timer(self, stage):
+        return NULL_TIMER
+
+    def observe(self, stage, seconds):
+        pass
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def error(self, stage, kind):
+        pass
+
+    def samples(self):
+        return None
+
+    def merge(self, samples):
+        pass
+
+    def summary(self):
+        return {}
+
+NULL_METRICS = NullMetrics()
+
+
+class Metrics:
+    """
+    input: durations of the crawl stages (timer() / observe()), counters with labels (count(), error())
+    output: Prometheus text format (render(), write() to a file, serve() on /metrics) and a per-run summary
+            (summary(): p50 / p95 per stage, bytes, errors by type)
+    stages: listing_fetch, detail_fetch, rate_limit_wait, parse, collect, extract_<method>, normalize, fingerprint, db_write
+    thread safe (fetches run in worker threads), parser processes send samples() back to be merged
+    quantiles: a uniform sample of the observed durations (seeded, so a run can be reproduced) and the weighted
+               points merged from other processes, read off their cumulative weights
+    """
+
+    enabled = True
+
+    def __init__(self, prefix=PREFIX, max_samples=MAX_SAMPLES, seed=0):
+        self.prefix = prefix
+        self.max_samples = max_samples
+        self.random = random.Random(seed)
+        # stage => [count, sum of seconds, max] (observed and merged)
+        self.totals = {}
+        # stage => sampled durations of observe(), stage => observe() calls, stage => [(seconds, weight)] from merge()
+        self.durations = {}
+        self.observed = {}
+        self.merged = {}
+        # (name, ((label, value), ...)) => value
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def timer(self, stage):
+        return Timer(self, stage)
+
+    def stage_total(self, stage):
+        # lock held
+        total = self.totals.get(stage)
+        if total is None:
+            total = self.totals[stage] = [0, 0.0, 0.0]
+            self.durations[stage] = []
+            self.observed[stage] = 0
+            self.merged[stage] = []
+        return total
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            total = self.stage_total(stage)
+            total[0] += 1
+            total[1] += seconds
+            if seconds > total[2]:
+                total[2] = seconds
+            self.observed[stage] += 1
+            self.keep(self.durations[stage], self.observed[stage], seconds)
+
+    def keep(self, samples, seen, seconds):
+        # reservoir: each of the `seen` durations of the stage has the same chance to be kept
+        if len(samples) < self.max_samples:
+            samples.append(seconds)
+        else:
+            i = self.random.randrange(seen)
+            if i < self.max_samples:
+                samples[i] = seconds
+
+    def points(self, stage):
+        """sorted (seconds, weight) of a stage: each kept duration stands for observed / kept ones (lock held)"""
+        kept = self.durations[stage]
+        weight = self.observed[stage] / len(kept) if kept else 0
+        return sorted([(seconds, weight) for seconds in kept] + self.merged[stage])
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def error(self, stage, kind):
+        self.count('errors', stage=stage, type=kind)
+
+    def samples(self, points=SAMPLE_POINTS):
+        """plain data (picklable, JSON) to merge() into another Metrics: totals, up to `points` durations per stage, counters"""
+        with self.lock:
+            stages = {}
+            for stage, (count, total, longest) in self.totals.items():
+                weighted = self.points(stage)
+                if len(weighted) > points or self.merged[stage]:
+                    values = [seconds for seconds, _ in resample(weighted, points)]
+                else:
+                    values = [seconds for seconds, _ in weighted]
+                stages[stage] = {'count': count, 'sum': total, 'max': longest, 'values': values}
+            counters = [[name, dict(labels), value] for (name, labels), value in self.counters.items()]
+        return {'stages': stages, 'counters': counters}
+
+    def merge(self, samples):
+        if not samples:
+            return
+        with self.lock:
+            for stage, data in samples['stages'].items():
+                total = self.stage_total(stage)
+                # the values are sorted points of the shard, each one stands for count / len(values) durations
+                if data['values']:
+                    weight = data['count'] / len(data['values'])
+                    merged = self.merged[stage]
+                    merged.extend((value, weight) for value in data['values'])
+                    # the pipeline merges every page: past max_samples points, halve them (same total weight)
+                    if len(merged) > self.max_samples:
+                        self.merged[stage] = resample(sorted(merged), self.max_samples // 2)
+                total[0] += data['count']
+                total[1] += data['sum']
+                total[2] = max(total[2], data['max'])
+        for name, labels, value in samples['counters']:
+            self.count(name, value, **labels)
+
+    def counter_totals(self, name, label):
+        """{label value: total} of one counter"""
+        totals = {}
+        with self.lock:
+            for (counter, labels), value in self.counters.items():
+                if counter == name:
+                    key = '/'.join(str(v) for k, v in labels if k in label)
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def summary(self):
+        """{'stages': {stage: {count, total_s, p50_ms, p95_ms, max_ms}}, 'bytes': {stage: n}, 'errors': {'stage/type': n}}"""
+        stages = {}
+        with self.lock:
+            for stage, (count, total, longest) in sorted(self.totals.items()):
+                weighted = self.points(stage)
+                stages[stage] = {
+                    'count': count,
+                    'total_s': round(total, 3),
+                    'p50_ms': round(weighted_quantile(weighted, 0.5) * 1000, 3),
+                    'p95_ms': round(weighted_quantile(weighted, 0.95) * 1000, 3),
+                    'max_ms': round(longest * 1000, 3),
+                }
+        return {
+            'stages': stages,
+            'bytes': self.counter_totals('bytes', ('stage',)),
+            'errors': self.counter_totals('errors', ('stage', 'type')),
+        }
+
+    def render(self):
+        """Prometheus text exposition format: one summary per stage, one counter per name"""
+        name = f'{self.prefix}_stage_seconds'
+        lines = [f'# HELP {name} Time spent in each crawl stage.', f'# TYPE {name} summary']
+        with self.lock:
+            for stage, (count, total, _) in sorted(self.totals.items()):
+                weighted = self.points(stage)
+                for q in QUANTILES:
+                    lines.append(f'{name}{labels_text((("stage", stage), ("quantile", q)))} {weighted_quantile(weighted, q):.6f}')
+                lines.append(f'{name}_sum{labels_text((("stage", stage),))} {total:.6f}')
+                lines.append(f'{name}_count{labels_text((("stage", stage),))} {count}')
+
+            by_name = {}
+            for (counter, labels), value in sorted(self.counters.items()):
+                by_name.setdefault(counter, []).append((labels, value))
+        for counter, values in by_name.items():
+            name = f'{self.prefix}_{counter}_total'
+            lines.append(f'# TYPE {name} counter')
+            lines += [f'{name}{labels_text(labels)} {value}' for labels, value in values]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # written aside and renamed: a collector reading the file (node_exporter textfile) never sees half of it
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port, host='0.0.0.0'):
+        """serve render() on http://host:port/metrics from a daemon thread, returns the server (shutdown() to stop)"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,169 @@
+import re
+import unicodedata
+from functools import lru_cache
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from records import NUMERIC_FIELDS, label_field
+
+
+# rate used to compare USD and VND salaries (search ranking), the documents keep the posted currency
+USD_VND = 25000
+
+# '2,000' / '1.500' (thousands) / '1,5' (decimal) / '15'
+NUMBER = re.compile(r'\d+(?:[.,]\d{3})+(?![.,]?\d)|\d+(?:[.,]\d+)?')
+THOUSANDS = re.compile(r'\d+(?:[.,]\d{3})+')
+USD = re.compile(r'usd|\$')
+MILLION = re.compile(r'trieu|tr\b|m\b')
+BILLION = re.compile(r'\bty\b')
+# 'Tới 40 triệu', 'Lên đến 30 triệu', 'Up to 2,000 USD': only a maximum, 'Từ 11 triệu', 'Trên 5 năm': only a minimum
+UP_TO = re.compile(r'^(?:len den|toi da|toi|den|duoi|up to|upto|max)\b')
+AT_LEAST = re.compile(r'^(?:tu|tren|hon|from|it nhat|toi thieu|min)\b')
+# '1 năm 6 tháng', '1 - 3 năm', '6 tháng': each amount with its unit, if any
+EXPERIENCE_PART = re.compile(r'(\d+(?:[.,]\d+)?)\s*(nam|year|thang|month)?')
+MONTH_UNITS = ('thang', 'month')
+# what may stand between the years and the months of one amount: '1 năm 6 tháng', '1 year and 6 months'
+YEARS_AND_MONTHS = re.compile(r'\s*(?:va|and|,)?\s*')
+NO_EXPERIENCE = re.compile(r'khong yeu cau|chua co|khong can|no experience|fresher')
+
+
+def fold_table():
+    """str.translate table: Vietnamese / latin letters with diacritics => ascii letter, combining marks dropped"""
+    table = {ord('đ'): 'd', ord('Đ'): 'd'}
+    for code in range(0x00C0, 0x1F00):
+        base = unicodedata.normalize('NFD', chr(code))[0]
+        if base != chr(code) and base.isascii():
+            table[code] = base.lower()
+    for code in range(0x0300, 0x0370):
+        table[code] = None
+    return table
+
+FOLD = fold_table()
+
+
+def fold(text):
+    """'Hà Nội' => 'ha noi'"""
+    return text.lower().translate(FOLD)
+
+def number(text):
+    # '2,000' / '2.000' => 2000, '1,5' => 1.5
+    if THOUSANDS.fullmatch(text):
+        return float(text.replace(',', '').replace('.', ''))
+    return float(text.replace(',', '.'))
+
+def whole(value):
+    return int(value) if value == int(value) else value
+
+
+# a few hundred distinct strings cover a whole crawl ('Thoả thuận', '10 - 15 triệu', '2 năm'), each is parsed once
+@lru_cache(maxsize=4096)
+def parse_salary(text):
+    """
+    'X - Y triệu' / 'Tới X USD' / 'Từ X triệu' => (salary_min, salary_max, currency), amounts in currency units
+    '10 - 20 triệu' => (10000000, 20000000, 'VND'), 'Tới 2,000 USD' => (None, 2000, 'USD'), 'Thoả thuận' => (None, None, None)
+    """
+    folded = fold(text or '').strip()
+    values = [number(value) for value in NUMBER.findall(folded)]
+    if not values:
+        # negotiable / competitive: nothing to range on
+        return None, None, None
+    if USD.search(folded):
+        currency = 'USD'
+    else:
+        currency = 'VND'
+        if MILLION.search(folded):
+            values = [value * 1000000 for value in values]
+        elif BILLION.search(folded):
+            values = [value * 1000000000 for value in values]
+    values = [whole(round(value, 2)) for value in values]
+
+    if len(values) >= 2:
+        return min(values[:2]), max(values[:2]), currency
+    if UP_TO.match(folded):
+        return None, values[0], currency
+    if AT_LEAST.match(folded):
+        return values[0], None, currency
+    return values[0], values[0], currency
+
+@lru_cache(maxsize=1024)
+def parse_experience(text):
+    """
+    least years of experience asked: '2 năm' => 2, '1 - 3 năm' => 1, 'Trên 5 năm' => 5, 'Dưới 1 năm' => 0,
+    '6 tháng' => 0.5, '1 năm 6 tháng' => 1.5, 'Không yêu cầu' => 0, unknown => None
+    """
+    folded = fold(text or '').strip()
+    if not folded:
+        return None
+    if NO_EXPERIENCE.search(folded):
+        return 0
+    parts = [[number(match.group(1)), match.group(2), match.start(), match.end()] for match in EXPERIENCE_PART.finditer(folded)]
+    if not parts:
+        return None
+    if UP_TO.match(folded):
+        return 0
+    # a number without a unit has the unit of the next one ('1 - 3 năm'), years when none has
+    unit = 'nam'
+    for part in reversed(parts):
+        part[1] = unit = part[1] or unit
+    amounts = []
+    i = 0
+    while i < len(parts):
+        value, unit, _, end = parts[i]
+        if unit in MONTH_UNITS:
+            amounts.append(value / 12)
+        elif i + 1 < len(parts) and parts[i + 1][1] in MONTH_UNITS and YEARS_AND_MONTHS.fullmatch(folded[end:parts[i + 1][2]]):
+            amounts.append(value + parts[i + 1][0] / 12)
+            i += 1
+        else:
+            amounts.append(value)
+        i += 1
+    return whole(round(min(amounts[:2]), 2))
+
+
+def raw_values(doc):
+    """(salary, experience) strings of a record of any shape: scraper dict, stored document, flat document"""
+    if 'kind' in doc:
+        return doc.get('salary'), doc.get('experience')
+    # normal jobs: job_info, premium and brand: general_info, the labels differ by page type
+    info = doc.get('job_info') or doc.get('general_info') or {}
+    salary = experience = None
+    for label, value in info.items():
+        name = label_field(label)
+        if name == 'salary' and salary is None:
+            salary = value
+        elif name == 'experience' and experience is None:
+            experience = value
+    return salary, experience
+
+def normalized(salary, experience):
+    salary_min, salary_max, currency = parse_salary(salary)
+    return {'salary_min': salary_min, 'salary_max': salary_max, 'currency': currency,
+            'exp_min_years': parse_experience(experience)}
+
+def normalize_record(doc):
+    """the numeric fields of one record => {'salary_min', 'salary_max', 'currency', 'exp_min_years'}"""
+    return normalized(*raw_values(doc))
+
+def normalize_batch(docs):
+    """
+    normalize_record over many records: the strings are gathered column by column and each distinct one is parsed
+    once for the batch, returns one dict of fields per record in the same order
+    """
+    salaries, experiences = zip(*map(raw_values, docs)) if docs else ((), ())
+    salary_parsed = {text: parse_salary(text) for text in dict.fromkeys(salaries)}
+    experience_parsed = {text: parse_experience(text) for text in dict.fromkeys(experiences)}
+    return [
+        dict(zip(NUMERIC_FIELDS, salary_parsed[salary] + (experience_parsed[experience],)))
+        for salary, experience in zip(salaries, experiences)
+    ]
+
+def salary_million_vnd(amount, currency):
+    # search ranks salaries in millions of VND
+    if amount is None:
+        return None
+    return amount * USD_VND / 1000000 if currency == 'USD' else amount / 1000000
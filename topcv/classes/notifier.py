@@ -0,0 +1,225 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import requests
+
+from fetcher import TokenBucket, retry_after
+from records import flatten
+from session import ScraperSession
+
+
+TELEGRAM_API = 'https://api.telegram.org'
+# Bot API limits: 4096 characters per message, about 30 messages/sec per bot and 20 messages/minute to one group or channel
+MAX_MESSAGE_LENGTH = 4096
+GLOBAL_RATE = 30.0
+CHAT_RATE = 20 / 60
+DIGEST_TITLE = 'Việc làm mới'
+MAX_TITLE_LENGTH = 300
+
+
+def text_length(text):
+    # Telegram counts message length in UTF-16 code units
+    return len(text.encode('utf-16-le')) // 2
+
+def job_summary(record):
+    """record (scraper dict, stored document or JobRecord) => flat document with title, company, salary, location, url"""
+    return flatten(record)
+
+def job_entry(doc):
+    """
+    one job of a digest:
+    <title>
+    <company> | <salary> | <location>
+    <url>
+    """
+    title = doc.get('title') or ''
+    if len(title) > MAX_TITLE_LENGTH:
+        title = title[:MAX_TITLE_LENGTH - 1] + '…'
+    details = ' | '.join(value for value in ((doc.get('company') or {}).get('name'), doc.get('salary'), doc.get('location')) if value)
+    return '\n'.join(part for part in (title, details, doc['url']) if part)
+
+def digests(entries, limit=MAX_MESSAGE_LENGTH, title=DIGEST_TITLE):
+    """
+    [(job id, entry)] => [(message text, job ids)], as few messages as fit in limit, an entry is never split
+    each message starts with '<title> (<i>/<n>)'
+    """
+    # room for the header with the widest numbering
+    room = limit - text_length(f'{title} ({len(entries)}/{len(entries)})\n\n')
+    chunks = []
+    current, size = [], 0
+    for job_id, entry in entries:
+        length = text_length(entry) + 2
+        if current and size + length > room:
+            chunks.append(current)
+            current, size = [], 0
+        current.append((job_id, entry))
+        size += length
+    if current:
+        chunks.append(current)
+
+    return [
+        (f'{title} ({i}/{len(chunks)})\n\n' + '\n\n'.join(entry for _, entry in chunk), [job_id for job_id, _ in chunk])
+        for i, chunk in enumerate(chunks, 1)
+    ]
+
+
+class TelegramNotifier:
+    """
+    input: new jobs (records or (job id, entry) pairs) and the chats to notify
+    output: counts of messages sent, jobs notified, jobs skipped (already delivered), retries and failed messages
+    flow: drop the jobs the delivery log holds for a chat => pack the others into digests => one queue and one sender
+          task per chat => wait for the chat's and the bot's token bucket => POST sendMessage in a worker thread
+          => mark the jobs of the message as delivered
+    429: the message waits the retry_after Telegram asks for and is resent, 5xx / network errors: exponential backoff,
+         at most max_retries resends, other errors are not retried. Jobs of a failed message stay undelivered
+         so the next run sends them again
+    api_base: Bot API server, e.g. a local stand-in (see benchmarks/notifier_standin.py)
+    """
+
+    def __init__(self, token, api_base=TELEGRAM_API, log=None, session=None, chat_rate=CHAT_RATE, global_rate=GLOBAL_RATE,
+                 max_retries=5, retry_delay=1.0, max_retry_delay=60, max_length=MAX_MESSAGE_LENGTH):
+        self.token = token
+        self.api_base = api_base.rstrip('/')
+        self.log = log
+        self.own_session = session is None
+        self.session = ScraperSession(pool_maxsize=4) if session is None else session
+        self.chat_rate = chat_rate
+        self.bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_buckets = {}
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_length = max_length
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.queues = {}
+        self.senders = []
+        self.counts = {'messages': 0, 'jobs': 0, 'skipped': 0, 'throttled': 0, 'retries': 0, 'failed': 0}
+
+    def api_url(self, method):
+        return f'{self.api_base}/bot{self.token}/{method}'
+
+    def post(self, method, payload):
+        # blocking, runs in a worker thread
+        response = self.session.post(self.api_url(method), json=payload)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        return response, body
+
+    def backoff(self, attempt):
+        delay = min(self.retry_delay * 2 ** attempt, self.max_retry_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def wait_turn(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        await asyncio.sleep(max(bucket.reserve(), self.bucket.reserve()))
+
+    async def send(self, chat_id, text):
+        """sendMessage with retries, returns the message_id or None if the message could not be delivered"""
+        loop = asyncio.get_event_loop()
+        payload = {'chat_id': chat_id, 'text': text, 'disable_web_page_preview': True}
+        for attempt in range(self.max_retries + 1):
+            await self.wait_turn(chat_id)
+            try:
+                response, body = await loop.run_in_executor(self.executor, self.post, 'sendMessage', payload)
+            except requests.RequestException as e:
+                print(f"Error sending message to chat {chat_id}: {e}")
+                response, body = None, {}
+
+            if response is not None and response.status_code == 200 and body.get('ok'):
+                return body['result']['message_id']
+            if response is not None and response.status_code == 429:
+                # flood control: Telegram says how long to wait, in the body (and sometimes the Retry-After header)
+                self.counts['throttled'] += 1
+                delay = (body.get('parameters') or {}).get('retry_after') or retry_after(response) or self.backoff(attempt)
+            elif response is None or response.status_code >= 500:
+                delay = self.backoff(attempt)
+            else:
+                print(f"Message to chat {chat_id} refused: {response.status_code} {body.get('description')}")
+                return None
+
+            if attempt < self.max_retries:
+                self.counts['retries'] += 1
+                await asyncio.sleep(delay)
+        print(f"Giving up on a message to chat {chat_id} after {self.max_retries} retries")
+        return None
+
+    async def deliver(self, chat_id, queue):
+        # one sender per chat: its messages go out in order, one at a time
+        while True:
+            text, job_ids = await queue.get()
+            try:
+                message_id = await self.send(chat_id, text)
+                if message_id is None:
+                    self.counts['failed'] += 1
+                else:
+                    if self.log is not None:
+                        self.log.mark(chat_id, job_ids, message_id)
+                    self.counts['messages'] += 1
+                    self.counts['jobs'] += len(job_ids)
+            except Exception as e:
+                print(f"Error delivering to chat {chat_id}: {e}")
+                self.counts['failed'] += 1
+            finally:
+                queue.task_done()
+
+    def submit(self, chat_id, text, job_ids):
+        """queue one message, its chat's sender is started on the first one (call from the event loop)"""
+        queue = self.queues.get(chat_id)
+        if queue is None:
+            queue = self.queues[chat_id] = asyncio.Queue()
+            self.senders.append(asyncio.ensure_future(self.deliver(chat_id, queue)))
+        queue.put_nowait((text, job_ids))
+
+    async def join(self):
+        """wait until every queued message was sent or given up"""
+        for queue in self.queues.values():
+            await queue.join()
+        for task in self.senders:
+            task.cancel()
+        self.queues, self.senders = {}, []
+
+    async def anotify(self, chat_ids, entries):
+        """entries: {job id: entry text}, see job_entry"""
+        for chat_id in chat_ids:
+            sent = self.log.delivered(chat_id, list(entries)) if self.log is not None else set()
+            self.counts['skipped'] += len(sent)
+            pending = [(job_id, entry) for job_id, entry in entries.items() if job_id not in sent]
+            for text, job_ids in digests(pending, self.max_length):
+                self.submit(chat_id, text, job_ids)
+        await self.join()
+        return self.stats()
+
+    def notify(self, chat_ids, records):
+        """digests of the new jobs to every chat, returns the counts (see stats)"""
+        entries = {}
+        for record in records:
+            doc = job_summary(record)
+            entries[doc['_id']] = job_entry(doc)
+        return self.notify_entries(chat_ids, entries)
+
+    def notify_entries(self, chat_ids, entries):
+        return asyncio.run(self.anotify(chat_ids, entries))
+
+    def send_now(self, chat_id, text):
+        """one message outside a digest run (blocking), returns the message_id or None"""
+        return asyncio.run(self.send(chat_id, text))
+
+    def stats(self):
+        return dict(self.counts)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        if self.own_session:
+            self.session.close()
@@ -0,0 +1,213 @@
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+
+# backends accepted by parse(): two BeautifulSoup tree builders and the lexbor engine of selectolax
+PARSERS = ('html.parser', 'lxml', 'selectolax')
+
+CHARSET_HEADER = re.compile(r'charset=["\']?([\w.:-]+)', re.I)
+CHARSET_META = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.I)
+
+# text inside these tags is not returned by bs4 get_text()
+NON_TEXT_TAGS = ('script', 'style', 'template')
+
+
+def declared_charset(content, content_type=None):
+    # charset from the Content-Type header, then from <meta charset> at the top of the page
+    if content_type:
+        m = CHARSET_HEADER.search(content_type)
+        if m:
+            return m.group(1)
+    m = CHARSET_META.search(content[:2048])
+    if m:
+        return m.group(1).decode('ascii')
+    return None
+
+def decode_body(content, content_type=None, default='utf-8'):
+    """decode raw page bytes with the declared charset so the parser never has to guess the encoding"""
+    if isinstance(content, str):
+        return content
+
+    charset = declared_charset(content, content_type) or default
+    try:
+        return content.decode(charset, errors='replace')
+    except LookupError:
+        return content.decode(default, errors='replace')
+
+
+def subtree_strainer(subtrees):
+    # keep a tag (with everything inside it) only if it is one of the (tag name, class) subtrees
+    def match(name, attrs):
+        classes = (attrs or {}).get('class') or ''
+        if isinstance(classes, str):
+            classes = classes.split()
+        return any(name == tag and class_ in classes for tag, class_ in subtrees)
+    return SoupStrainer(match)
+
+def parse(html, parser='html.parser', subtrees=None):
+    """
+    input: page text (bytes are decoded with decode_body first), backend name in PARSERS,
+           optional list of (tag name, class) subtrees to build instead of the whole page
+    output: document exposing the BeautifulSoup calls the scrapers use (find, find_all, get_text, ...)
+    subtrees are filtered while parsing with the bs4 backends; lexbor has no parse-time filter
+    so selectolax always builds the whole page (it is still the fastest backend)
+    """
+    html = decode_body(html)
+
+    if parser in ('html.parser', 'lxml'):
+        if subtrees:
+            return BeautifulSoup(html, parser, parse_only=subtree_strainer(subtrees))
+        return BeautifulSoup(html, parser)
+
+    if parser == 'selectolax':
+        try:
+            from selectolax.lexbor import LexborHTMLParser
+        except ImportError:
+            raise ImportError("selectolax backend needs the selectolax package: pip install selectolax")
+        return LexborNode(LexborHTMLParser(html).root)
+
+    raise ValueError(f"Unknown parser backend: {parser}, expected one of {PARSERS}")
+
+
+def css_selector(name=None, class_=None, attrs=None):
+    # translate bs4 find() arguments into a css selector list
+    # a class_ with spaces matches the whole class attribute like bs4 does, otherwise one class token
+    names = name if isinstance(name, (list, tuple)) else [name]
+    classes = class_ if isinstance(class_, (list, tuple)) else [class_]
+    attr_part = ''.join('[{}="{}"]'.format(k, str(v).replace('"', '\\"')) for k, v in (attrs or {}).items())
+
+    selectors = []
+    for n in names:
+        for c in classes:
+            selector = n or ''
+            if c and ' ' in c.strip():
+                selector += '[class="{}"]'.format(c.replace('"', '\\"'))
+            elif c:
+                selector += '.' + c
+            selector += attr_part
+            selectors.append(selector or '*')
+    return ', '.join(selectors)
+
+def node_matches(node, name=None, class_=None, attrs=None):
+    if node.tag in ('-text', '-comment', '-document'):
+        return False
+    names = name if isinstance(name, (list, tuple)) else [name]
+    if name is not None and node.tag not in names:
+        return False
+
+    node_attrs = node.attributes
+    if class_ is not None:
+        value = node_attrs.get('class') or ''
+        classes = class_ if isinstance(class_, (list, tuple)) else [class_]
+        if not any(c == value or (' ' not in c.strip() and c in value.split()) for c in classes):
+            return False
+    for k, v in (attrs or {}).items():
+        if node_attrs.get(k) != v:
+            return False
+    return True
+
+
+class LexborNode:
+    """
+    bs4-like wrapper around a selectolax (lexbor) node
+    covers what the scrapers call: find, find_all, find_next, get_text, stripped_strings, get, [attr], .tag, clear
+    """
+
+    __slots__ = ('node',)
+
+    def __init__(self, node):
+        self.node = node
+
+    @property
+    def name(self):
+        return self.node.tag
+
+    def __getattr__(self, name):
+        # soup.span => first span descendant, like bs4
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.find(name)
+
+    def __getitem__(self, key):
+        attrs = self.node.attributes
+        if key not in attrs:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __eq__(self, other):
+        return isinstance(other, LexborNode) and self.node == other.node
+
+    def __hash__(self):
+        return self.node.mem_id
+
+    def __repr__(self):
+        return f'<LexborNode {self.node.tag}>'
+
+    def get(self, key, default=None):
+        attrs = self.node.attributes
+        if key not in attrs:
+            return default
+        if key == 'class':
+            return (attrs[key] or '').split()
+        return attrs[key]
+
+    def find(self, name=None, class_=None, attrs=None):
+        # css_first also matches the node it is called on, so search child by child to skip self
+        selector = css_selector(name, class_, attrs)
+        child = self.node.child
+        while child is not None:
+            if child.tag not in ('-text', '-comment'):
+                match = child.css_first(selector)
+                if match is not None:
+                    return LexborNode(match)
+            child = child.next
+        return None
+
+    def find_all(self, name=None, class_=None, attrs=None):
+        selector = css_selector(name, class_, attrs)
+        return [LexborNode(n) for n in self.node.css(selector) if n != self.node]
+
+    def find_next(self, name=None, class_=None, attrs=None):
+        # document order after this node, starting with its own descendants like bs4 next_elements
+        current = self.node
+        while True:
+            if current.child is not None:
+                current = current.child
+            else:
+                while current is not None and current.next is None:
+                    current = current.parent
+                if current is None:
+                    return None
+                current = current.next
+            if node_matches(current, name, class_, attrs):
+                return LexborNode(current)
+
+    def strings(self):
+        for n in self.node.traverse(include_text=True):
+            if n.tag == '-text' and n.parent.tag not in NON_TEXT_TAGS:
+                yield n.text_content
+
+    @property
+    def stripped_strings(self):
+        for s in self.strings():
+            s = s.strip()
+            if s:
+                yield s
+
+    def get_text(self, separator='', strip=False):
+        if strip:
+            return separator.join(self.stripped_strings)
+        return separator.join(self.strings())
+
+    def clear(self):
+        for child in list(self.node.iter(include_text=True)):
+            child.decompose()
+
+    def decompose(self):
+        # lexbor does not allow removing the root element, empty it instead
+        parent = self.node.parent
+        if parent is None or parent.tag == '-document':
+            self.clear()
+        else:
+            self.node.decompose()
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from dispatcher import dispatch
+from fetcher import NOT_MODIFIED, RETRY_LATER
+from metrics import NULL_METRICS, Metrics
+
+
+# put on a results queue when there are no more urls to submit
+END = object()
+
+
+async def iterate(urls):
+    # urls as a list or as an async generator (e.g. a listing crawl still in progress)
+    if hasattr(urls, '__aiter__'):
+        async for url in urls:
+            yield url
+    else:
+        for url in urls:
+            yield url
+
+async def stream(urls, submit, results, retries=None, limit=None):
+    """
+    call submit(url) (returns a task that puts one (url, result) item on results) for each url as soon as it is known,
+    yield the items of results until every submitted url has put its own
+    retries: the fetcher's RetryQueue, urls that came back as RETRY_LATER are submitted again when they are due
+    instead of being yielded
+    limit: max urls submitted and not yet yielded, so the number of live tasks does not grow with the url count
+    """
+    tasks = set()
+    submitted = 0
+    errors = []
+    slots = asyncio.Semaphore(limit) if limit else None
+
+    async def start(url):
+        nonlocal submitted
+        # counted before waiting for a slot, so a retry taken off the queue is never lost in between
+        submitted += 1
+        if slots is not None:
+            await slots.acquire()
+        task = submit(url)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def feed():
+        try:
+            async for url in iterate(urls):
+                await start(url)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            await results.put(END)
+
+    async def feed_retries():
+        while True:
+            await start(await retries.next())
+
+    feeders = [asyncio.ensure_future(feed())]
+    if retries is not None:
+        feeders.append(asyncio.ensure_future(feed_retries()))
+    feeding = True
+    received = 0
+    try:
+        while feeding or received < submitted or (retries is not None and len(retries)):
+            item = await results.get()
+            if item is END:
+                feeding = False
+                continue
+            received += 1
+            if slots is not None:
+                slots.release()
+            if item[1] == RETRY_LATER:
+                continue
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        for task in feeders + list(tasks):
+            task.cancel()
+
+
+def parse_page(url, html, parser='html.parser', typed=False, timed=False):
+    # runs in a parser process: raw html => (record dict or JobRecord, cpu seconds spent parsing,
+    # stage timings of the page to merge into the run's Metrics or None if not timed)
+    start = time.process_time()
+    metrics = Metrics() if timed else None
+    job_data = dispatch(url, html, parser=parser, typed=typed, metrics=metrics)
+    return job_data, time.process_time() - start, metrics.samples() if timed else None
+
+
+async def run_pipeline(urls, fetcher, workers=None, queue_size=None, parser='html.parser', stats=None, typed=False,
+                       metrics=None):
+    """
+    two-stage crawl, yield (url, job_data) as records come out
+    (job_data is None if the url failed, NOT_MODIFIED if the fetcher skipped an unchanged page)
+    I/O stage: the fetcher downloads pages concurrently in this process
+    parse stage: `workers` processes turn raw html into record dicts, off the event loop and the GIL
+    the pages queue holds at most queue_size pages and fetching pauses when it is full,
+    so memory stays flat however many urls there are
+    urls can be an async generator: pages are fetched as their urls come out of it
+    failed fetches wait on the fetcher's retry queue without holding a fetch slot
+    stats: optional dict, parse_cpu / parsed_bytes of the parsed pages are added to it
+    typed: the workers send back JobRecords (slotted, smaller to pickle than the nested dicts)
+    metrics: Metrics the parse / extract_* stages of the workers are merged into (fetches are timed by the fetcher's own)
+    """
+    metrics = metrics if metrics is not None else NULL_METRICS
+    workers = workers or os.cpu_count() or 1
+    queue_size = queue_size or workers * 2
+
+    loop = asyncio.get_event_loop()
+    pages = asyncio.Queue(maxsize=queue_size)
+    records = asyncio.Queue(maxsize=queue_size)
+    # a fetched page is held until it gets a place in the queue, so fetches are bounded too
+    fetch_slots = asyncio.Semaphore(fetcher.max_in_flight)
+
+    async def fetch_one(url):
+        async with fetch_slots:
+            try:
+                html = await fetcher.fetch(url, defer=True)
+            except Exception as e:
+                print(f"Error fetching URL {url}: {e}")
+                html = None
+            if html == RETRY_LATER:
+                await records.put((url, RETRY_LATER))
+            else:
+                await pages.put((url, html))
+
+    async def parse_worker(pool):
+        while True:
+            url, html = await pages.get()
+            job_data = None
+            if html == NOT_MODIFIED:
+                job_data = NOT_MODIFIED
+            elif html is None:
+                print('Failed to load page content: ' + url)
+            else:
+                try:
+                    job_data, cpu, samples = await loop.run_in_executor(pool, parse_page, url, html, parser, typed, metrics.enabled)
+                    metrics.merge(samples)
+                    if stats is not None:
+                        stats['parse_cpu'] = stats.get('parse_cpu', 0) + cpu
+                        stats['parsed_bytes'] = stats.get('parsed_bytes', 0) + len(html.encode('utf-8'))
+                except Exception as e:
+                    print(f"Error processing URL {url}: {e}")
+                    metrics.error('parse', type(e).__name__)
+            await records.put((url, job_data))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parsers = [asyncio.ensure_future(parse_worker(pool)) for _ in range(workers)]
+        try:
+            # enough submitted urls to fill the fetch slots and both queues, no more
+            limit = fetcher.max_in_flight + 2 * queue_size + workers
+            async for item in stream(urls, lambda url: asyncio.ensure_future(fetch_one(url)), records, getattr(fetcher, 'retries', None), limit):
+                yield item
+        finally:
+            for task in parsers:
+                task.cancel()
@@ -0,0 +1,267 @@
+import json
+import re
+import unicodedata
+from dataclasses import dataclass, field, fields
+from operator import attrgetter
+
+try:
+    import orjson
+except ImportError:  # optional, json below is used without it
+    orjson = None
+
+
+def slotted(cls):
+    """
+    same class with __slots__ instead of a __dict__ per instance (what dataclass(slots=True) does, it needs python 3.10
+    and the airflow image runs 3.8): the instances are smaller and the attribute set is fixed
+    """
+    names = tuple(f.name for f in fields(cls))
+    body = {k: v for k, v in cls.__dict__.items() if k not in names + ('__dict__', '__weakref__')}
+    body['__slots__'] = names
+    return type(cls)(cls.__name__, cls.__bases__, body)
+
+
+@slotted
+@dataclass
+class Company:
+    name: str = None
+    scale: str = None
+    address: str = None
+    field: str = None
+    website: str = None
+
+
+@slotted
+@dataclass
+class JobRecord:
+    """
+    input: record dict of any of the three scrapers (see from_scraped)
+    output: one typed record, same fields whatever the page type, labels already mapped to fields
+    flow: scraper dict => normalize labels (LABELS) => JobRecord => to_document() / encode_json()
+    labels not in LABELS are kept in `extra` so nothing scraped is lost
+    """
+    id: str
+    url: str
+    date: str = None
+    kind: str = None
+    title: str = None
+    salary: str = None
+    location: str = None
+    experience: str = None
+    level: str = None
+    education: str = None
+    headcount: str = None
+    employment_type: str = None
+    gender: str = None
+    salary_min: float = None
+    salary_max: float = None
+    currency: str = None
+    exp_min_years: float = None
+    simhash: str = None
+    company: Company = None
+    description: str = None
+    requirements: str = None
+    benefits: str = None
+    income: str = None
+    allowance: str = None
+    equipment: str = None
+    work_location: str = None
+    working_time: str = None
+    how_to_apply: str = None
+    tags: list = field(default_factory=list)
+    industries: list = field(default_factory=list)
+    areas: list = field(default_factory=list)
+    skills: list = field(default_factory=list)
+    extra: dict = field(default_factory=dict)
+
+
+# field order of the encoded documents, `id` is stored as _id
+JOB_FIELDS = tuple(f.name for f in fields(JobRecord))
+COMPANY_FIELDS = tuple(f.name for f in fields(Company))
+LIST_FIELDS = {'tags', 'industries', 'areas', 'skills'}
+# set by the scrapers next to the raw strings (see normalize.py), not labels of the page
+NUMERIC_FIELDS = ('salary_min', 'salary_max', 'currency', 'exp_min_years')
+# computed from the content by the scrapers: the numeric fields and the fingerprint of dedupe.py
+DERIVED_FIELDS = NUMERIC_FIELDS + ('simhash',)
+# one C call per record instead of a getattr per field when encoding, company is encoded apart
+DOCUMENT_FIELDS = tuple(name for name in JOB_FIELDS if name not in ('id', 'company'))
+job_values = attrgetter(*DOCUMENT_FIELDS)
+company_values = attrgetter(*COMPANY_FIELDS)
+
+# label variants (see fold_label) => field, one table for the whole page: the same label means the same thing
+# whether it is in the general info, the job description or the related tags of a page
+LABELS = {
+    'job title': 'title', 'job_title': 'title', 'tieu de': 'title', 'vi tri': 'title',
+    'salary': 'salary', 'muc luong': 'salary', 'luong': 'salary',
+    'location': 'location', 'dia diem': 'location',
+    'experience': 'experience', 'kinh nghiem': 'experience',
+    'cap bac': 'level', 'level': 'level',
+    'hoc van': 'education', 'trinh do': 'education',
+    'so luong tuyen': 'headcount', 'so luong': 'headcount',
+    'hinh thuc lam viec': 'employment_type', 'hinh thuc': 'employment_type',
+    'gioi tinh': 'gender',
+    'mo ta cong viec': 'description', 'job description': 'description',
+    'yeu cau ung vien': 'requirements', 'yeu cau cong viec': 'requirements', 'yeu cau': 'requirements',
+    'quyen loi': 'benefits', 'quyen loi duoc huong': 'benefits', 'phuc loi': 'benefits',
+    'thu nhap': 'income',
+    'phu cap': 'allowance',
+    'thiet bi lam viec': 'equipment',
+    'dia diem lam viec': 'work_location', 'noi lam viec': 'work_location',
+    'thoi gian lam viec': 'working_time',
+    'cach thuc ung tuyen': 'how_to_apply', 'cach ung tuyen': 'how_to_apply',
+    'job_tags': 'tags', 'tu khoa': 'tags',
+    'danh muc nghe lien quan': 'industries', 'nganh nghe': 'industries',
+    'khu vuc': 'areas',
+    'ky nang can co': 'skills', 'ky nang nen co': 'skills', 'ky nang': 'skills',
+}
+
+COMPANY_LABELS = {
+    'company_name': 'name', 'name': 'name', 'ten cong ty': 'name',
+    'company_scale': 'scale', 'quy mo': 'scale',
+    'company_address': 'address', 'dia chi': 'address',
+    'company_field': 'field', 'linh vuc': 'field', 'nganh nghe': 'field',
+    'website': 'website',
+}
+
+AREA_PREFIX = re.compile(r'^\s*khu vực\s*:\s*', re.IGNORECASE)
+SPACES = re.compile(r'\s+')
+
+# the same few dozen labels come back on every page, each is folded once
+FOLDED_LABELS = {}
+
+
+def fold_label(label):
+    """'Yêu Cầu Ứng Viên:' => 'yeu cau ung vien' (no case, diacritics, trailing colon or extra spaces)"""
+    folded = FOLDED_LABELS.get(label)
+    if folded is None:
+        text = unicodedata.normalize('NFD', label.replace('đ', 'd').replace('Đ', 'D'))
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+        folded = FOLDED_LABELS[label] = SPACES.sub(' ', text).strip(' :').lower()
+    return folded
+
+def label_field(label, table=LABELS):
+    return table.get(fold_label(label))
+
+def assign(record, label, value):
+    """put one scraped (label, value) on the record: a list field is extended, a text field keeps its first value"""
+    name = label_field(label)
+    if name is None:
+        record.extra[label] = value
+    elif name in LIST_FIELDS:
+        getattr(record, name).extend(value if isinstance(value, list) else [value])
+    elif getattr(record, name) is None:
+        setattr(record, name, value)
+    else:
+        record.extra[label] = value
+
+def company_from(info):
+    company = Company()
+    extra = {}
+    for label, value in info.items():
+        name = label_field(label, COMPANY_LABELS)
+        if name is None or getattr(company, name) is not None:
+            extra[label] = value
+        else:
+            setattr(company, name, value)
+    return company, extra
+
+
+def copy_derived(record, data):
+    for name in DERIVED_FIELDS:
+        setattr(record, name, data.get(name))
+
+def from_normal(data):
+    record = JobRecord(data['_id'], data['url'], data.get('date'), 'normal')
+    copy_derived(record, data)
+    record.company, extra = company_from(data.get('company_info', {}))
+    record.extra.update(extra)
+    job_info = data.get('job_info', {})
+    for label, value in job_info.items():
+        if label != 'general_info':
+            assign(record, label, value)
+    for section in (job_info.get('general_info', {}), data.get('job_description', {}), data.get('categories', {})):
+        for label, value in section.items():
+            assign(record, label, value)
+    return record
+
+def from_premium(data):
+    record = JobRecord(data['_id'], data['url'], data.get('date'), 'premium')
+    copy_derived(record, data)
+    tags = data.get('tags', {})
+    for label, value in data.get('general_info', {}).items():
+        assign(record, label, value)
+    for label, value in data.get('job_description', {}).items():
+        assign(record, label, value)
+    record.tags.extend(tags.get('job_tags', []))
+    for label, value in tags.get('related_tags', {}).items():
+        assign(record, label, value)
+    return record
+
+def from_brand(data):
+    record = JobRecord(data['_id'], data['url'], data.get('date'), 'brand')
+    copy_derived(record, data)
+    record.company, extra = company_from(data.get('company_info', {}))
+    record.extra.update(extra)
+    general_info = dict(data.get('general_info', {}))
+    # 'Khu vực: Hà Nội\n<street address>': the area is the location, the address where the job is done
+    lines = general_info.pop('Location', '').split('\n')
+    if lines[0]:
+        record.location = AREA_PREFIX.sub('', lines[0])
+        record.work_location = '\n'.join(lines[1:]) or None
+    for label, value in general_info.items():
+        assign(record, label, value)
+    for label, value in data.get('job_description', {}).items():
+        if label_field(label) == 'work_location':
+            # the job description states it in full, it wins over the short address of the header
+            record.work_location = None
+        assign(record, label, value)
+    record.tags.extend(data.get('tags', []))
+    return record
+
+def from_scraped(data):
+    """record dict of any scraper => JobRecord, the page type is told by the shape of the dict"""
+    if 'job_info' in data or 'categories' in data:
+        return from_normal(data)
+    if isinstance(data.get('tags'), dict):
+        return from_premium(data)
+    return from_brand(data)
+
+
+def to_document(record):
+    """
+    JobRecord => dict in field order (company last), `id` as _id, empty fields left out (smaller documents, same hash for the same content)
+    dicts (records of the scrapers) are returned as they are, so writers and sinks take both
+    """
+    # tested on dict: the module is imported both as records and classes.records, two different JobRecord classes
+    if isinstance(record, dict):
+        return record
+    doc = {'_id': record.id}
+    for name, value in zip(DOCUMENT_FIELDS, job_values(record)):
+        # 0 years of experience is a value, not an empty field
+        if value or value == 0:
+            doc[name] = value
+    company = record.company
+    if company is not None:
+        company = {name: value for name, value in zip(COMPANY_FIELDS, company_values(company)) if value is not None}
+        if company:
+            doc['company'] = company
+    return doc
+
+def flatten(record):
+    """record of any shape (scraper dict, stored document, flat document or JobRecord) => flat document"""
+    if isinstance(record, dict) and 'kind' not in record:
+        record = from_scraped(record)
+    return to_document(record)
+
+def record_id(record):
+    return record['_id'] if isinstance(record, dict) else record.id
+
+# built once: json.dumps(..., ensure_ascii=False) builds a new encoder on every call
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, default=str)
+
+def encode_json(record):
+    """record (JobRecord or dict) => JSON text, with orjson when it is installed"""
+    doc = to_document(record)
+    if orjson is not None:
+        return orjson.dumps(doc, default=str).decode('utf-8')
+    return JSON_ENCODER.encode(doc)
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+
+# indexes of the jobs collection, by name
+JOB_INDEXES = [
+    IndexModel([('_run_id', ASCENDING)], name='run_id'),
+    IndexModel([('_scraped_at', DESCENDING)], name='scraped_at'),
+    IndexModel([('_updated_at', DESCENDING)], name='updated_at'),
+    IndexModel([('date', DESCENDING)], name='date'),
+    IndexModel([('url', ASCENDING)], name='url'),
+    # range filters on the normalized fields (see normalize.py), amounts compare only within one currency
+    IndexModel([('currency', ASCENDING), ('salary_min', ASCENDING)], name='salary_min'),
+    IndexModel([('currency', ASCENDING), ('salary_max', ASCENDING)], name='salary_max'),
+    IndexModel([('exp_min_years', ASCENDING)], name='exp_min_years'),
+    # documents without a fingerprint yet (see storage.backfill_normalized) and exact duplicates
+    IndexModel([('simhash', ASCENDING)], name='simhash'),
+]
+
+# shapes of the queries run against the jobs collection, each one must be answered from an index
+# (the values only matter for the plan shape)
+JOB_QUERIES = {
+    'run_id': {'_run_id': 'scheduled__2000-01-01T00:00:00+00:00'},
+    # jobs first seen in a run, notified by the DAG
+    'new_in_run': {'_run_id': 'scheduled__2000-01-01T00:00:00+00:00', '$expr': {'$eq': ['$_scraped_at', '$_updated_at']}},
+    'scraped_since': {'_scraped_at': {'$gte': datetime(2000, 1, 1)}},
+    'updated_since': {'_updated_at': {'$gte': datetime(2000, 1, 1)}},
+    'date': {'date': '2000-01-01'},
+    'url': {'url': 'https://www.topcv.vn/'},
+    'salary_at_least': {'currency': 'VND', 'salary_max': {'$gte': 20000000}},
+    'salary_between': {'currency': 'USD', 'salary_min': {'$gte': 1000, '$lte': 2000}},
+    'experience_at_most': {'exp_min_years': {'$lte': 2}},
+    # documents scraped before the normalized fields or the fingerprint existed, see storage.backfill_normalized
+    'not_normalized': {'$or': [{'currency': {'$exists': False}}, {'simhash': {'$exists': False}}]},
+    # stored fingerprints loaded by dedupe.DuplicateIndex
+    'simhash_since': {'simhash': {'$exists': True}, '_scraped_at': {'$gte': datetime(2000, 1, 1)}},
+}
+
+
+def ensure_indexes(coll, indexes=None):
+    """
+    create the missing indexes (create_indexes is a no-op for existing ones) and return the names still missing after it
+    """
+    indexes = JOB_INDEXES if indexes is None else indexes
+    coll.create_indexes(indexes)
+    existing = coll.index_information()
+    return [index.document['name'] for index in indexes if index.document['name'] not in existing]
+
+def plan_stages(plan):
+    # every stage of a winning plan, inputStage / inputStages nest the children
+    stages = [plan.get('stage')]
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            stages += plan_stages(child)
+    return stages
+
+def explain_queries(coll, queries=None):
+    """
+    winning plan of each query => {name: {'stages': [...], 'index': bool}}
+    a query whose plan has a COLLSCAN stage scans the whole collection
+    """
+    queries = JOB_QUERIES if queries is None else queries
+    report = {}
+    for name, query in queries.items():
+        plan = coll.find(query).explain()['queryPlanner']['winningPlan']
+        # sharded / newer servers wrap the plan in queryPlan
+        stages = plan_stages(plan.get('queryPlan', plan))
+        report[name] = {'stages': stages, 'index': 'COLLSCAN' not in stages}
+    return report
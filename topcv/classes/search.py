@@ -0,0 +1,285 @@
+import heapq
+import math
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import timedelta
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from normalize import USD_VND, fold, number, parse_salary, salary_million_vnd
+from records import flatten
+
+
+# a term found in the title counts more than one in the tags, the location or the job description
+FIELD_WEIGHTS = {'title': 3.0, 'tags': 2.0, 'location': 2.0, 'text': 1.0}
+# names are written in syllables ('Hà Nội', 'Node JS') and queried both ways ('hanoi', 'nodejs'): the syllables of the
+# short fields are also indexed joined by 2, and by 3 in the location ('Hồ Chí Minh')
+JOINED = {'title': 2, 'tags': 2, 'location': 3, 'text': 1}
+ALIASES = {'hn': 'hanoi', 'hcm': 'hochiminh', 'tphcm': 'hochiminh', 'sg': 'hochiminh', 'saigon': 'hochiminh', 'dn': 'danang'}
+# distinct terms of the job description kept per job (the most frequent), bounds the postings of long descriptions
+MAX_TEXT_TERMS = 300
+# saturation of the term frequency in a field (BM25 k1), tf / (tf + k1) precomputed for the usual frequencies
+TF_SATURATION = 1.2
+SATURATED = [tf / (tf + TF_SATURATION) for tf in range(64)]
+
+TOKEN = re.compile(r'[a-z0-9+#]+')
+# '20tr', '20 triệu', '1500 usd', '1,500$' in a query: the least salary wanted
+SALARY_QUERY = re.compile(r'(\d+(?:[.,]\d+)?)\s*(tr|trieu|m|usd|\$)(?![a-z0-9])')
+# salaries are compared in millions of VND
+USD_MILLION_VND = USD_VND / 1000000
+# a refresh reads back this far before the watermark: a writer takes its _updated_at before its bulk write, so a slow
+# write can commit after a later one already indexed
+REFRESH_SLACK = timedelta(minutes=5)
+
+
+def terms(text, joined=1):
+    """terms of a text, joined: also the runs of up to that many tokens written as one ('ha noi' => 'hanoi')"""
+    tokens = TOKEN.findall(fold(text))
+    if joined >= 2:
+        tokens += [a + b for a, b in zip(tokens, tokens[1:])]
+    if joined >= 3:
+        tokens += [a + b + c for a, b, c in zip(tokens, tokens[1:], tokens[2:])]
+    return tokens
+
+def parse_query(query):
+    """'python hanoi 20tr' => (['python', 'hanoi'], 20.0)"""
+    folded = fold(query)
+    min_salary = None
+    match = SALARY_QUERY.search(folded)
+    if match:
+        value = number(match.group(1))
+        min_salary = value * USD_MILLION_VND if match.group(2) in ('usd', '$') else value
+        folded = folded[:match.start()] + ' ' + folded[match.end():]
+    return [ALIASES.get(term, term) for term in TOKEN.findall(folded)], min_salary
+
+def salary_bounds(doc):
+    """(min, max) salary of a flat document in millions of VND, parsed here for documents stored before normalize.py"""
+    if 'currency' in doc:
+        salary_min, salary_max, currency = doc.get('salary_min'), doc.get('salary_max'), doc['currency']
+    else:
+        salary_min, salary_max, currency = parse_salary(doc.get('salary'))
+    return salary_million_vnd(salary_min, currency), salary_million_vnd(salary_max, currency)
+
+def job_fields(doc):
+    """flat document => text of each indexed field (lists: one text per item)"""
+    return {
+        'title': [doc.get('title') or ''],
+        'tags': doc.get('tags', []) + doc.get('industries', []) + doc.get('skills', []),
+        'location': [doc.get('location') or ''] + doc.get('areas', []),
+        # one text, nothing is joined across it
+        'text': ['\n'.join(doc.get(name) or '' for name in ('description', 'requirements', 'benefits'))],
+    }
+
+
+class SearchIndex:
+    """
+    input: documents of the jobs collection (any shape, see records.flatten)
+    output: best jobs for a query like 'python hanoi 20tr', ranked
+    flow: fold (case, Vietnamese diacritics) => terms of each field => postings: term => doc numbers and weights in typed arrays
+          query: terms => jobs holding all of them (rarest term first, any of them if none has all) => sum of idf * weight
+          => jobs paying less than the salary asked are dropped, jobs without a salary are ranked lower
+    memory: one short summary per job, postings as arrays, at most max_docs jobs (the most recently scraped are kept)
+            and max_text_terms terms of each job description
+    refresh: jobs updated since the watermark (latest _updated_at indexed) less REFRESH_SLACK are added or replaced,
+             see refresh()
+    """
+
+    def __init__(self, max_docs=50000, max_text_terms=MAX_TEXT_TERMS, refresh_interval=300):
+        self.max_docs = max_docs
+        self.max_text_terms = max_text_terms
+        self.refresh_interval = refresh_interval
+        # term => (doc numbers, weights)
+        self.postings = {}
+        # doc number => (job id, title, company, salary, location, url, salary min, salary max, scraped at, updated at),
+        # None once removed
+        self.jobs = []
+        self.numbers = {}
+        self.watermark = None
+        self.refreshed_at = None
+        # a refresh in a worker thread adds jobs while searches run
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def add(self, doc):
+        """index one document, a job already indexed is replaced"""
+        scraped_at = doc.get('_scraped_at')
+        # documents written before _updated_at was kept have only _scraped_at
+        updated_at = doc.get('_updated_at') or scraped_at
+        doc = flatten(doc)
+        weights = {}
+        for name, texts in job_fields(doc).items():
+            counts = Counter()
+            for text in texts:
+                counts.update(terms(text, JOINED[name]))
+            if name == 'text' and len(counts) > self.max_text_terms:
+                counts = dict(counts.most_common(self.max_text_terms))
+            field_weight = FIELD_WEIGHTS[name]
+            for term, tf in counts.items():
+                saturated = SATURATED[tf] if tf < 64 else tf / (tf + TF_SATURATION)
+                weights[term] = weights.get(term, 0) + field_weight * saturated
+
+        salary_min, salary_max = salary_bounds(doc)
+        job = (doc['_id'], doc.get('title'), (doc.get('company') or {}).get('name'), doc.get('salary'),
+               doc.get('location'), doc['url'], salary_min, salary_max, scraped_at, updated_at)
+
+        with self.lock:
+            self.remove(doc['_id'])
+            number = len(self.jobs)
+            self.jobs.append(job)
+            self.numbers[doc['_id']] = number
+            for term, weight in weights.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = (array('I'), array('f'))
+                postings[0].append(number)
+                postings[1].append(weight)
+
+            if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+            # some slack so the arrays are not rebuilt for every job added past max_docs
+            if len(self.numbers) > self.max_docs * 1.1 or len(self.jobs) > 2 * max(len(self.numbers), 1000):
+                self.compact()
+
+    def indexed(self, doc):
+        """whether this version of the job is the one indexed"""
+        number = self.numbers.get(doc['_id'])
+        return number is not None and self.jobs[number][9] == (doc.get('_updated_at') or doc.get('_scraped_at'))
+
+    def remove(self, job_id):
+        # the postings keep the doc number until the next compact(), searches skip removed jobs
+        number = self.numbers.pop(job_id, None)
+        if number is not None:
+            self.jobs[number] = None
+
+    def compact(self):
+        """keep the max_docs most recently scraped jobs, renumber them and drop the postings of the others (lock held)"""
+        live = list(self.numbers.values())
+        if len(live) > self.max_docs:
+            # jobs without _scraped_at go first, then the oldest
+            newest = lambda number: (self.jobs[number][8] is not None, self.jobs[number][8] or 0, number)
+            live = heapq.nlargest(self.max_docs, live, key=newest)
+        live.sort()
+        renumber = {old: new for new, old in enumerate(live)}
+        self.jobs = [self.jobs[old] for old in live]
+        self.numbers = {job[0]: new for new, job in enumerate(self.jobs)}
+
+        postings = {}
+        for term, (numbers, weights) in self.postings.items():
+            kept = [(renumber[number], weight) for number, weight in zip(numbers, weights) if number in renumber]
+            if kept:
+                postings[term] = (array('I', [number for number, _ in kept]), array('f', [weight for _, weight in kept]))
+        self.postings = postings
+
+    def score(self, found, every=True):
+        """doc number => sum of idf * weight over the postings found, every: only jobs in all of them"""
+        total = len(self.numbers)
+        scores = {}
+        # rarest first: the fewest candidates to carry through the intersection
+        for i, (numbers, weights) in enumerate(sorted(found, key=lambda postings: len(postings[0]))):
+            idf = math.log(1 + (total - len(numbers) + 0.5) / (len(numbers) + 0.5))
+            if i == 0:
+                scores = {number: idf * weight for number, weight in zip(numbers, weights)}
+            elif every:
+                matched = {}
+                for number, weight in zip(numbers, weights):
+                    score = scores.get(number)
+                    if score is not None:
+                        matched[number] = score + idf * weight
+                scores = matched
+            else:
+                for number, weight in zip(numbers, weights):
+                    scores[number] = scores.get(number, 0) + idf * weight
+        return scores
+
+    def search(self, query, limit=10):
+        """ranked jobs for the query, each a dict with _id, title, company, salary, location, url and score"""
+        words, min_salary = parse_query(query)
+        with self.lock:
+            return self.ranked(words, min_salary, limit)
+
+    def ranked(self, words, min_salary, limit):
+        found = [self.postings[word] for word in dict.fromkeys(words) if word in self.postings]
+        if not found and min_salary is None:
+            return []
+
+        if not found:
+            # a salary alone: same score, the newest jobs (highest doc number) come first
+            scores = dict.fromkeys(self.numbers.values(), 1.0)
+        else:
+            # jobs with all the words, or with any of them if none has them all
+            scores = self.score(found, every=len(found) == len(set(words)))
+            if not scores and len(found) > 1:
+                scores = self.score(found, every=False)
+
+        results = []
+        for number, score in scores.items():
+            job = self.jobs[number]
+            if job is None:
+                continue
+            if min_salary is not None:
+                salary = job[7] if job[7] is not None else job[6]
+                if salary is None:
+                    score *= 0.5
+                elif salary < min_salary:
+                    continue
+            results.append((score, number))
+
+        return [
+            dict(zip(('_id', 'title', 'company', 'salary', 'location', 'url'), self.jobs[number][:6]), score=round(score, 3))
+            for score, number in heapq.nlargest(limit, results)
+        ]
+
+    def build(self, coll, batch_size=1000):
+        """index the max_docs most recently scraped jobs of the collection (streamed, _scraped_at index)"""
+        cursor = coll.find({}, {'_hash': 0, '_run_id': 0}, batch_size=batch_size).sort('_scraped_at', -1).limit(self.max_docs)
+        for doc in cursor:
+            self.add(doc)
+        self.refreshed_at = time.monotonic()
+        return len(self)
+
+    def refresh(self, coll, batch_size=1000):
+        """
+        index the jobs updated since the watermark (new or content changed, the _updated_at index), returns how many
+        were added or replaced; the jobs read again within REFRESH_SLACK and not changed since are skipped
+        """
+        if self.watermark is None:
+            return self.build(coll, batch_size)
+        added = 0
+        since = self.watermark - REFRESH_SLACK
+        cursor = coll.find({'_updated_at': {'$gte': since}}, {'_hash': 0, '_run_id': 0}, batch_size=batch_size).sort('_updated_at', 1)
+        for doc in cursor:
+            if self.indexed(doc):
+                continue
+            self.add(doc)
+            added += 1
+        self.refreshed_at = time.monotonic()
+        return added
+
+    def stale(self):
+        return self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.refresh_interval
+
+    def stats(self):
+        postings = sum(len(numbers) for numbers, _ in self.postings.values())
+        # what the index holds: the postings, their terms and arrays, and the summaries of the jobs
+        size = sys.getsizeof(self.postings) + sys.getsizeof(self.jobs) + sys.getsizeof(self.numbers)
+        for term, entry in self.postings.items():
+            size += sys.getsizeof(term) + sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+        for job in self.jobs:
+            if job is not None:
+                size += sys.getsizeof(job) + sum(sys.getsizeof(value) for value in job if value is not None)
+        return {
+            'jobs': len(self.numbers),
+            'terms': len(self.postings),
+            'postings': postings,
+            'memory_kb': round(size / 1024, 1),
+        }
@@ -0,0 +1,72 @@
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+USER_AGENTS = ['Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
+               'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:54.0) Gecko/20100101 Firefox/54.0',
+               'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_6) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/11.1 Safari/605.1.15',
+               'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/61.0.3163.100 Safari/537.36']
+
+
+class ScraperSession:
+    """
+    keep-alive HTTP session shared by the scrapers and the listing functions
+    headers (and the User-Agent picked for this run) are set once here instead of in every fetch
+    pool_connections: number of hosts kept in the pool, pool_maxsize: max open connections per host
+    """
+
+    def __init__(self, pool_connections=2, pool_maxsize=8, pool_block=True, user_agent=None, timeout=30):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': user_agent or random.choice(USER_AGENTS)})
+
+        # pool_block: wait for a free connection instead of opening extra ones that are thrown away
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self.requests_sent = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self.lock:
+            self.requests_sent += 1
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self.lock:
+            self.requests_sent += 1
+        return self.session.post(url, **kwargs)
+
+    def stats(self):
+        # each urllib3 pool counts the connections it opened and the requests sent over them
+        pools = self.adapter.poolmanager.pools
+        connections = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+
+        return {
+            'requests': self.requests_sent,
+            'connections_opened': connections,
+            'connections_reused': max(self.requests_sent - connections, 0),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_default_session = None
+
+def get_default_session():
+    """Shared session used by listing functions and fetchers created without one"""
+    global _default_session
+    if _default_session is None:
+        _default_session = ScraperSession()
+    return _default_session
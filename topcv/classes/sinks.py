@@ -0,0 +1,169 @@
+import sys
+import os
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from storage import BulkJobWriter, FileDeliveryLog, get_mongo_client
+from records import encode_json, record_id, to_document
+from notifier import TELEGRAM_API, TelegramNotifier, job_entry, job_summary
+
+
+class MongoSink:
+    """
+    records => jobs collection, through a BulkJobWriter (batched idempotent upserts)
+    JobRecords are stored flat (see records.to_document), dicts as the scrapers built them
+    """
+
+    def __init__(self, coll, batch_size=100, flush_interval=5.0, run_id=None, metrics=None):
+        self.writer = BulkJobWriter(coll, batch_size=batch_size, flush_interval=flush_interval, run_id=run_id, metrics=metrics)
+
+    @classmethod
+    def from_uri(cls, uri, db='topcv_db', coll='jobs', **kwargs):
+        return cls(get_mongo_client(uri)[db][coll], **kwargs)
+
+    def write(self, record):
+        self.writer.add(to_document(record))
+
+    def merge(self, original_id, record):
+        # a near duplicate of original_id (see dedupe.py): only its id is kept, in the _aliases of the original
+        self.writer.merge(original_id, record_id(record))
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        return self.writer.close()
+
+
+class JsonlSink:
+    """
+    records => one JSON document per line in a file (appended)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+        self.written = 0
+
+    def write(self, record):
+        self.file.write(encode_json(record) + '\n')
+        self.written += 1
+
+    def merge(self, original_id, record):
+        # the original was written already
+        pass
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+        return {'written': self.written}
+
+
+class StdoutSink:
+    """
+    records => JSON lines on stdout, e.g. to pipe a crawl into jq
+    the stream is the stdout of when the sink was opened: scrape.py then sends its messages to stderr
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+        self.written = 0
+
+    def write(self, record):
+        self.stream.write(encode_json(record) + '\n')
+        self.written += 1
+
+    def merge(self, original_id, record):
+        pass
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+        return {'written': self.written}
+
+
+class IdSink:
+    """
+    job ids => a set-like (set, BloomFilter), e.g. the known ids of an incremental crawl
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def write(self, record):
+        self.ids.add(record_id(record))
+
+    def merge(self, original_id, record):
+        # known as well: the next incremental crawl does not fetch the duplicate again
+        self.ids.add(record_id(record))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        return {}
+
+
+class TelegramSink:
+    """
+    new jobs => Telegram digests, sent when the crawl is over (see notifier.TelegramNotifier)
+    only the short entry of each job is kept until then
+    """
+
+    def __init__(self, chat_ids, notifier):
+        self.chat_ids = chat_ids
+        self.notifier = notifier
+        self.entries = {}
+
+    @classmethod
+    def from_env(cls, chat_ids):
+        # TELEGRAM_BOT_TOKEN as for bot/jobsnitch.py, TELEGRAM_API_BASE to send to a stand-in for the Bot API,
+        # TELEGRAM_DELIVERY_LOG: json file of the jobs already sent, so a rerun does not send them again
+        notifier = TelegramNotifier(
+            os.environ['TELEGRAM_BOT_TOKEN'],
+            api_base=os.getenv('TELEGRAM_API_BASE', TELEGRAM_API),
+            log=FileDeliveryLog(os.getenv('TELEGRAM_DELIVERY_LOG', 'notified.json')),
+        )
+        return cls(chat_ids, notifier)
+
+    def write(self, record):
+        doc = job_summary(record)
+        self.entries[doc['_id']] = job_entry(doc)
+
+    def merge(self, original_id, record):
+        # a repost is not a new job
+        pass
+
+    def flush(self):
+        # digests are sent by close(), a crash before it sends nothing
+        pass
+
+    def close(self):
+        try:
+            return self.notifier.notify_entries(self.chat_ids, self.entries)
+        finally:
+            self.notifier.close()
+
+
+def open_sink(spec, metrics=None):
+    """
+    sink from a command line spec: 'stdout', 'jsonl:<path>', 'mongo:<uri>' or 'telegram:<chat id>[,<chat id>...]'
+    metrics: Metrics the mongo writes are timed into (db_write)
+    """
+    kind, _, target = spec.partition(':')
+    if kind == 'stdout':
+        return StdoutSink()
+    if kind == 'jsonl' and target:
+        return JsonlSink(target)
+    if kind == 'mongo' and target:
+        return MongoSink.from_uri(target, metrics=metrics)
+    if kind == 'telegram' and target:
+        return TelegramSink.from_env(target.split(','))
+    raise ValueError(f"unknown sink {spec!r}, expected stdout, jsonl:<path>, mongo:<uri> or telegram:<chat ids>")
@@ -0,0 +1,365 @@
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+import sys
+
+# ensure repository root is on path so we can import main and classes
+BASE_DIR = os.path.dirname(__file__)
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from normalize import normalize_batch
+from dedupe import fingerprint
+from records import NUMERIC_FIELDS
+from utils import job_id
+from metrics import NULL_METRICS
+
+
+# written by the writer, not part of the scraped content
+# _aliases: ids of the near-duplicate postings merged into the document (see dedupe.py)
+META_FIELDS = ('_id', '_hash', '_scraped_at', '_updated_at', '_run_id', '_aliases', 'date')
+# ids of the current scheme are TopCV's job numbers: only the others can be stored under an earlier job_id()
+NOT_JOB_NUMBER = {'_id': {'$not': re.compile(r'^\d+$')}}
+# crawl state key set once migrate_job_ids has run, see the DAG's bootstrap task
+IDS_MIGRATED = 'job_ids_migrated'
+
+_clients = {}
+
+def get_mongo_client(uri):
+    """One pooled MongoClient per uri and process (MongoClient is not fork-safe, so never share across processes)"""
+    key = (uri, os.getpid())
+    if key not in _clients:
+        _clients[key] = pymongo.MongoClient(uri)
+    return _clients[key]
+
+
+def content_hash(doc):
+    return hashlib.sha256(json.dumps(doc, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+def upsert_op(record, now, run_id=None):
+    """
+    idempotent upsert keyed on _id, as an update pipeline so an unchanged record leaves the document untouched:
+    _scraped_at and date keep the first sighting, _updated_at moves only when the content hash changes
+    run_id: stamped as _run_id on the documents this run inserts or changes, so they can be counted from an index
+    """
+    doc = {k: v for k, v in record.items() if k not in META_FIELDS}
+    h = content_hash(doc)
+
+    fields = {k: {'$literal': v} for k, v in doc.items()}
+    fields['date'] = {'$ifNull': ['$date', {'$literal': record.get('date')}]}
+    fields['_scraped_at'] = {'$ifNull': ['$_scraped_at', now]}
+    fields['_updated_at'] = {'$cond': [{'$eq': ['$_hash', h]}, '$_updated_at', now]}
+    if run_id is not None:
+        fields['_run_id'] = {'$cond': [{'$eq': ['$_hash', h]}, '$_run_id', run_id]}
+    fields['_hash'] = h
+    return UpdateOne({'_id': record['_id']}, [{'$set': fields}], upsert=True)
+
+def backfill_ops(docs):
+    """
+    stored documents => UpdateOnes setting the normalized fields (see normalize.py) and the simhash (see dedupe.py)
+    where they are missing or differ
+    _hash is recomputed with the fields as the scrapers now emit them, so the next crawl finds the jobs unchanged,
+    _updated_at is left alone (the posting did not change)
+    """
+    ops = []
+    for doc, fields in zip(docs, normalize_batch(docs)):
+        fields['simhash'] = fingerprint(doc)
+        if all(name in doc and doc[name] == value for name, value in fields.items()):
+            continue
+        content = {k: v for k, v in doc.items() if k not in META_FIELDS}
+        content.update(fields)
+        if 'kind' in doc:
+            # flat documents (records.to_document) leave the empty ones out
+            content = {k: v for k, v in content.items() if k not in NUMERIC_FIELDS or v is not None}
+        ops.append(UpdateOne({'_id': doc['_id']}, {'$set': dict(fields, _hash=content_hash(content))}))
+    return ops
+
+def backfill_normalized(coll, batch_size=1000, everything=False):
+    """
+    add salary_min / salary_max / currency / exp_min_years and simhash to the documents stored before the scrapers
+    emitted them, one normalize_batch and one unordered bulk_write per batch_size documents
+    everything: also the documents that have them already (after a change of normalize.py or dedupe.py)
+    returns {'scanned', 'updated'}
+    """
+    query = {} if everything else {'$or': [{'currency': {'$exists': False}}, {'simhash': {'$exists': False}}]}
+    counts = {'scanned': 0, 'updated': 0}
+
+    def flush(batch):
+        counts['scanned'] += len(batch)
+        ops = backfill_ops(batch)
+        if ops:
+            counts['updated'] += coll.bulk_write(ops, ordered=False).modified_count
+
+    batch = []
+    for doc in coll.find(query, batch_size=batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return counts
+
+def migrate_job_ids(coll, batch_size=1000):
+    """
+    move the documents stored under an earlier job_id() (a short hash of the url) to the id job_id() gives their url now
+    _id cannot be updated, so the document is inserted again under the new _id and the old one deleted; when the new _id
+    is taken (the same posting stored under two urls) the old copy is only deleted. Safe to run again after a failure
+    only the ids that are not job numbers are read (the urls without one keep a hash id and are read every time)
+    returns {'moved', 'merged'}
+    """
+    stale = [(doc['_id'], job_id(doc['url'])) for doc in coll.find(NOT_JOB_NUMBER, {'url': 1}, batch_size=batch_size)
+             if doc.get('url') and job_id(doc['url']) != doc['_id']]
+    counts = {'moved': 0, 'merged': 0}
+    for i in range(0, len(stale), batch_size):
+        new_ids = dict(stale[i:i + batch_size])
+        taken = {doc['_id'] for doc in coll.find({'_id': {'$in': list(new_ids.values())}}, {'_id': 1})}
+        moved = []
+        for doc in coll.find({'_id': {'$in': list(new_ids)}}):
+            new_id = new_ids[doc['_id']]
+            if new_id in taken:
+                counts['merged'] += 1
+                continue
+            taken.add(new_id)
+            doc['_id'] = new_id
+            moved.append(doc)
+        if moved:
+            coll.insert_many(moved, ordered=False)
+            counts['moved'] += len(moved)
+        coll.delete_many({'_id': {'$in': list(new_ids)}})
+    return counts
+
+
+class CrawlState:
+    """
+    crawl watermarks (datetime of the last successful run) by key, one document per key in a Mongo collection
+    """
+
+    def __init__(self, coll):
+        self.coll = coll
+
+    def get(self, key):
+        doc = self.coll.find_one({'_id': key})
+        return doc['watermark'] if doc else None
+
+    def set(self, key, watermark):
+        self.coll.update_one({'_id': key}, {'$set': {'watermark': watermark}}, upsert=True)
+
+
+class FileCrawlState:
+    """
+    same as CrawlState in a local json file, for runs without Mongo
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def get(self, key):
+        value = self.load().get(key)
+        return datetime.fromisoformat(value) if value else None
+
+    def set(self, key, watermark):
+        state = self.load()
+        state[key] = watermark.isoformat()
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+
+
+class PageCache:
+    """
+    validators of the detail pages scraped at earlier runs, one document per canonical url in a Mongo collection:
+    {'_id': url, 'etag', 'last_modified', 'hash' (sha256 of the body), 'size' (bytes)}
+    """
+
+    def __init__(self, coll):
+        self.coll = coll
+
+    def load(self, urls):
+        # one query for the whole run instead of one per fetch
+        return {doc.pop('_id'): doc for doc in self.coll.find({'_id': {'$in': list(urls)}})}
+
+    def save(self, entries):
+        if not entries:
+            return
+        self.coll.bulk_write(
+            [UpdateOne({'_id': url}, {'$set': entry}, upsert=True) for url, entry in entries.items()],
+            ordered=False,
+        )
+
+
+class FilePageCache:
+    """
+    same as PageCache in a local json file, for runs without Mongo
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load_all(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self, urls):
+        cache = self.load_all()
+        return {url: cache[url] for url in urls if url in cache}
+
+    def save(self, entries):
+        if not entries:
+            return
+        cache = self.load_all()
+        cache.update(entries)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+
+
+class DeliveryLog:
+    """
+    job ids already notified, one document per (chat, job) in a Mongo collection:
+    {'_id': '<chat id>:<job id>', 'chat_id', 'job_id', 'message_id', 'sent_at'}
+    """
+
+    def __init__(self, coll):
+        self.coll = coll
+
+    def delivered(self, chat_id, job_ids):
+        keys = [f'{chat_id}:{job_id}' for job_id in job_ids]
+        return {doc['job_id'] for doc in self.coll.find({'_id': {'$in': keys}}, {'job_id': 1})}
+
+    def mark(self, chat_id, job_ids, message_id):
+        if not job_ids:
+            return
+        now = datetime.utcnow()
+        self.coll.bulk_write(
+            [UpdateOne({'_id': f'{chat_id}:{job_id}'},
+                       {'$set': {'chat_id': str(chat_id), 'job_id': job_id, 'message_id': message_id, 'sent_at': now}},
+                       upsert=True)
+             for job_id in job_ids],
+            ordered=False,
+        )
+
+
+class FileDeliveryLog:
+    """
+    same as DeliveryLog in a local json file, for runs without Mongo: {chat id: {job id: message id}}
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def delivered(self, chat_id, job_ids):
+        sent = self.load().get(str(chat_id), {})
+        return {job_id for job_id in job_ids if job_id in sent}
+
+    def mark(self, chat_id, job_ids, message_id):
+        if not job_ids:
+            return
+        log = self.load()
+        log.setdefault(str(chat_id), {}).update({job_id: message_id for job_id in job_ids})
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(log, f)
+
+
+class BulkJobWriter:
+    """
+    input: job records (dicts with _id)
+    output: counts of inserted / updated / unchanged / failed documents and of merged duplicates
+    flow: buffer records => flush as one unordered bulk_write of upserts when batch_size records
+          are buffered or flush_interval seconds passed since the last flush
+    merge(): a near duplicate (see dedupe.py) is not stored, its id is added to the _aliases of the original
+    metrics: Metrics timing each bulk_write as db_write, write errors counted by their code (see metrics.py)
+    """
+
+    def __init__(self, coll, batch_size=100, flush_interval=5.0, run_id=None, metrics=None):
+        self.coll = coll
+        self.run_id = run_id
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.aliases = []
+        self.last_flush = time.monotonic()
+        self.counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': 0, 'merged': 0}
+
+    def add(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def merge(self, original_id, duplicate_id):
+        self.aliases.append((original_id, duplicate_id))
+        self.counts['merged'] += 1
+        if len(self.aliases) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        self.flush_records()
+        # after the upserts: the original may be inserted by this same flush
+        self.flush_aliases()
+
+    def flush_aliases(self):
+        if not self.aliases:
+            return
+        ops = [UpdateOne({'_id': original_id}, {'$addToSet': {'_aliases': duplicate_id}}) for original_id, duplicate_id in self.aliases]
+        self.aliases = []
+        with self.metrics.timer('db_write'):
+            try:
+                self.coll.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                self.write_errors(e.details)
+
+    def flush_records(self):
+        if not self.buffer:
+            return
+
+        now = datetime.utcnow()
+        # the same posting twice in one batch would be two upserts racing on one _id, keep the last one
+        records = list({record['_id']: record for record in self.buffer}.values())
+        self.buffer = []
+
+        ops = [upsert_op(record, now, self.run_id) for record in records]
+        # the timer counts errors of their own (connection lost...), write errors are counted by code
+        with self.metrics.timer('db_write'):
+            try:
+                details = self.coll.bulk_write(ops, ordered=False).bulk_api_result
+            except BulkWriteError as e:
+                # unordered: every other operation of the batch was still applied
+                details = e.details
+                self.write_errors(details)
+        self.metrics.count('documents', len(ops), stage='db_write')
+
+        upserted = len(details.get('upserted', []))
+        self.counts['inserted'] += upserted
+        self.counts['updated'] += details.get('nModified', 0)
+        self.counts['unchanged'] += details.get('nMatched', 0) - details.get('nModified', 0)
+
+    def write_errors(self, details):
+        errors = details.get('writeErrors', [])
+        self.counts['failed'] += len(errors)
+        for error in errors:
+            self.metrics.error('db_write', f"write_error_{error.get('code')}")
+
+    def close(self):
+        self.flush()
+        return dict(self.counts)
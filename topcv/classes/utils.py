@@ -1,9 +1,29 @@
 import hashlib
 import base64
+import re
+
+# TopCV's own job number: /viec-lam/<slug>/1909066.html and /brand/<company>/tuyen-dung/<slug>-j1928082.html
+JOB_NUMBER = re.compile(r'(?:/|-j)(\d+)\.html$')
 
 def url_to_id_short(url, length=8):
     """Create a short ID from URL (customizable length)"""
     hash_bytes = hashlib.sha256(url.encode('utf-8')).digest()
     # Use base64 for shorter representation
     b64 = base64.urlsafe_b64encode(hash_bytes).decode('utf-8')
-    return b64[:length].rstrip('=')
\ No newline at end of file
+    return b64[:length].rstrip('=')
+
+def url_to_id(url):
+    """ID from the whole SHA-256 of the URL (43 characters), for URLs without a job number"""
+    return url_to_id_short(url, length=43)
+
+def job_number(url):
+    """TopCV job number in a posting url ('1909066'), None if the url has none"""
+    match = JOB_NUMBER.search(url.split('?')[0].split('#')[0])
+    return match.group(1) if match else None
+
+def job_id(url):
+    """
+    ID of the job posting at url, the _id of its document: TopCV's job number, so the /viec-lam/ and /brand/ urls
+    of one posting get the same ID, or the full hash of the url (query string ignored) when it has no job number
+    """
+    return job_number(url) or url_to_id(url.split('?')[0])